@@ -1,6 +1,10 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
+# Baked in by the app-bundle build stage; the apps fall back to data/ when it is
+# missing or older than the (possibly mounted) data files.
+export OFFSETS_APP_BUNDLE="${OFFSETS_APP_BUNDLE:-/app/apps/bundle}"
+
 Rscript -e "setwd('/app/apps/cmo-explorer'); shiny::runApp('.', host='0.0.0.0', port=3838, launch.browser = FALSE)" &
 Rscript -e "setwd('/app/apps/demi-regularities-explorer'); shiny::runApp('.', host='0.0.0.0', port=3839, launch.browser = FALSE)" &
 Rscript -e "setwd('/app/apps/proto-mechanism-explorer'); shiny::runApp('.', host='0.0.0.0', port=3840, launch.browser = FALSE)" &
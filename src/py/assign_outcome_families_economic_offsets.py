@@ -4,10 +4,16 @@ from pathlib import Path
 
 import yaml
 
+from cmo_store import cmo_yaml_paths
+from profiling import add_profile_arguments, get_profiler, profile_session
+from yaml_loader import load_yaml
+
 
 def _iter_cmos(cmo_yml_path):
-    with open(cmo_yml_path, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f) or {}
+    prof = get_profiler()
+    with prof.stage("load_cmo_yaml"):
+        data = load_yaml(cmo_yml_path) or {}
+        prof.rows(sum(len((doc or {}).get("cmos") or {}) for doc in data.values()))
 
     for _, doc in data.items():
         for cmo_id, cmo in (doc.get("cmos") or {}).items():
@@ -289,10 +295,12 @@ def _replace_assignment_block(mapping_text, cmo_id, replacement_block):
 def update_outcome_family_mapping(mapping_yml_path, cmo_yml_path):
     mapping_yml_path = Path(mapping_yml_path)
     cmo_yml_path = Path(cmo_yml_path)
+    prof = get_profiler()
 
-    with open(mapping_yml_path, "r", encoding="utf-8") as f:
-        mapping_text_before = f.read()
-    mapping_before = yaml.safe_load(mapping_text_before) or {}
+    with prof.stage("load_mapping"):
+        with open(mapping_yml_path, "r", encoding="utf-8") as f:
+            mapping_text_before = f.read()
+        mapping_before = yaml.safe_load(mapping_text_before) or {}
 
     families = mapping_before.get("families") or {}
     family_ids = set(families.keys())
@@ -307,26 +315,30 @@ def update_outcome_family_mapping(mapping_yml_path, cmo_yml_path):
         return {"added": 0, "already_assigned": True}
 
     new_assignments = {}
-    for cmo_id, outcome_text in missing:
-        family_id, _, confidence, notes = _pick_family(outcome_text, family_ids)
-        new_assignments[cmo_id] = _build_assignment(outcome_text, family_id, confidence, notes)
+    with prof.stage("score"):
+        for cmo_id, outcome_text in missing:
+            family_id, _, confidence, notes = _pick_family(outcome_text, family_ids)
+            new_assignments[cmo_id] = _build_assignment(outcome_text, family_id, confidence, notes)
+        prof.rows(len(missing))
 
     v_and_v_marker = "\nv_and_v_log:\n"
     if v_and_v_marker not in mapping_text_before:
         raise RuntimeError("Expected v_and_v_log to be present in the mapping YAML.")
 
-    fragment = _dump_yaml_fragment(new_assignments, indent_prefix="  ")
-    if not fragment.endswith("\n"):
-        fragment += "\n"
+    with prof.stage("dump_yaml"):
+        fragment = _dump_yaml_fragment(new_assignments, indent_prefix="  ")
+        if not fragment.endswith("\n"):
+            fragment += "\n"
 
     updated_text = mapping_text_before.replace(v_and_v_marker, "\n" + fragment + v_and_v_marker, 1)
 
-    mapping_after = yaml.safe_load(updated_text) or {}
+    with prof.stage("reload_mapping"):
+        mapping_after = yaml.safe_load(updated_text) or {}
     assignments_after = mapping_after.get("assignments") or {}
 
     # V&V computations (across all data/cmo/*.yml)
     all_cmo_ids = []
-    for path in sorted(Path("data/cmo").glob("*.yml")):
+    for path in cmo_yaml_paths(Path("data/cmo")):
         for cmo_id, _ in _iter_cmos(path):
             all_cmo_ids.append(cmo_id)
     all_cmo_ids_set = set(all_cmo_ids)
@@ -403,11 +415,12 @@ def update_outcome_family_mapping(mapping_yml_path, cmo_yml_path):
 
     updated_text = _replace_from_marker(updated_text, "v_and_v_log:\n", v_and_v_text)
 
-    # Final parse to ensure YAML remains valid after replacement
-    yaml.safe_load(updated_text)
+    with prof.stage("write"):
+        # Final parse to ensure YAML remains valid after replacement
+        yaml.safe_load(updated_text)
 
-    with open(mapping_yml_path, "w", encoding="utf-8") as f:
-        f.write(updated_text)
+        with open(mapping_yml_path, "w", encoding="utf-8") as f:
+            f.write(updated_text)
 
     return {"added": len(new_assignments), "already_assigned": False}
 
@@ -416,10 +429,12 @@ def reassign_other_unclear(mapping_yml_path, cmo_yml_path, locked_cmo_yml_path):
     mapping_yml_path = Path(mapping_yml_path)
     cmo_yml_path = Path(cmo_yml_path)
     locked_cmo_yml_path = Path(locked_cmo_yml_path)
+    prof = get_profiler()
 
-    with open(mapping_yml_path, "r", encoding="utf-8") as f:
-        mapping_text_before = f.read()
-    mapping_before = yaml.safe_load(mapping_text_before) or {}
+    with prof.stage("load_mapping"):
+        with open(mapping_yml_path, "r", encoding="utf-8") as f:
+            mapping_text_before = f.read()
+        mapping_before = yaml.safe_load(mapping_text_before) or {}
 
     families = mapping_before.get("families") or {}
     family_ids = set(families.keys())
@@ -438,24 +453,28 @@ def reassign_other_unclear(mapping_yml_path, cmo_yml_path, locked_cmo_yml_path):
 
     mapping_text = mapping_text_before
     updated = 0
-    for cmo_id in targets:
-        outcome_text = econ_outcomes.get(cmo_id, "")
-        family_id, _, confidence, notes = _pick_family(outcome_text, family_ids)
-        if family_id == "other_unclear":
-            continue
-        assignment = _build_assignment(outcome_text, family_id, confidence, notes)
-        block = _dump_yaml_fragment({cmo_id: assignment}, indent_prefix="  ")
-        if not block.endswith("\n"):
-            block += "\n"
-        mapping_text = _replace_assignment_block(mapping_text, cmo_id, block)
-        updated += 1
-
-    mapping_after = yaml.safe_load(mapping_text) or {}
+    with prof.stage("score"):
+        for cmo_id in targets:
+            outcome_text = econ_outcomes.get(cmo_id, "")
+            family_id, _, confidence, notes = _pick_family(outcome_text, family_ids)
+            if family_id == "other_unclear":
+                continue
+            assignment = _build_assignment(outcome_text, family_id, confidence, notes)
+            block = _dump_yaml_fragment({cmo_id: assignment}, indent_prefix="  ")
+            if not block.endswith("\n"):
+                block += "\n"
+            mapping_text = _replace_assignment_block(mapping_text, cmo_id, block)
+            updated += 1
+        prof.rows(len(targets))
+        prof.count("reassigned", updated)
+
+    with prof.stage("reload_mapping"):
+        mapping_after = yaml.safe_load(mapping_text) or {}
     assignments_after = mapping_after.get("assignments") or {}
 
     # V&V computations (across all data/cmo/*.yml)
     all_cmo_ids = []
-    for path in sorted(Path("data/cmo").glob("*.yml")):
+    for path in cmo_yaml_paths(Path("data/cmo")):
         for cmo_id, _ in _iter_cmos(path):
             all_cmo_ids.append(cmo_id)
     all_cmo_ids_set = set(all_cmo_ids)
@@ -531,9 +550,10 @@ def reassign_other_unclear(mapping_yml_path, cmo_yml_path, locked_cmo_yml_path):
 
     mapping_text = _replace_from_marker(mapping_text, "v_and_v_log:\n", v_and_v_text)
 
-    yaml.safe_load(mapping_text)
-    with open(mapping_yml_path, "w", encoding="utf-8") as f:
-        f.write(mapping_text)
+    with prof.stage("write"):
+        yaml.safe_load(mapping_text)
+        with open(mapping_yml_path, "w", encoding="utf-8") as f:
+            f.write(mapping_text)
 
     return {"updated": updated, "already_clean": False}
 
@@ -560,8 +580,14 @@ def main():
         default="data/cmo/arms_trade_offsets_chapters.yml",
         help="CMO YAML file whose assignments must remain unchanged",
     )
+    add_profile_arguments(parser)
     args = parser.parse_args()
 
+    with profile_session(args, "assign_outcome_families_economic_offsets"):
+        _run(args)
+
+
+def _run(args):
     if args.reassign_other_unclear:
         result = reassign_other_unclear(args.mapping, args.cmo, args.locked_cmo)
         if result.get("already_clean"):
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import inspect
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import yaml
+
+import assign_outcome_families_economic_offsets as classifier
+from cmo_store import cmo_yaml_paths
+from profiling import add_profile_arguments, get_profiler, peak_rss_mb, profile_session
+from yaml_loader import DEFAULT_CMO_DIR
+
+DEFAULT_MAPPING = Path("data/outcome_family_mapping.yml")
+DEFAULT_GOLDEN = Path("data/checks/outcome_family_golden.yml")
+DEFAULT_RESULTS = Path("data/cache/benchmarks/outcome_families.jsonl")
+GOLDEN_FIELDS = ("family_id", "confidence", "notes")
+# The functions whose source defines the classifier; their hash is recorded with
+# every result so runs are only compared like for like.
+CLASSIFIER_FUNCTIONS = ("_compile_rules", "_score_families", "_pick_family", "_build_assignment")
+
+
+@dataclass(frozen=True)
+class CorpusResult:
+    name: str
+    outcomes: int
+    seconds: float
+    outcomes_per_sec: float
+    peak_rss_mb: float | None
+    traced_peak_mb: float | None
+    sha256: str
+
+
+def classifier_sha256() -> str:
+    h = hashlib.sha256()
+    for name in CLASSIFIER_FUNCTIONS:
+        h.update(inspect.getsource(getattr(classifier, name)).encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_outcomes(cmo_dir: Path = DEFAULT_CMO_DIR) -> dict[str, str]:
+    outcomes: dict[str, str] = {}
+    for path in cmo_yaml_paths(cmo_dir):
+        outcomes.update(classifier._iter_cmos(path))
+    return dict(sorted(outcomes.items()))
+
+
+def load_family_ids(mapping: Path = DEFAULT_MAPPING) -> set[str]:
+    with open(mapping, "r", encoding="utf-8") as f:
+        return set(((yaml.safe_load(f) or {}).get("families") or {}).keys())
+
+
+def corpus_sha256(outcomes: dict[str, str], family_ids: set[str]) -> str:
+    payload = {"families": sorted(family_ids), "outcomes": outcomes}
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def synthetic_corpus(texts: list[str], size: int, seed: int = 0) -> list[str]:
+    # Up-samples the real outcomes; half are spliced with the opening words of
+    # another outcome so mixed-signal texts (and longer inputs) are exercised too.
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        text = rng.choice(texts)
+        if rng.random() < 0.5:
+            words = rng.choice(texts).split()
+            text = f"{text} {' '.join(words[: rng.randint(1, max(1, len(words)))])}"
+        corpus.append(text)
+    return corpus
+
+
+def classify(texts: list[str], family_ids: set[str]) -> list[tuple[str, str, str]]:
+    results = []
+    for text in texts:
+        family_id, _, confidence, notes = classifier._pick_family(text, family_ids)
+        assignment = classifier._build_assignment(text, family_id, confidence, notes)
+        results.append(tuple(assignment[f] for f in GOLDEN_FIELDS))
+    return results
+
+
+def results_sha256(results: list[tuple[str, str, str]]) -> str:
+    return hashlib.sha256(json.dumps(results, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def run_corpus(
+    name: str,
+    texts: list[str],
+    family_ids: set[str],
+    repeat: int = 1,
+    trace_memory: bool = False,
+) -> tuple[CorpusResult, list[tuple[str, str, str]]]:
+    # Best of --repeat untraced runs; tracemalloc slows allocation-heavy code
+    # several-fold, so the traced peak comes from a separate run.
+    best = float("inf")
+    results: list[tuple[str, str, str]] = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        results = classify(texts, family_ids)
+        best = min(best, time.perf_counter() - start)
+    traced = None
+    if trace_memory:
+        tracemalloc.start()
+        classify(texts, family_ids)
+        traced = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        tracemalloc.stop()
+    return (
+        CorpusResult(
+            name=name,
+            outcomes=len(texts),
+            seconds=round(best, 4),
+            outcomes_per_sec=round(len(texts) / best, 1) if best else 0.0,
+            peak_rss_mb=peak_rss_mb(),
+            traced_peak_mb=traced,
+            sha256=results_sha256(results),
+        ),
+        results,
+    )
+
+
+def diff_golden(golden: dict, replay: dict[str, dict], corpus_digest: str, synthetic: dict[str, str]) -> dict:
+    before = golden.get("assignments") or {}
+    changed = {
+        cmo_id: {"golden": before[cmo_id], "now": now}
+        for cmo_id, now in replay.items()
+        if cmo_id in before and before[cmo_id] != now
+    }
+    diff = {
+        "changed": changed,
+        "added": sorted(set(replay) - set(before)),
+        "removed": sorted(set(before) - set(replay)),
+        "synthetic_changed": [],
+    }
+    # Synthetic corpora derive from the replay corpus, so their digests are only
+    # comparable while it is unchanged.
+    if golden.get("corpus_sha256") == corpus_digest:
+        old = golden.get("synthetic_sha256") or {}
+        diff["synthetic_changed"] = sorted(k for k, v in synthetic.items() if k in old and old[k] != v)
+    return diff
+
+
+def _git_commit() -> str | None:
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.strip() or None
+
+
+def previous_record(results_path: Path, host: str, corpus_digest: str, seed: int) -> dict | None:
+    # Throughput is only comparable on the same machine and the same corpora.
+    if not results_path.exists():
+        return None
+    previous = None
+    for line in results_path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if (record.get("host"), record.get("corpus_sha256"), record.get("seed")) == (host, corpus_digest, seed):
+            previous = record
+    return previous
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Replay every CMO outcome (plus up-sampled synthetic corpora) through the outcome-family "
+            "classifier, diff against the golden snapshot and record throughput."
+        )
+    )
+    parser.add_argument("--cmo-dir", type=Path, default=DEFAULT_CMO_DIR)
+    parser.add_argument("--mapping", type=Path, default=DEFAULT_MAPPING, help="Source of the family ids.")
+    parser.add_argument("--golden", type=Path, default=DEFAULT_GOLDEN)
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS, help="JSONL file each run is appended to.")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=[100_000],
+        help="Synthetic corpus sizes (default 100000; none to replay only).",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per corpus; the fastest is kept.")
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Also report the tracemalloc peak per corpus (one extra, slower run each).",
+    )
+    parser.add_argument(
+        "--update-golden",
+        action="store_true",
+        help="Rewrite the golden snapshot from this run instead of diffing against it.",
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=None,
+        metavar="FRACTION",
+        help="Exit 1 if any corpus is this much slower than the last run on this host (e.g. 0.2).",
+    )
+    parser.add_argument("--show", type=int, default=10, help="Changed assignments to print.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profile_session(args, "bench_outcome_families"):
+        prof = get_profiler()
+        with prof.stage("load"):
+            outcomes = load_outcomes(args.cmo_dir)
+            family_ids = load_family_ids(args.mapping)
+            digest = corpus_sha256(outcomes, family_ids)
+            texts = list(outcomes.values())
+            prof.rows(len(outcomes))
+
+        corpora: list[CorpusResult] = []
+        with prof.stage("replay"):
+            result, replay_results = run_corpus("replay", texts, family_ids, args.repeat, args.trace_memory)
+            corpora.append(result)
+            prof.rows(len(texts))
+        replay = {cmo_id: dict(zip(GOLDEN_FIELDS, r)) for cmo_id, r in zip(outcomes, replay_results)}
+
+        synthetic: dict[str, str] = {}
+        for size in args.sizes:
+            with prof.stage(f"synthetic_{size}"):
+                corpus = synthetic_corpus(texts, size, args.seed)
+                result, _ = run_corpus(f"synthetic_{size}", corpus, family_ids, args.repeat, args.trace_memory)
+                del corpus
+                corpora.append(result)
+                synthetic[str(size)] = result.sha256
+                prof.rows(size)
+
+    host = platform.node()
+    previous = previous_record(args.results, host, digest, args.seed)
+    record = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "host": host,
+        "python": platform.python_version(),
+        "classifier_sha256": classifier_sha256(),
+        "corpus_sha256": digest,
+        "seed": args.seed,
+        "corpora": [asdict(c) for c in corpora],
+    }
+
+    failed = False
+    if args.update_golden or not args.golden.exists():
+        golden = {
+            "classifier_sha256": record["classifier_sha256"],
+            "corpus_sha256": digest,
+            "seed": args.seed,
+            "synthetic_sha256": synthetic,
+            "assignments": replay,
+        }
+        args.golden.parent.mkdir(parents=True, exist_ok=True)
+        args.golden.write_text(
+            yaml.safe_dump(golden, sort_keys=False, allow_unicode=True, width=120), encoding="utf-8"
+        )
+        record["golden"] = "written"
+        print(f"Wrote golden snapshot {args.golden.as_posix()} ({len(replay)} outcomes)")
+    else:
+        with open(args.golden, "r", encoding="utf-8") as f:
+            golden = yaml.safe_load(f) or {}
+        diff = diff_golden(golden, replay, digest, synthetic if golden.get("seed") == args.seed else {})
+        record["golden"] = {
+            "changed": len(diff["changed"]),
+            "added": len(diff["added"]),
+            "removed": len(diff["removed"]),
+            "synthetic_changed": diff["synthetic_changed"],
+        }
+        print(
+            f"Golden {args.golden.as_posix()}: {len(diff['changed'])} changed, "
+            f"{len(diff['added'])} new and {len(diff['removed'])} removed outcome(s)"
+            + (f"; synthetic corpora changed: {', '.join(diff['synthetic_changed'])}" if diff["synthetic_changed"] else "")
+        )
+        for cmo_id, change in list(diff["changed"].items())[: args.show]:
+            fields = [f for f in GOLDEN_FIELDS if change["golden"].get(f) != change["now"].get(f)]
+            print(
+                f"  {cmo_id}: "
+                + "; ".join(f"{f} {change['golden'].get(f)!r} -> {change['now'].get(f)!r}" for f in fields)
+            )
+        failed = bool(diff["changed"] or diff["synthetic_changed"])
+
+    print("corpus\toutcomes\tseconds\toutcomes_per_sec\tpeak_rss_mb\ttraced_peak_mb\tvs_previous")
+    previous_rates = {c["name"]: c["outcomes_per_sec"] for c in (previous or {}).get("corpora", [])}
+    for c in corpora:
+        change = ""
+        if previous_rates.get(c.name):
+            ratio = c.outcomes_per_sec / previous_rates[c.name] - 1
+            change = f"{ratio:+.1%}"
+            if args.max_slowdown is not None and ratio < -args.max_slowdown:
+                failed = True
+                change += " (slower than allowed)"
+        traced = "-" if c.traced_peak_mb is None else c.traced_peak_mb
+        print(
+            f"{c.name}\t{c.outcomes}\t{c.seconds:.3f}\t{c.outcomes_per_sec:.0f}\t"
+            f"{c.peak_rss_mb}\t{traced}\t{change or '-'}"
+        )
+
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"Appended results to {args.results.as_posix()}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
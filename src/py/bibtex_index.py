@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import pickle
+import re
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from profiling import get_profiler
+
+_INDEX_VERSION = 1
+_ENTRY_START_RE = re.compile(r"@\s*([A-Za-z]+)\s*([{(])")
+_FIELD_NAME_RE = re.compile(r"\s*([A-Za-z][\w:.+-]*)\s*=\s*")
+_BARE_VALUE_RE = re.compile(r"[^,#}\)\s]+")
+_SKIPPED_ENTRY_TYPES = {"comment", "preamble", "string"}
+
+
+@dataclass(frozen=True)
+class BibEntry:
+    entry_type: str
+    key: str
+    fields: dict[str, str]
+    files: tuple[str, ...] = ()
+
+
+@dataclass
+class BibIndex:
+    entries: dict[str, BibEntry] = field(default_factory=dict)
+    basename_to_key: dict[str, str] = field(default_factory=dict)
+    collisions: dict[str, list[str]] = field(default_factory=dict)
+
+    def get(self, key: str) -> BibEntry | None:
+        return self.entries.get(key)
+
+    def key_for_file(self, name: str) -> str | None:
+        return self.basename_to_key.get(os.path.basename(name))
+
+
+def _read_braced(text: str, start: int) -> tuple[str, int]:
+    # text[start] is "{"; returns the inner text and the index after the closing brace.
+    depth = 0
+    i = start
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start + 1 : i], i + 1
+        i += 1
+    raise ValueError(f"Unbalanced braces starting at offset {start}")
+
+
+def _read_quoted(text: str, start: int) -> tuple[str, int]:
+    # text[start] is '"'; braces inside the quotes may contain literal quotes.
+    depth = 0
+    i = start + 1
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+        elif ch == '"' and depth == 0:
+            return text[start + 1 : i], i + 1
+        i += 1
+    raise ValueError(f"Unterminated quoted value starting at offset {start}")
+
+
+def _read_value(text: str, pos: int) -> tuple[str, int]:
+    # A value is one or more braced/quoted/bare parts joined with "#".
+    parts: list[str] = []
+    n = len(text)
+    while True:
+        while pos < n and text[pos].isspace():
+            pos += 1
+        if pos >= n:
+            break
+        ch = text[pos]
+        if ch == "{":
+            part, pos = _read_braced(text, pos)
+        elif ch == '"':
+            part, pos = _read_quoted(text, pos)
+        else:
+            m = _BARE_VALUE_RE.match(text, pos)
+            if not m:
+                break
+            part, pos = m.group(0), m.end()
+        parts.append(part)
+        while pos < n and text[pos].isspace():
+            pos += 1
+        if pos < n and text[pos] == "#":
+            pos += 1
+            continue
+        break
+    return "".join(parts), pos
+
+
+def _normalize_value(value: str) -> str:
+    return re.sub(r"\s+", " ", value).strip()
+
+
+def _split_unescaped(value: str, sep: str) -> list[str]:
+    parts: list[str] = []
+    buf: list[str] = []
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch == "\\" and i + 1 < len(value):
+            buf.append(value[i : i + 2])
+            i += 2
+            continue
+        if ch == sep:
+            parts.append("".join(buf))
+            buf = []
+        else:
+            buf.append(ch)
+        i += 1
+    parts.append("".join(buf))
+    return parts
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+def parse_file_field(value: str) -> list[str]:
+    # Accepts plain paths ("/path/a.pdf"), ";"-separated lists and Zotero/JabRef
+    # "description:path:mimetype" triples with backslash-escaped ":" and ";".
+    paths: list[str] = []
+    for item in _split_unescaped(value, ";"):
+        item = item.strip()
+        if not item:
+            continue
+        pieces = _split_unescaped(item, ":")
+        if len(pieces) >= 3:
+            path = ":".join(pieces[1:-1])
+        elif len(pieces) == 2 and len(pieces[0]) == 1 and pieces[0].isalpha():
+            # Unescaped Windows drive letter, e.g. C:/papers/a.pdf
+            path = item
+        elif len(pieces) == 2:
+            path = pieces[1]
+        else:
+            path = pieces[0]
+        path = _unescape(path.strip())
+        if path:
+            paths.append(path)
+    return paths
+
+
+def parse_bibtex(text: str) -> list[BibEntry]:
+    entries: list[BibEntry] = []
+    pos = 0
+    n = len(text)
+    while True:
+        m = _ENTRY_START_RE.search(text, pos)
+        if not m:
+            break
+        entry_type = m.group(1).lower()
+        opener = m.group(2)
+        closer = "}" if opener == "{" else ")"
+        pos = m.end()
+
+        if entry_type in _SKIPPED_ENTRY_TYPES:
+            if opener == "{":
+                _, pos = _read_braced(text, m.end() - 1)
+            else:
+                end = text.find(")", pos)
+                pos = n if end < 0 else end + 1
+            continue
+
+        comma = text.find(",", pos)
+        if comma < 0:
+            break
+        key = text[pos:comma].strip()
+        pos = comma + 1
+
+        fields: dict[str, str] = {}
+        while pos < n:
+            while pos < n and (text[pos].isspace() or text[pos] == ","):
+                pos += 1
+            if pos >= n or text[pos] == closer:
+                pos += 1
+                break
+            fm = _FIELD_NAME_RE.match(text, pos)
+            if not fm:
+                # Malformed field; resync on the next entry.
+                break
+            name = fm.group(1).lower()
+            value, pos = _read_value(text, fm.end())
+            fields[name] = value if name == "file" else _normalize_value(value)
+
+        files = tuple(parse_file_field(fields["file"])) if "file" in fields else ()
+        entries.append(BibEntry(entry_type=entry_type, key=key, fields=fields, files=files))
+    return entries
+
+
+def build_bib_index(entries: list[BibEntry]) -> BibIndex:
+    index = BibIndex()
+    for entry in entries:
+        index.entries[entry.key] = entry
+        for path in entry.files:
+            basename = os.path.basename(path.replace("\\", "/"))
+            previous = index.basename_to_key.get(basename)
+            if previous and previous != entry.key:
+                index.collisions.setdefault(basename, [previous]).append(entry.key)
+                continue
+            index.basename_to_key[basename] = entry.key
+    return index
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def default_cache_path(bib_path: Path) -> Path:
+    return Path("data/cache") / f"{bib_path.name}.index.pickle"
+
+
+def _read_cache(cache_path: Path) -> dict | None:
+    try:
+        with open(cache_path, "rb") as f:
+            payload = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if not isinstance(payload, dict) or payload.get("version") != _INDEX_VERSION:
+        return None
+    return payload
+
+
+def _write_cache(cache_path: Path, payload: dict) -> None:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+
+def _index_to_payload(index: BibIndex) -> dict:
+    # Plain containers only, so the pickle does not depend on the importing module.
+    return {
+        "entries": [(e.entry_type, e.key, e.fields, e.files) for e in index.entries.values()],
+        "basename_to_key": index.basename_to_key,
+        "collisions": index.collisions,
+    }
+
+
+def _index_from_payload(data: dict) -> BibIndex:
+    entries = {
+        key: BibEntry(entry_type=entry_type, key=key, fields=fields, files=tuple(files))
+        for entry_type, key, fields, files in data["entries"]
+    }
+    return BibIndex(
+        entries=entries,
+        basename_to_key=data["basename_to_key"],
+        collisions=data["collisions"],
+    )
+
+
+def load_bib_index(bib_path: Path, cache_path: Path | None = None) -> BibIndex:
+    # The cache is trusted outright when mtime and size match; otherwise the file is
+    # re-hashed and only re-parsed when its content hash changed.
+    bib_path = Path(bib_path)
+    cache_path = Path(cache_path) if cache_path is not None else default_cache_path(bib_path)
+    stat = bib_path.stat()
+    prof = get_profiler()
+
+    payload = _read_cache(cache_path)
+    if payload is not None and payload.get("source") == str(bib_path.resolve()):
+        if payload["mtime_ns"] == stat.st_mtime_ns and payload["size"] == stat.st_size:
+            prof.cache(hits=1)
+            return _index_from_payload(payload["index"])
+        sha256 = _file_sha256(bib_path)
+        if payload["sha256"] == sha256:
+            payload.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            _write_cache(cache_path, payload)
+            prof.cache(hits=1)
+            return _index_from_payload(payload["index"])
+    else:
+        sha256 = _file_sha256(bib_path)
+
+    prof.cache(misses=1)
+    index = build_bib_index(parse_bibtex(bib_path.read_text(encoding="utf-8")))
+    prof.rows(len(index.entries))
+    _write_cache(
+        cache_path,
+        {
+            "version": _INDEX_VERSION,
+            "source": str(bib_path.resolve()),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256,
+            "index": _index_to_payload(index),
+        },
+    )
+    return index
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build or query the cached BibTeX index.")
+    parser.add_argument(
+        "--bib",
+        type=Path,
+        default=Path("docs/references/offsets.bib"),
+        help="BibTeX file to index (default: docs/references/offsets.bib).",
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=None,
+        help="Index cache path (default: data/cache/<bib name>.index.pickle).",
+    )
+    parser.add_argument(
+        "--lookup",
+        nargs="*",
+        default=[],
+        help="BibTeX keys or attachment file names to resolve.",
+    )
+    args = parser.parse_args()
+
+    index = load_bib_index(args.bib, args.cache)
+    print(
+        f"{len(index.entries)} entries, {len(index.basename_to_key)} attached files, "
+        f"{len(index.collisions)} basename collision(s)"
+    )
+    status = 0
+    for query in args.lookup:
+        entry = index.get(query)
+        key = entry.key if entry else index.key_for_file(query)
+        if key is None:
+            print(f"{query}\tNOT FOUND", file=sys.stderr)
+            status = 2
+            continue
+        title = index.entries[key].fields.get("title", "")
+        print(f"{query}\t{key}\t{title}")
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Iterable
+
+from cmo_store import cmo_yaml_paths
+from derived_data import load_families, replace_directory, source_md5s, split_values
+from profiling import add_profile_arguments, get_profiler, profile_session
+from proto_themes import DEFAULT_PROTO_THEMES, ProtoThemes, load_proto_themes
+
+DEFAULT_OUTPUT_DIR = Path("apps/bundle")
+DEFAULT_CMO_DIR = Path("data/cmo")
+DEFAULT_TABLE_CACHE = Path("data/cache/cmo_statements.parquet")
+DEFAULT_THEMES_DIR = Path("data/mechanism_themes")
+DEFAULT_FAMILIES = Path("data/outcome_family_mapping.yml")
+# Bump when a table's columns change; the apps ignore bundles of another version.
+BUNDLE_VERSION = 1
+
+# Semicolon-separated CMO fields the explorers filter and chart on.
+MULTI_VALUE_FIELDS = ("country", "programme", "research_question_mapped")
+
+
+def _as_str(value: Any) -> str | None:
+    if value is None or value != value:
+        return None
+    return str(value)
+
+
+def _str_list(value: Any) -> list[str]:
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value if v is not None]
+    return [str(value)]
+
+
+def _json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def demi_source_paths(themes_dir: Path) -> list[Path]:
+    return sorted(p for p in Path(themes_dir).glob("demi_regularities_*.yml") if p.is_file())
+
+
+def cmo_tables(df, themes: ProtoThemes, families: dict[str, str], assignments: dict[str, str]):
+    import pandas as pd
+
+    # One row per CMO: the statements table pre-joined with its proto theme and
+    # outcome family, so the CMO explorer needs no YAML at startup.
+    cmo = df.drop(columns=["source_file"], errors="ignore").copy()
+    for column in cmo.columns:
+        if isinstance(cmo[column].dtype, pd.CategoricalDtype):
+            cmo[column] = cmo[column].astype("string")
+    by_id = {m.id: m for m in themes.mechanisms[: themes.n_assigned]}
+    ids = cmo["chunk_id"].astype(str).tolist()
+    refs = [by_id.get(i) for i in ids]
+    theme_of = [themes.theme(r.theme_id) if r is not None else None for r in refs]
+    cmo["mechanism_theme_id"] = [r.theme_id if r is not None else None for r in refs]
+    cmo["mechanism_theme"] = [t.label if t is not None else None for t in theme_of]
+    cmo["mechanism_theme_explanation"] = [t.explanation if t is not None else None for t in theme_of]
+    cmo["mechanism_theme_rationale"] = [r.rationale if r is not None else None for r in refs]
+    cmo["outcome_family_id"] = [assignments.get(i) for i in ids]
+    cmo["outcome_family_label"] = [families.get(assignments.get(i, ""), None) for i in ids]
+    cmo = cmo.astype("string")
+
+    # Long lookup of the semicolon-separated fields: (chunk_id, field, value).
+    rows = []
+    for field in MULTI_VALUE_FIELDS:
+        if field not in df.columns:
+            continue
+        for chunk_id, raw in zip(ids, df[field].tolist()):
+            for value in dict.fromkeys(split_values(raw)):
+                rows.append((chunk_id, field, value))
+    values = pd.DataFrame(rows, columns=["chunk_id", "field", "value"]).astype("string")
+    return cmo, values
+
+
+def proto_tables(themes: ProtoThemes, research: dict[str, list[str]]):
+    import pandas as pd
+
+    theme_rows = []
+    mechanism_rows = []
+    for theme, members in themes.iter_members():
+        questions: set[str] = set()
+        for position, m in enumerate(members, start=1):
+            rqs = sorted(set(research.get(m.id, [])))
+            questions.update(rqs)
+            mechanism_rows.append((theme.theme_id, position, m.id, m.text, m.rationale, rqs))
+        theme_rows.append(
+            (theme.theme_id, theme.label, theme.explanation, theme.mechanism_count, sorted(questions))
+        )
+    theme_df = pd.DataFrame(
+        theme_rows,
+        columns=["theme_id", "theme_label", "mechanism_explanation", "mechanism_count", "research_questions"],
+    )
+    mechanism_df = pd.DataFrame(
+        mechanism_rows,
+        columns=["theme_id", "position", "id", "text", "rationale", "research_questions"],
+    )
+    return theme_df, mechanism_df
+
+
+def demi_tables(
+    paths: Iterable[Path],
+    families: dict[str, str],
+    assignments: dict[str, str],
+    research: dict[str, list[str]],
+):
+    import pandas as pd
+
+    from yaml_loader import load_yaml_files
+
+    theme_rows = []
+    demi_rows = []
+    for loaded in load_yaml_files(paths):
+        for theme in (loaded.data or {}).get("demi_regularities_by_theme") or []:
+            demi_list = theme.get("demi_regularities") or []
+            cmo_ids = _str_list(theme.get("cmo_ids_in_theme"))
+            missing = _str_list(theme.get("missing_cmo_ids"))
+            notes = _str_list(theme.get("theme_notes"))
+            quarto_note = _json(theme.get("suggested_quarto_note"))
+            theme_id = _as_str(theme.get("theme_id"))
+            label = _as_str(theme.get("theme_label"))
+            explanation = _as_str(theme.get("mechanism_explanation"))
+            theme_rows.append(
+                (
+                    theme_id,
+                    label,
+                    explanation,
+                    len(demi_list),
+                    len(cmo_ids),
+                    len(missing),
+                    cmo_ids,
+                    missing,
+                    notes,
+                    quarto_note,
+                )
+            )
+            for demi in demi_list:
+                supporting = _str_list(demi.get("supporting_cmo_ids"))
+                family_ids = list(dict.fromkeys(assignments[c] for c in supporting if c in assignments))
+                questions = list(dict.fromkeys(q for c in supporting for q in research.get(c, [])))
+                anchor_quotes = demi.get("anchor_quotes") or []
+                moderators = demi.get("moderators") or []
+                boundary = demi.get("boundary_conditions") or []
+                counterexamples = demi.get("counterexamples") or []
+                demi_rows.append(
+                    (
+                        theme_id,
+                        label,
+                        explanation,
+                        _as_str(demi.get("demi_regularity_id")),
+                        _as_str(demi.get("statement")),
+                        _str_list(demi.get("context_conditions")),
+                        _str_list(demi.get("outcome_tendencies")),
+                        supporting,
+                        _json(anchor_quotes),
+                        _json(moderators),
+                        _json(boundary),
+                        _json(counterexamples),
+                        _as_str(demi.get("confidence")),
+                        _as_str(demi.get("confidence_justification")),
+                        len(supporting),
+                        len(anchor_quotes),
+                        len(moderators),
+                        len(boundary),
+                        len(counterexamples),
+                        family_ids,
+                        list(dict.fromkeys(families[f] for f in family_ids if f in families)),
+                        questions,
+                    )
+                )
+    theme_df = pd.DataFrame(
+        theme_rows,
+        columns=[
+            "theme_id",
+            "theme_label",
+            "mechanism_explanation",
+            "demi_count",
+            "cmo_count",
+            "missing_cmo_count",
+            "cmo_ids_in_theme",
+            "missing_cmo_ids",
+            "theme_notes",
+            "suggested_quarto_note_json",
+        ],
+    )
+    demi_df = pd.DataFrame(
+        demi_rows,
+        columns=[
+            "theme_id",
+            "theme_label",
+            "mechanism_explanation",
+            "demi_regularity_id",
+            "statement",
+            "context_conditions",
+            "outcome_tendencies",
+            "supporting_cmo_ids",
+            "anchor_quotes_json",
+            "moderators_json",
+            "boundary_conditions_json",
+            "counterexamples_json",
+            "confidence",
+            "confidence_justification",
+            "supporting_cmo_count",
+            "anchor_quote_count",
+            "moderator_count",
+            "boundary_count",
+            "counterexample_count",
+            "outcome_family_ids",
+            "outcome_family_labels",
+            "research_questions",
+        ],
+    )
+    return theme_df, demi_df
+
+
+def _write_parquet(df, path: Path) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Explicit list<string> so all-empty list columns do not become list<null>.
+    fields = []
+    for column in df.columns:
+        sample = next((v for v in df[column] if v is not None), None)
+        if isinstance(sample, list):
+            fields.append(pa.field(column, pa.list_(pa.string())))
+        elif df[column].dtype.kind in "iu":
+            fields.append(pa.field(column, pa.int32()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    table = pa.Table.from_pandas(df, schema=pa.schema(fields), preserve_index=False)
+    pq.write_table(table, path, compression="zstd")
+    return path.stat().st_size
+
+
+def build_bundle(
+    output_dir: Path = DEFAULT_OUTPUT_DIR,
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    table_cache: Path = DEFAULT_TABLE_CACHE,
+    proto_themes: Path = DEFAULT_PROTO_THEMES,
+    themes_dir: Path = DEFAULT_THEMES_DIR,
+    families_path: Path = DEFAULT_FAMILIES,
+) -> dict:
+    from cmo_table import load_cmo_statements
+
+    prof = get_profiler()
+    with prof.stage("load"):
+        df = load_cmo_statements(cmo_dir, table_cache)
+        themes = load_proto_themes(proto_themes)
+        families, assignments = load_families(families_path)
+        demi_paths = demi_source_paths(themes_dir)
+        prof.rows(len(df))
+
+    with prof.stage("join"):
+        cmo, values = cmo_tables(df, themes, families, assignments)
+        rq = values[values["field"] == "research_question_mapped"]
+        research: dict[str, list[str]] = {}
+        for chunk_id, value in zip(rq["chunk_id"].tolist(), rq["value"].tolist()):
+            research.setdefault(chunk_id, []).append(value)
+        proto_df, mechanisms_df = proto_tables(themes, research)
+        demi_themes_df, demi_df = demi_tables(demi_paths, families, assignments, research)
+        import pandas as pd
+
+        families_df = pd.DataFrame(list(families.items()), columns=["family_id", "family_label"])
+        tables = {
+            "cmo": cmo,
+            "cmo_values": values,
+            "proto_themes": proto_df,
+            "proto_mechanisms": mechanisms_df,
+            "demi_regularities": demi_df,
+            "demi_themes": demi_themes_df,
+            "outcome_families": families_df,
+        }
+        prof.rows(sum(len(t) for t in tables.values()))
+
+    sources = [*cmo_yaml_paths(cmo_dir), Path(proto_themes), Path(families_path), *demi_paths]
+    # Written to a sibling temp dir and swapped in, so a running app never sees a
+    # half-written bundle.
+    with replace_directory(Path(output_dir)) as tmp:
+        with prof.stage("write"):
+            files = {}
+            for name, table in tables.items():
+                size = _write_parquet(table, tmp / f"{name}.parquet")
+                files[name] = {"file": f"{name}.parquet", "rows": len(table), "bytes": size}
+            manifest = {
+                "version": BUNDLE_VERSION,
+                "built": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "tables": files,
+                # Repo-relative source paths -> md5; the apps fall back to the raw
+                # files when any of these changed after the bundle was built.
+                "sources": source_md5s(sources),
+            }
+            (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+            prof.rows(len(files))
+    return manifest
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Pre-join CMOs, proto themes, outcome families and demi-regularities into the "
+            "Parquet bundle the Shiny explorers load at startup."
+        )
+    )
+    parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--cmo-dir", type=Path, default=DEFAULT_CMO_DIR)
+    parser.add_argument("--table-cache", type=Path, default=DEFAULT_TABLE_CACHE)
+    parser.add_argument("--proto-themes", type=Path, default=DEFAULT_PROTO_THEMES)
+    parser.add_argument("--themes-dir", type=Path, default=DEFAULT_THEMES_DIR)
+    parser.add_argument("--families", type=Path, default=DEFAULT_FAMILIES)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profile_session(args, "build_app_bundles"):
+        manifest = build_bundle(
+            output_dir=args.output_dir,
+            cmo_dir=args.cmo_dir,
+            table_cache=args.table_cache,
+            proto_themes=args.proto_themes,
+            themes_dir=args.themes_dir,
+            families_path=args.families,
+        )
+
+    for name, info in manifest["tables"].items():
+        print(f"{name}: {info['rows']} rows, {info['bytes'] / 1024:.1f} KB")
+    print(f"Wrote {args.output_dir.as_posix()} ({len(manifest['sources'])} source files)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import csv
+import math
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import yaml
+
+from proto_themes import load_proto_themes
+
+TokenCounter = Callable[[str], int]
+
+
+@dataclass(frozen=True)
+class MechanismBlock:
+    chunk_id: str
+    text: str
+    tokens: int
+
+
+@dataclass(frozen=True)
+class Batch:
+    batch_id: str
+    blocks: tuple[MechanismBlock, ...]
+
+    @property
+    def tokens(self) -> int:
+        return sum(b.tokens for b in self.blocks)
+
+    def render(self) -> str:
+        return "\n".join(b.text for b in self.blocks)
+
+
+def _approx_tokens(text: str) -> int:
+    # ~4 characters per token for English prose with BPE tokenizers.
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _word_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text.split()) * 1.3))
+
+
+def get_token_counter(name: str, encoding: str = "cl100k_base") -> TokenCounter:
+    if name == "approx":
+        return _approx_tokens
+    if name == "words":
+        return _word_tokens
+    if name == "tiktoken":
+        try:
+            import tiktoken
+        except ImportError as exc:
+            raise SystemExit("--tokenizer tiktoken requires: pip install tiktoken") from exc
+        enc = tiktoken.get_encoding(encoding)
+        return lambda text: len(enc.encode(text))
+    raise ValueError(f"Unknown tokenizer: {name!r}")
+
+
+def format_block(chunk_id: str, mechanism_statement: str) -> str:
+    # Same block shape as src/r/get_mechanism_batch.R.
+    return f"chunk_id: {chunk_id}\nmechanism_statement: {mechanism_statement}\n---"
+
+
+def load_mechanisms(
+    input_csv: Path | None,
+    exclude_ids: set[str] | None = None,
+    cmo_dir: Path = Path("data/cmo"),
+    table_cache: Path = Path("data/cache/cmo_statements.parquet"),
+) -> list[tuple[str, str]]:
+    exclude_ids = exclude_ids or set()
+    if input_csv is None:
+        # pandas/pyarrow are only needed for the Parquet table, not for --input CSV.
+        from cmo_table import load_cmo_statements
+
+        df = load_cmo_statements(cmo_dir, table_cache)
+        df = df[df["mechanism_statement"].notna()]
+        return [
+            (str(chunk_id), str(statement))
+            for chunk_id, statement in zip(df["chunk_id"], df["mechanism_statement"])
+            if chunk_id not in exclude_ids
+        ]
+
+    rows: list[tuple[str, str]] = []
+    with open(input_csv, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = {"chunk_id", "mechanism_statement"} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(sorted(missing))}")
+        for row in reader:
+            chunk_id = (row.get("chunk_id") or "").strip()
+            statement = (row.get("mechanism_statement") or "").strip()
+            if not chunk_id or not statement or chunk_id in exclude_ids:
+                continue
+            rows.append((chunk_id, statement))
+    return rows
+
+
+def assigned_mechanism_ids(proto_themes_yml: Path) -> set[str]:
+    return load_proto_themes(proto_themes_yml).mechanism_ids()
+
+
+def _greedy_chain(n: int, similarity: Callable[[int, int], float]) -> list[int]:
+    # Nearest-neighbour walk: each next statement is the most similar unvisited one,
+    # so consecutive (and hence co-batched) statements are semantically close.
+    if n == 0:
+        return []
+    order = [0]
+    remaining = set(range(1, n))
+    while remaining:
+        last = order[-1]
+        nxt = max(remaining, key=lambda j: (similarity(last, j), -j))
+        order.append(nxt)
+        remaining.remove(nxt)
+    return order
+
+
+def semantic_order(
+    rows: list[tuple[str, str]],
+    method: str,
+    model_name: str = "all-MiniLM-L6-v2",
+    cache_path: str = "data/embeddings_cache.sqlite",
+) -> list[tuple[str, str]]:
+    if method == "none" or len(rows) < 3:
+        return rows
+
+    if method == "embedding":
+        from embed_mechanisms import embed_texts
+
+        embeddings = embed_texts(
+            texts=[text for _, text in rows],
+            model_name=model_name,
+            normalize=True,
+            cache_path=cache_path,
+        )
+        sims = embeddings @ embeddings.T
+        order = _greedy_chain(len(rows), lambda i, j: float(sims[i, j]))
+    else:
+        from triage_theme_pairs import build_tfidf_vectors, cosine
+
+        vectors, _ = build_tfidf_vectors({i: text for i, (_, text) in enumerate(rows)})
+        order = _greedy_chain(len(rows), lambda i, j: cosine(vectors[i], vectors[j]))
+    return [rows[i] for i in order]
+
+
+def pack_batches(
+    rows: list[tuple[str, str]],
+    max_tokens: int,
+    count_tokens: TokenCounter,
+    max_items: int | None = None,
+) -> list[Batch]:
+    batches: list[Batch] = []
+    current: list[MechanismBlock] = []
+    used = 0
+
+    def flush() -> None:
+        nonlocal current, used
+        if current:
+            batches.append(Batch(batch_id=f"batch_{len(batches) + 1:03d}", blocks=tuple(current)))
+        current, used = [], 0
+
+    for chunk_id, statement in rows:
+        text = format_block(chunk_id, statement)
+        # +1 for the newline joining blocks.
+        block = MechanismBlock(chunk_id=chunk_id, text=text, tokens=count_tokens(text) + 1)
+        full = max_items is not None and len(current) >= max_items
+        if current and (used + block.tokens > max_tokens or full):
+            flush()
+        if block.tokens > max_tokens:
+            print(
+                f"Warning: {chunk_id} alone needs {block.tokens} tokens (> {max_tokens}); "
+                "emitting it as its own batch.",
+                file=sys.stderr,
+            )
+        current.append(block)
+        used += block.tokens
+    flush()
+    return batches
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Pack mechanism statements into token-budgeted batches for the theming prompts."
+    )
+    parser.add_argument(
+        "--input",
+        type=Path,
+        default=None,
+        help="Optional cmo_statements.csv (default: Parquet table built by cmo_table.py).",
+    )
+    parser.add_argument("--cmo-dir", type=Path, default=Path("data/cmo"))
+    parser.add_argument(
+        "--table-cache", type=Path, default=Path("data/cache/cmo_statements.parquet")
+    )
+    parser.add_argument(
+        "--outdir",
+        type=Path,
+        default=Path("data/mechanism_themes/batches"),
+        help="Directory for batch_NNN_input.txt files and manifest.yml.",
+    )
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        default=3000,
+        help="Token budget per batch for the mechanism blocks (default 3000).",
+    )
+    parser.add_argument(
+        "--max-items",
+        type=int,
+        default=None,
+        help="Optional cap on statements per batch.",
+    )
+    parser.add_argument(
+        "--tokenizer",
+        choices=["approx", "words", "tiktoken"],
+        default="approx",
+        help="Token counter (default approx: ~4 chars/token).",
+    )
+    parser.add_argument(
+        "--encoding",
+        default="cl100k_base",
+        help="tiktoken encoding name for --tokenizer tiktoken.",
+    )
+    parser.add_argument(
+        "--group",
+        choices=["none", "tfidf", "embedding"],
+        default="none",
+        help="Order statements so semantically close ones share a batch (default none).",
+    )
+    parser.add_argument(
+        "--exclude-assigned",
+        type=Path,
+        default=None,
+        help="proto_themes.yml whose already-assigned mechanism ids are skipped.",
+    )
+    parser.add_argument(
+        "--dedupe",
+        type=Path,
+        default=None,
+        help="near_duplicates.yml; only each cluster's representative statement is batched.",
+    )
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--cache", default="data/embeddings_cache.sqlite")
+    args = parser.parse_args()
+
+    exclude = assigned_mechanism_ids(args.exclude_assigned) if args.exclude_assigned else set()
+    duplicates = set()
+    if args.dedupe:
+        from near_duplicates import non_representative_ids
+
+        duplicates = non_representative_ids(args.dedupe)
+    rows = load_mechanisms(
+        args.input,
+        exclude_ids=exclude | duplicates,
+        cmo_dir=args.cmo_dir,
+        table_cache=args.table_cache,
+    )
+    rows = semantic_order(rows, args.group, model_name=args.model, cache_path=args.cache)
+    batches = pack_batches(
+        rows,
+        max_tokens=args.max_tokens,
+        count_tokens=get_token_counter(args.tokenizer, args.encoding),
+        max_items=args.max_items,
+    )
+
+    args.outdir.mkdir(parents=True, exist_ok=True)
+    manifest_batches = []
+    for batch in batches:
+        out_path = args.outdir / f"{batch.batch_id}_input.txt"
+        out_path.write_text(batch.render(), encoding="utf-8")
+        manifest_batches.append(
+            {
+                "batch_id": batch.batch_id,
+                "path": out_path.as_posix(),
+                "n_statements": len(batch.blocks),
+                "tokens": batch.tokens,
+                "chunk_ids": [b.chunk_id for b in batch.blocks],
+            }
+        )
+
+    manifest = {
+        "settings": {
+            "input": (args.input or args.table_cache).as_posix(),
+            "max_tokens": args.max_tokens,
+            "max_items": args.max_items,
+            "tokenizer": args.tokenizer,
+            "group": args.group,
+            "excluded_assigned": len(exclude),
+            "excluded_duplicates": len(duplicates - exclude),
+        },
+        "batches": manifest_batches,
+    }
+    manifest_path = args.outdir / "manifest.yml"
+    manifest_path.write_text(
+        yaml.safe_dump(manifest, sort_keys=False, allow_unicode=True, width=120),
+        encoding="utf-8",
+    )
+
+    total_tokens = sum(b.tokens for b in batches)
+    print(
+        f"Packed {len(rows)} statement(s) into {len(batches)} batch(es) "
+        f"in {args.outdir.as_posix()} (mean fill {total_tokens / max(1, len(batches)):.0f}"
+        f"/{args.max_tokens} tokens)"
+    )
+    print(f"Manifest: {manifest_path.as_posix()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
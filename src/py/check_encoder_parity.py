@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from encoders import BACKENDS, DEFAULT_ONNX_DIR, get_encoder, onnx_model_dir
+from profiling import add_profile_arguments, get_profiler, profile_session
+
+
+def sample_texts(
+    cmo_dir: Path,
+    table_cache: Path,
+    proto_themes: Path,
+    sample: int,
+    seed: int = 0,
+) -> list[str]:
+    from embedding_cache import referenced_texts
+
+    texts = sorted(referenced_texts(cmo_dir, table_cache, proto_themes))
+    if 0 < sample < len(texts):
+        texts = random.Random(seed).sample(texts, sample)
+    return texts
+
+
+def row_cosines(a, b):
+    import numpy as np
+
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    denom = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    denom[denom == 0] = 1.0
+    return (a * b).sum(axis=1) / denom
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Encode pipeline texts with two encoder backends (bypassing the cache) and fail when "
+            "any vector's cosine to the reference drops below --threshold."
+        )
+    )
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--reference", choices=BACKENDS, default="torch")
+    parser.add_argument("--candidate", choices=BACKENDS, default="onnx-int8")
+    parser.add_argument("--onnx-dir", type=Path, default=DEFAULT_ONNX_DIR)
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="Export the ONNX model first if --onnx-dir has none for --model.",
+    )
+    parser.add_argument("--cmo-dir", type=Path, default=Path("data/cmo"))
+    parser.add_argument("--table-cache", type=Path, default=Path("data/cache/cmo_statements.parquet"))
+    parser.add_argument(
+        "--proto-themes", type=Path, default=Path("data/mechanism_themes/proto_themes.yml")
+    )
+    parser.add_argument(
+        "--sample", type=int, default=500, help="Texts to compare, drawn with --seed (0 = all; default 500)."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threshold", type=float, default=0.99, help="Minimum per-text cosine (default 0.99).")
+    parser.add_argument("--worst", type=int, default=5, help="Lowest-cosine texts to print.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profile_session(args, "check_encoder_parity"):
+        prof = get_profiler()
+        if args.export and not (onnx_model_dir(args.model, args.onnx_dir) / "encoder.json").exists():
+            from encoders import export_onnx
+
+            with prof.stage("export"):
+                export_onnx(args.model, args.onnx_dir)
+        with prof.stage("load_texts"):
+            texts = sample_texts(args.cmo_dir, args.table_cache, args.proto_themes, args.sample, args.seed)
+            prof.rows(len(texts))
+        if not texts:
+            print("No texts to compare.", file=sys.stderr)
+            return 2
+
+        vectors = {}
+        seconds = {}
+        for backend in (args.reference, args.candidate):
+            with prof.stage(f"load_{backend}"):
+                encoder = get_encoder(backend, args.model, onnx_dir=args.onnx_dir)
+            with prof.stage(f"encode_{backend}"):
+                start = time.perf_counter()
+                vectors[backend] = encoder.encode(texts, batch_size=args.batch_size)
+                seconds[backend] = time.perf_counter() - start
+                prof.rows(len(texts))
+        cosines = row_cosines(vectors[args.reference], vectors[args.candidate])
+
+    below = int((cosines < args.threshold).sum())
+    print(f"{len(texts)} text(s), {args.model}: {args.candidate} vs {args.reference}")
+    print(
+        f"cosine min {cosines.min():.4f}, p01 {sorted(cosines)[len(cosines) // 100]:.4f}, "
+        f"mean {cosines.mean():.4f}; {below} below {args.threshold}"
+    )
+    for backend in (args.reference, args.candidate):
+        print(f"{backend}\t{seconds[backend]:.2f} s\t{len(texts) / max(seconds[backend], 1e-9):.0f} texts/s")
+    for i in cosines.argsort()[: args.worst]:
+        print(f"{cosines[i]:.4f}\t{texts[i][:100]}")
+    return 1 if below else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
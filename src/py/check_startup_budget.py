@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers", "onnxruntime")
+
+
+@dataclass(frozen=True)
+class Budget:
+    max_ms: float
+    forbidden: tuple[str, ...] = HEAVY_MODULES
+
+
+# Module import cost of each CLI entry point on its cache-hit / lexical-only path.
+# Embedding and Parquet stacks are imported lazily inside the functions that need them.
+BUDGETS: dict[str, Budget] = {
+    "triage_theme_pairs": Budget(150, HEAVY_MODULES + ("numpy", "embed_mechanisms")),
+    "embed_mechanisms": Budget(400, HEAVY_MODULES + ("pandas", "pyarrow")),
+    "embedding_cache": Budget(400, HEAVY_MODULES + ("pandas", "pyarrow")),
+    "preassign_mechanisms": Budget(400, HEAVY_MODULES + ("pandas", "pyarrow")),
+    "encoders": Budget(300, HEAVY_MODULES + ("pandas", "pyarrow")),
+    "check_encoder_parity": Budget(300, HEAVY_MODULES + ("pandas", "pyarrow")),
+    "build_mechanism_batches": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "generate_proto_theme_allocation_audit_inputs": Budget(150, HEAVY_MODULES + ("numpy",)),
+    "merge_audit_output": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "generate_cmo_pdf_bibtex_key_map": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "assign_outcome_families_economic_offsets": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "bench_outcome_families": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "id_index": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "search_index": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "near_duplicates": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "topic_model_cache": Budget(100, HEAVY_MODULES + ("numpy", "pandas")),
+    "pdf_text": Budget(150, HEAVY_MODULES + ("numpy", "pandas", "pypdf")),
+    "verify_quotes": Budget(150, HEAVY_MODULES + ("numpy", "pandas", "pypdf")),
+    "build_app_bundles": Budget(150, HEAVY_MODULES + ("numpy", "pandas", "pyarrow")),
+    "incidence": Budget(150, HEAVY_MODULES + ("numpy", "pandas", "scipy")),
+    "derived_data": Budget(100, HEAVY_MODULES + ("numpy", "pandas", "yaml_loader")),
+    "proto_themes": Budget(100, HEAVY_MODULES + ("numpy", "pandas", "yaml_loader")),
+    "cmo_store": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "yaml_loader": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "bibtex_index": Budget(100, HEAVY_MODULES + ("numpy", "pandas")),
+    "pipeline": Budget(150, HEAVY_MODULES + ("numpy", "pandas")),
+    "llm_runner": Budget(1500),
+    "cmo_table": Budget(1500),
+}
+
+
+@dataclass(frozen=True)
+class Scenario:
+    module: str
+    args: tuple[str, ...]
+    forbidden: tuple[str, ...] = HEAVY_MODULES
+
+
+# Whole-run paths that must stay light: each runs the entry point in a temp dir against
+# the fixtures from _write_fixtures(), with every text already in the embedding cache.
+SCENARIOS: dict[str, Scenario] = {
+    "embed_mechanisms:warm_cache": Scenario(
+        "embed_mechanisms",
+        ("--input", "statements.csv", "--cache", "cache.sqlite", "--output", "embeddings.csv"),
+    ),
+    "embed_mechanisms:warm_cache_fields": Scenario(
+        "embed_mechanisms",
+        (
+            "--input", "statements.csv", "--cache", "cache.sqlite", "--output-dir", "embeddings",
+            "--fields", "context_statement", "mechanism_statement", "outcome_statement",
+        ),
+    ),
+    "preassign_mechanisms:warm_cache": Scenario(
+        "preassign_mechanisms",
+        (
+            "--proto-themes", "proto_themes.yml", "--input", "statements.csv", "--cache", "cache.sqlite",
+            "--output", "preassignments.yml", "--residual", "residual.csv",
+        ),
+    ),
+    "triage_theme_pairs:tfidf": Scenario(
+        "triage_theme_pairs",
+        ("--pairs", "theme_pairs.csv", "--proto-themes", "proto_themes.yml", "--output", "triage.yml"),
+        HEAVY_MODULES + ("numpy", "embed_mechanisms"),
+    ),
+    "generate_proto_theme_allocation_audit_inputs:trim_tfidf": Scenario(
+        "generate_proto_theme_allocation_audit_inputs",
+        (
+            "--proto-themes", "proto_themes.yml", "--changelog", "changelog.yml", "--prompt", "prompt.md",
+            "--outdir", "audit", "--index", "audit/index.tsv", "--min-mechanisms", "1",
+            "--trim-context", "--neighbors", "1",
+        ),
+        HEAVY_MODULES + ("numpy", "embed_mechanisms"),
+    ),
+}
+
+_FIXTURE_MODEL = "all-MiniLM-L6-v2"
+
+
+@dataclass(frozen=True)
+class ImportProfile:
+    total_ms: float
+    modules: dict[str, float]  # top-level import -> cumulative ms
+
+
+def _parse_importtime(stderr: str) -> dict[str, float]:
+    # Lines look like "import time:  self [us] | cumulative | imported package";
+    # nested imports are indented in the last column.
+    modules: dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:") :].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        if name.startswith("  "):
+            continue
+        modules[name.strip()] = int(parts[1]) / 1000.0
+    return modules
+
+
+def _all_imported(stderr: str) -> set[str]:
+    names = set()
+    for line in stderr.splitlines():
+        if line.startswith("import time:"):
+            names.add(line.rsplit("|", 1)[-1].strip())
+    return names
+
+
+def _write_fixtures(root: Path) -> None:
+    # Imported here: the checker itself should not pay for numpy unless paths are run.
+    import sqlite3
+
+    import numpy as np
+    import yaml
+
+    from embed_mechanisms import _save_cached, ensure_cache_schema
+
+    themes = []
+    statements = []
+    for t in range(3):
+        mechanisms = [
+            {
+                "id": f"doc_pdf__cmo_{t}{m}",
+                "text": f"Offset obligation {t} drives supplier behaviour through channel {m}.",
+                "rationale": "Fixture.",
+            }
+            for m in range(2)
+        ]
+        themes.append(
+            {
+                "theme_id": f"PM{t + 1}",
+                "theme_label": f"Fixture theme {t + 1}",
+                "mechanism_explanation": f"Supplier incentives of kind {t} shape offset delivery.",
+                "mechanisms": mechanisms,
+            }
+        )
+        statements.append(
+            (f"new_pdf__cmo_{t}", "new.pdf", f"Context {t}.", f"New statement {t} about offset channels.", f"Outcome {t}.")
+        )
+    proto = {"proto_mechanism_themes": themes, "ambiguous_mechanisms": []}
+    (root / "proto_themes.yml").write_text(yaml.safe_dump(proto, sort_keys=False), encoding="utf-8")
+    (root / "changelog.yml").write_text(yaml.safe_dump({"change_log": []}), encoding="utf-8")
+    (root / "prompt.md").write_text("Audit the target theme.\n", encoding="utf-8")
+    (root / "theme_pairs.csv").write_text(
+        "pair_id,theme_a_id,theme_b_id\nP1,PM1,PM2\nP2,PM1,PM3\nP3,PM2,PM3\n", encoding="utf-8"
+    )
+    with open(root / "statements.csv", "w", encoding="utf-8", newline="") as f:
+        import csv
+
+        writer = csv.writer(f)
+        writer.writerow(["chunk_id", "file_id", "context_statement", "mechanism_statement", "outcome_statement"])
+        writer.writerows(statements)
+
+    texts = {m["text"] for t in themes for m in t["mechanisms"]}
+    texts.update(text for row in statements for text in row[2:])
+    texts.update(f"{t['theme_label']} {t['mechanism_explanation']}" for t in themes)
+    rng = np.random.default_rng(0)
+    conn = sqlite3.connect(root / "cache.sqlite")
+    ensure_cache_schema(conn)
+    for normalize in (False, True):
+        _save_cached(conn, _FIXTURE_MODEL, normalize, [(t, rng.standard_normal(8)) for t in sorted(texts)])
+    conn.close()
+
+
+def profile_scenario(scenario: Scenario, root: Path) -> tuple[float, set[str]]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_DIR), env.get("PYTHONPATH")]))
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", str(SRC_DIR / f"{scenario.module}.py"), *scenario.args],
+        cwd=root,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    seconds = time.perf_counter() - start
+    if proc.returncode != 0:
+        lines = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(lines[-1] if lines else f"exit {proc.returncode}")
+    return seconds * 1000.0, _all_imported(proc.stderr)
+
+
+def _forbidden_loaded(forbidden: tuple[str, ...], imported: set[str]) -> list[str]:
+    return sorted(name for name in forbidden if any(i == name or i.startswith(name + ".") for i in imported))
+
+
+def _run_importtime(code: str) -> str:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_DIR), env.get("PYTHONPATH")]))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else code)
+    return proc.stderr
+
+
+def profile_import(module: str, runs: int = 3) -> tuple[ImportProfile, set[str]]:
+    baseline = set(_parse_importtime(_run_importtime("pass")))
+    samples: list[dict[str, float]] = []
+    imported: set[str] = set()
+    for _ in range(max(1, runs)):
+        stderr = _run_importtime(f"import {module}")
+        imported |= _all_imported(stderr)
+        samples.append({k: v for k, v in _parse_importtime(stderr).items() if k not in baseline})
+    totals = [sum(s.values()) for s in samples]
+    median_run = samples[totals.index(sorted(totals)[len(totals) // 2])]
+    return ImportProfile(total_ms=statistics.median(totals), modules=median_run), imported
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Check CLI entry-point import times (python -X importtime) against startup budgets."
+    )
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        help=f"Entry points to check (default all: {', '.join(BUDGETS)}).",
+    )
+    parser.add_argument("--runs", type=int, default=3, help="Runs per module; the median is used.")
+    parser.add_argument("--top", type=int, default=3, help="Heaviest imports to show per module.")
+    parser.add_argument(
+        "--skip-paths",
+        action="store_true",
+        help="Only time module imports; skip the warm-cache / lexical-only path scenarios.",
+    )
+    args = parser.parse_args()
+
+    unknown = [m for m in args.modules if m not in BUDGETS]
+    if unknown:
+        print(f"No budget for: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    failures = 0
+    print("module\timport_ms\tbudget_ms\tstatus\theaviest")
+    for module in args.modules or list(BUDGETS):
+        budget = BUDGETS[module]
+        try:
+            profile, imported = profile_import(module, runs=args.runs)
+        except RuntimeError as exc:
+            print(f"{module}\t-\t{budget.max_ms:.0f}\terror\t{exc}")
+            failures += 1
+            continue
+        loaded = _forbidden_loaded(budget.forbidden, imported)
+        status = "ok"
+        if loaded:
+            status = "forbidden:" + ",".join(loaded)
+        elif profile.total_ms > budget.max_ms:
+            status = "over"
+        failures += status != "ok"
+        heaviest = sorted(profile.modules.items(), key=lambda kv: kv[1], reverse=True)[: args.top]
+        print(
+            f"{module}\t{profile.total_ms:.1f}\t{budget.max_ms:.0f}\t{status}\t"
+            + ", ".join(f"{name} {ms:.1f}" for name, ms in heaviest)
+        )
+
+    scenarios = {
+        name: s for name, s in SCENARIOS.items() if not args.modules or s.module in args.modules
+    }
+    if scenarios and not args.skip_paths:
+        print("\npath\twall_ms\tstatus")
+        with tempfile.TemporaryDirectory(prefix="startup-paths-") as tmp:
+            _write_fixtures(Path(tmp))
+            for name, scenario in scenarios.items():
+                try:
+                    wall_ms, imported = profile_scenario(scenario, Path(tmp))
+                except RuntimeError as exc:
+                    print(f"{name}\t-\terror: {exc}")
+                    failures += 1
+                    continue
+                loaded = _forbidden_loaded(scenario.forbidden, imported)
+                failures += bool(loaded)
+                print(f"{name}\t{wall_ms:.0f}\t{'forbidden:' + ','.join(loaded) if loaded else 'ok'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import yaml
+
+DEFAULT_CMO_DIR = Path("data/cmo")
+SHARD_DIRNAME = "shards"
+MANIFEST_NAME = "manifest.yml"
+MANIFEST_VERSION = 1
+
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+@dataclass(frozen=True)
+class IngestResult:
+    added: tuple[str, ...]
+    replaced: tuple[str, ...]
+    unchanged: tuple[str, ...]
+    removed: tuple[str, ...] = ()
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _dump(data) -> str:
+    return yaml.safe_dump(data, sort_keys=False, allow_unicode=True, width=120)
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}-", dir=path.parent)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _load_yaml(path: Path):
+    from yaml_loader import load_yaml
+
+    return load_yaml(path)
+
+
+class CmoStore:
+    # One YAML shard per source document ({file_id: {cmos, v_and_v_log}}, the same
+    # shape as a batch file) under <cmo_dir>/shards/. manifest.yml is the commit
+    # point: shards are written first and only become visible once listed there.
+    def __init__(self, cmo_dir: Path | str = DEFAULT_CMO_DIR) -> None:
+        self.cmo_dir = Path(cmo_dir)
+        self.root = self.cmo_dir / SHARD_DIRNAME
+        self.manifest_path = self.root / MANIFEST_NAME
+        self._manifest: dict | None = None
+
+    def exists(self) -> bool:
+        return self.manifest_path.is_file()
+
+    @property
+    def manifest(self) -> dict:
+        if self._manifest is None:
+            if self.exists():
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = yaml.safe_load(f) or {}
+            else:
+                self._manifest = {}
+            self._manifest.setdefault("version", MANIFEST_VERSION)
+            self._manifest.setdefault("batches", {})
+            self._manifest.setdefault("documents", {})
+            # Documents dropped from their batch file; their shards are kept.
+            self._manifest.setdefault("removed", {})
+        return self._manifest
+
+    def file_ids(self, batch: str | None = None) -> list[str]:
+        if batch is not None:
+            return list((self.manifest["batches"].get(batch) or {}).get("documents") or [])
+        return list(self.manifest["documents"])
+
+    def batch_files(self) -> set[str]:
+        # Batch YAMLs in cmo_dir that the store already covers (ingested or exported).
+        return {
+            str(b.get("file"))
+            for b in self.manifest["batches"].values()
+            if b and b.get("file")
+        }
+
+    def stale_batch_files(self) -> list[str]:
+        # Covered batch files edited since they were last ingested or exported; the
+        # loaders read shards only, so such edits would otherwise be ignored.
+        stale = []
+        for batch, entry in self.manifest["batches"].items():
+            name = (entry or {}).get("file")
+            path = self.cmo_dir / str(name)
+            if not name or not path.is_file():
+                continue
+            if entry.get("sha256") != _sha256(path.read_bytes()):
+                stale.append(f"{name} (batch {batch}) changed since it was ingested")
+        return stale
+
+    def record_batch_file(self, batch: str, sha256: str) -> None:
+        with self._lock():
+            self._manifest = None
+            self.manifest["batches"][batch]["sha256"] = sha256
+            _atomic_write(self.manifest_path, _dump(self.manifest))
+
+    def shard_path(self, file_id: str) -> Path:
+        return self.root / self.manifest["documents"][file_id]["shard"]
+
+    def shard_paths(self, file_ids: Iterable[str] | None = None) -> list[Path]:
+        ids = self.file_ids() if file_ids is None else [f for f in file_ids if f in self.manifest["documents"]]
+        return [self.shard_path(file_id) for file_id in ids]
+
+    def load(self, file_id: str) -> dict:
+        data = _load_yaml(self.shard_path(file_id)) or {}
+        return data.get(file_id) or {}
+
+    def documents(self, file_ids: Iterable[str] | None = None) -> Iterator[tuple[str, dict]]:
+        ids = self.file_ids() if file_ids is None else list(file_ids)
+        for file_id in ids:
+            if file_id in self.manifest["documents"]:
+                yield file_id, self.load(file_id)
+
+    def _new_shard_name(self, file_id: str, revision: int) -> str:
+        stem = _UNSAFE_RE.sub("_", Path(file_id).stem) or "document"
+        taken = {d["shard"] for k, d in self.manifest["documents"].items() if k != file_id}
+        taken.update(d["shard"] for k, d in self.manifest["removed"].items() if k != file_id)
+        name = f"{stem}.yml" if revision == 1 else f"{stem}.r{revision}.yml"
+        if name in taken:
+            name = f"{stem}-{_sha256(file_id.encode('utf-8'))[:8]}" + name[len(stem) :]
+        return name
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        lock = self.root / ".lock"
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            raise RuntimeError(f"Another ingest holds {lock}; remove it if no ingest is running.") from None
+        try:
+            os.close(fd)
+            yield
+        finally:
+            lock.unlink(missing_ok=True)
+
+    def ingest(
+        self,
+        doc_map: dict,
+        batch: str,
+        batch_file: str | None = None,
+        replace: bool = False,
+        batch_sha256: str | None = None,
+    ) -> IngestResult:
+        # Append-only: a known document with different content is rejected unless
+        # replace=True, and even then it gets a new revision file; old shards are
+        # never rewritten in place. Likewise, documents no longer in batch_file are
+        # only dropped with replace=True, and their shards are kept under `removed`.
+        added: list[str] = []
+        replaced: list[str] = []
+        unchanged: list[str] = []
+        with self._lock():
+            self._manifest = None
+            documents = self.manifest["documents"]
+            removed_docs = self.manifest["removed"]
+            batch_entry = self.manifest["batches"].setdefault(batch, {"file": batch_file, "documents": []})
+            if batch_file and not batch_entry.get("file"):
+                batch_entry["file"] = batch_file
+            dropped = [f for f in batch_entry["documents"] if f not in doc_map] if batch_file else []
+            if dropped and not replace:
+                raise ValueError(
+                    f"{len(dropped)} document(s) of batch {batch} are no longer in {batch_file} "
+                    f"({', '.join(dropped)}); pass replace to remove them from the store."
+                )
+            pending: list[tuple[str, dict]] = []
+            for file_id, doc in doc_map.items():
+                text = _dump({file_id: doc})
+                digest = _sha256(text.encode("utf-8"))
+                # A removed document that comes back continues its revision history.
+                current = documents.get(file_id) or removed_docs.get(file_id)
+                if current is not None and file_id not in documents:
+                    revision = int(current.get("revision", 1)) + 1
+                    shard = self._new_shard_name(file_id, revision)
+                    _atomic_write(self.root / shard, text)
+                    pending.append((file_id, self._entry(doc, shard, digest, batch, revision, current)))
+                    added.append(file_id)
+                    continue
+                if current is not None and current["sha256"] == digest:
+                    unchanged.append(file_id)
+                    continue
+                if current is not None and not replace:
+                    raise ValueError(
+                        f"{file_id} is already in the store with different content; pass replace to add a new revision."
+                    )
+                revision = 1 if current is None else int(current.get("revision", 1)) + 1
+                shard = self._new_shard_name(file_id, revision)
+                _atomic_write(self.root / shard, text)
+                pending.append((file_id, self._entry(doc, shard, digest, batch, revision, current)))
+                (replaced if current is not None else added).append(file_id)
+
+            for file_id, entry in pending:
+                previous = documents.get(file_id)
+                if previous and previous.get("batch") != batch:
+                    old = self.manifest["batches"].get(previous["batch"]) or {}
+                    old["documents"] = [f for f in old.get("documents") or [] if f != file_id]
+                documents[file_id] = entry
+                removed_docs.pop(file_id, None)
+                if file_id not in batch_entry["documents"]:
+                    batch_entry["documents"].append(file_id)
+            for file_id in dropped:
+                entry = documents.pop(file_id)
+                entry["removed"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+                removed_docs[file_id] = entry
+            batch_entry["documents"] = [f for f in batch_entry["documents"] if f not in dropped]
+            if batch_sha256:
+                batch_entry["sha256"] = batch_sha256
+            if pending or dropped or batch_file:
+                _atomic_write(self.manifest_path, _dump(self.manifest))
+        return IngestResult(tuple(added), tuple(replaced), tuple(unchanged), tuple(dropped))
+
+    @staticmethod
+    def _entry(doc: dict, shard: str, digest: str, batch: str, revision: int, current: dict | None) -> dict:
+        entry = {
+            "shard": shard,
+            "sha256": digest,
+            "cmos": len((doc or {}).get("cmos") or {}),
+            "batch": batch,
+            "revision": revision,
+            "ingested": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        if current is not None:
+            entry["previous"] = list(current.get("previous") or []) + [current["shard"]]
+        return entry
+
+    def export(self, batch: str) -> dict:
+        return dict(self.documents(self.file_ids(batch)))
+
+    def verify(self) -> tuple[list[str], list[Path]]:
+        problems: list[str] = []
+        for file_id, entry in self.manifest["documents"].items():
+            path = self.root / entry["shard"]
+            if not path.is_file():
+                problems.append(f"{file_id}: shard {entry['shard']} is missing")
+            elif _sha256(path.read_bytes()) != entry["sha256"]:
+                problems.append(f"{file_id}: shard {entry['shard']} does not match its manifest hash")
+        listed = set()
+        for entry in [*self.manifest["documents"].values(), *self.manifest["removed"].values()]:
+            listed.add(entry["shard"])
+            listed.update(entry.get("previous") or [])
+        problems.extend(self.stale_batch_files())
+        orphans = sorted(
+            p for p in self.root.glob("*.yml") if p.name != MANIFEST_NAME and p.name not in listed
+        )
+        return problems, orphans
+
+
+def cmo_yaml_paths(cmo_dir: Path | str = DEFAULT_CMO_DIR, file_ids: Iterable[str] | None = None) -> list[Path]:
+    # YAML files the CMO loaders should read: shards (all, or just file_ids) when a
+    # store exists, plus any loose *.yml in cmo_dir that the store does not cover
+    # (new batches not yet ingested, pdf_to_bibtex_key.yml). A covered batch file
+    # edited after ingest is an error rather than silently ignored.
+    cmo_dir = Path(cmo_dir)
+    loose = sorted(p for p in cmo_dir.glob("*.yml") if p.is_file())
+    store = CmoStore(cmo_dir)
+    if not store.exists():
+        return loose
+    stale = store.stale_batch_files()
+    if stale:
+        raise RuntimeError(
+            "CMO batch file(s) edited after ingest: "
+            + "; ".join(stale)
+            + ". Re-ingest them with `python src/py/cmo_store.py ingest --replace <file>`, "
+            "or discard the edits with `python src/py/cmo_store.py export --force`."
+        )
+    covered = store.batch_files()
+    return store.shard_paths(file_ids) + [p for p in loose if p.name not in covered]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Per-document CMO shard store: ingest extraction YAML, list, verify and export batch files."
+    )
+    parser.add_argument("--cmo-dir", type=Path, default=DEFAULT_CMO_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="Add documents from CMO YAML file(s) as shards.")
+    ingest.add_argument("inputs", nargs="+", type=Path)
+    ingest.add_argument(
+        "--batch",
+        default=None,
+        help="Export group for the documents (default: each input's file stem).",
+    )
+    ingest.add_argument(
+        "--replace",
+        action="store_true",
+        help="Store changed documents as a new revision and drop documents deleted from the batch file, instead of failing.",
+    )
+
+    listing = sub.add_parser("list", help="Documents per batch with CMO counts.")
+    listing.add_argument("--batch", default=None)
+
+    verify = sub.add_parser("verify", help="Check shard hashes against the manifest.")
+    verify.add_argument(
+        "--prune",
+        action="store_true",
+        help="Delete shard files the manifest does not list (superseded revisions are kept).",
+    )
+
+    export = sub.add_parser("export", help="Rebuild batch YAML(s) from shards (for build_cmo_tables.R).")
+    export.add_argument("--batch", action="append", default=None, help="Batch to export (repeatable; default all).")
+    export.add_argument("--output-dir", type=Path, default=None, help="Default: --cmo-dir.")
+    export.add_argument(
+        "--force",
+        action="store_true",
+        help="Overwrite batch files edited since ingest (their edits are lost; re-ingest with --replace to keep them).",
+    )
+
+    args = parser.parse_args()
+    store = CmoStore(args.cmo_dir)
+    # Imported here: yaml_loader imports cmo_yaml_paths from this module.
+    from yaml_loader import is_cmo_document_map
+
+    if args.command == "ingest":
+        for path in args.inputs:
+            data = _load_yaml(path) or {}
+            if not is_cmo_document_map(data):
+                print(f"Skipping {path}: not a CMO document map (expected top-level PDF keys)", file=sys.stderr)
+                continue
+            batch = args.batch or path.stem
+            # Inputs inside cmo_dir become store-covered batch files, so loaders stop
+            # reading them directly and `export` rewrites them from shards.
+            batch_file = path.name if path.resolve().parent == args.cmo_dir.resolve() else None
+            # Recorded so later edits to the batch file are caught instead of ignored.
+            batch_sha256 = _sha256(path.read_bytes()) if batch_file else None
+            try:
+                result = store.ingest(
+                    data, batch=batch, batch_file=batch_file, replace=args.replace, batch_sha256=batch_sha256
+                )
+            except (ValueError, RuntimeError) as exc:
+                print(f"{path.as_posix()}: {exc}", file=sys.stderr)
+                return 1
+            print(
+                f"{path.as_posix()} -> batch {batch}: {len(result.added)} added, "
+                f"{len(result.replaced)} replaced, {len(result.unchanged)} unchanged, {len(result.removed)} removed"
+            )
+        return 0
+
+    if not store.exists():
+        print(f"No shard store under {store.root.as_posix()}; run `ingest` first.", file=sys.stderr)
+        return 1
+
+    if args.command == "list":
+        batches = [args.batch] if args.batch else list(store.manifest["batches"])
+        print("batch\tfile_id\tcmos\trevision\tshard")
+        for batch in batches:
+            for file_id in store.file_ids(batch):
+                entry = store.manifest["documents"][file_id]
+                print(f"{batch}\t{file_id}\t{entry['cmos']}\t{entry.get('revision', 1)}\t{entry['shard']}")
+        return 0
+
+    if args.command == "verify":
+        problems, orphans = store.verify()
+        for problem in problems:
+            print(problem)
+        for orphan in orphans:
+            if args.prune:
+                orphan.unlink()
+            print(f"{'removed' if args.prune else 'orphan'}: {orphan.as_posix()}")
+        print(f"{len(store.file_ids())} document(s), {len(problems)} problem(s), {len(orphans)} orphan shard(s)")
+        return 1 if problems else 0
+
+    out_dir = args.output_dir or args.cmo_dir
+    for batch in args.batch or list(store.manifest["batches"]):
+        entry = store.manifest["batches"].get(batch)
+        if entry is None:
+            print(f"Unknown batch: {batch}", file=sys.stderr)
+            return 2
+        out_path = out_dir / (entry.get("file") or f"{batch}.yml")
+        covered = bool(entry.get("file")) and out_path.resolve() == (args.cmo_dir / entry["file"]).resolve()
+        if (
+            covered
+            and not args.force
+            and out_path.is_file()
+            and entry.get("sha256") != _sha256(out_path.read_bytes())
+        ):
+            print(
+                f"{out_path.as_posix()} was edited since it was ingested; re-ingest it with --replace "
+                "or pass --force to overwrite it.",
+                file=sys.stderr,
+            )
+            return 1
+        doc_map = store.export(batch)
+        text = _dump(doc_map)
+        _atomic_write(out_path, text)
+        if covered:
+            store.record_batch_file(batch, _sha256(text.encode("utf-8")))
+        print(f"Wrote {out_path.as_posix()} ({len(doc_map)} document(s))")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cmo_store import cmo_yaml_paths
+from yaml_loader import is_cmo_document_map, load_yaml_files
+
+DEFAULT_CMO_DIR = Path("data/cmo")
+DEFAULT_CACHE = Path("data/cache/cmo_statements.parquet")
+_SOURCES_METADATA_KEY = b"cmo_sources"
+
+# Column names (including "confidience_justification") match src/r/build_cmo_tables.R.
+CMO_COLUMNS = [
+    "file_id",
+    "chunk_id",
+    "context_statement",
+    "mechanism_statement",
+    "outcome_statement",
+    "confidence",
+    "confidience_justification",
+    "evidence_paraphrase",
+    "evidence_quote",
+    "evidence_type",
+    "evidence_type_narrative",
+    "research_question_mapped",
+    "country",
+    "programme",
+]
+CATEGORICAL_COLUMNS = ("file_id", "country", "programme")
+_STATEMENT_COLUMNS = ("context_statement", "mechanism_statement", "outcome_statement")
+_FIELD_MAP = {
+    "context_statement": "context",
+    "mechanism_statement": "mechanism",
+    "outcome_statement": "outcome",
+    "confidence": "confidence",
+    "confidience_justification": "confidence_justification",
+    "evidence_paraphrase": "supporting_evidence_paraphrase",
+    "evidence_quote": "supporting_evidence",
+    "evidence_type": "evidence_type",
+    "evidence_type_narrative": "evidence_type_narrative",
+}
+_LIST_FIELD_MAP = {
+    "research_question_mapped": "research_questions_mapped",
+    "country": "country",
+    "programme": "programme",
+}
+
+
+def _collapse(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return "; ".join(str(v) for v in value)
+    return str(value)
+
+
+def cmo_rows_from_yaml(data) -> list[dict]:
+    rows: list[dict] = []
+    if not is_cmo_document_map(data):
+        return rows
+    for file_id, doc in data.items():
+        for chunk_id, cmo in ((doc or {}).get("cmos") or {}).items():
+            cmo = cmo or {}
+            row = {"file_id": file_id, "chunk_id": chunk_id}
+            for column, key in _FIELD_MAP.items():
+                value = cmo.get(key)
+                row[column] = None if value is None else str(value)
+            for column, key in _LIST_FIELD_MAP.items():
+                row[column] = _collapse(cmo.get(key))
+            for column in _STATEMENT_COLUMNS:
+                if row[column] is not None:
+                    row[column] = row[column].strip() or None
+            rows.append(row)
+    return rows
+
+
+def _file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _coerce_types(df: pd.DataFrame) -> pd.DataFrame:
+    for column in df.columns:
+        if column in CATEGORICAL_COLUMNS or column == "source_file":
+            df[column] = df[column].astype("category")
+        else:
+            df[column] = df[column].astype("string")
+    return df
+
+
+def _to_frame(rows: list[dict]) -> pd.DataFrame:
+    return _coerce_types(pd.DataFrame(rows, columns=CMO_COLUMNS + ["source_file"]))
+
+
+def _read_cache(cache_path: Path) -> tuple[pd.DataFrame | None, dict[str, str]]:
+    if not cache_path.exists():
+        return None, {}
+    try:
+        table = pq.read_table(cache_path)
+    except (OSError, pa.ArrowInvalid):
+        return None, {}
+    metadata = table.schema.metadata or {}
+    sources = json.loads(metadata.get(_SOURCES_METADATA_KEY, b"{}"))
+    return table.to_pandas(), sources
+
+
+def _write_cache(cache_path: Path, df: pd.DataFrame, sources: dict[str, str]) -> None:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_SOURCES_METADATA_KEY] = json.dumps(sources, sort_keys=True).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(cache_path)
+
+
+def build_cmo_statements(
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    cache_path: Path = DEFAULT_CACHE,
+    force: bool = False,
+) -> tuple[pd.DataFrame, list[str]]:
+    # Returns the frame plus the source files that had to be (re)parsed.
+    cmo_dir, cache_path = Path(cmo_dir), Path(cache_path)
+    paths = cmo_yaml_paths(cmo_dir)
+    hashes = {p.as_posix(): _file_sha256(p) for p in paths}
+
+    cached, cached_sources = (None, {}) if force else _read_cache(cache_path)
+    changed = [p for p in paths if cached_sources.get(p.as_posix()) != hashes[p.as_posix()]]
+    if cached is not None and not changed and set(cached_sources) == set(hashes):
+        return cached, []
+
+    rebuilt: dict[str, list[dict]] = {}
+    for loaded in load_yaml_files(changed):
+        source = loaded.path.as_posix()
+        rows = cmo_rows_from_yaml(loaded.data)
+        for row in rows:
+            row["source_file"] = source
+        rebuilt[source] = rows
+
+    frames = []
+    for path in paths:
+        source = path.as_posix()
+        if source in rebuilt:
+            if rebuilt[source]:
+                frames.append(_to_frame(rebuilt[source]))
+        elif cached is not None:
+            frames.append(cached[cached["source_file"] == source])
+    # Categories differ between frames, so concat yields object columns; re-coerce.
+    df = _coerce_types(pd.concat(frames, ignore_index=True)) if frames else _to_frame([])
+
+    _write_cache(cache_path, df, hashes)
+    return df, [p.as_posix() for p in changed]
+
+
+def load_cmo_statements(
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    cache_path: Path = DEFAULT_CACHE,
+) -> pd.DataFrame:
+    df, _ = build_cmo_statements(cmo_dir, cache_path)
+    return df
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Build the consolidated CMO statements table from data/cmo/*.yml (Parquet cache)."
+    )
+    parser.add_argument("--cmo-dir", type=Path, default=DEFAULT_CMO_DIR)
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=DEFAULT_CACHE,
+        help="Parquet output/cache path (default: data/cache/cmo_statements.parquet).",
+    )
+    parser.add_argument(
+        "--csv",
+        type=Path,
+        default=None,
+        help="Also export the table as CSV (same columns as build_cmo_tables.R).",
+    )
+    parser.add_argument("--force", action="store_true", help="Rebuild every source file.")
+    args = parser.parse_args()
+
+    df, rebuilt = build_cmo_statements(args.cmo_dir, args.cache, force=args.force)
+    if args.csv:
+        df[CMO_COLUMNS].to_csv(args.csv, index=False)
+    print(
+        f"{len(df)} CMO rows from {df['file_id'].nunique()} document(s); "
+        f"rebuilt {len(rebuilt)} source file(s): {', '.join(rebuilt) or 'none'}"
+    )
+    print(f"Parquet: {args.cache.as_posix()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
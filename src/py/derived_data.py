@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+# Helpers shared by the stages that derive read-only artefacts from the CMO YAML
+# (build_app_bundles.py, incidence.py): value splitting, family lookup, source
+# md5s and the atomic swap of an output directory.
+
+
+def split_values(value: Any) -> list[str]:
+    # The apps' R fallback (build_value_table) applies the same rule.
+    if value is None or value != value:  # None / NaN / pd.NA
+        return []
+    items = (item.strip() for item in str(value).split(";"))
+    return [item for item in items if item and item != "NA"]
+
+
+def load_families(path: Path) -> tuple[dict[str, str], dict[str, str]]:
+    # (family_id -> label, cmo_id -> family_id)
+    from yaml_loader import load_yaml
+
+    if not Path(path).exists():
+        return {}, {}
+    doc = load_yaml(Path(path)) or {}
+    families = {str(k): str((v or {}).get("label") or "") for k, v in (doc.get("families") or {}).items()}
+    assignments = {
+        str(k): str((v or {}).get("family_id"))
+        for k, v in (doc.get("assignments") or {}).items()
+        if (v or {}).get("family_id")
+    }
+    return families, assignments
+
+
+def file_md5(path: Path) -> str:
+    # md5 so R readers can compare with tools::md5sum() without extra packages.
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_md5s(sources: list[Path]) -> dict[str, str]:
+    # Repo-relative source paths -> md5, as recorded in the output manifests.
+    return {p.as_posix(): file_md5(p) for p in sources if p.exists()}
+
+
+@contextmanager
+def replace_directory(directory: Path) -> Iterator[Path]:
+    # Yields a sibling temp dir that replaces `directory` only if the block
+    # succeeds, so readers never see a half-written or mixed output.
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{directory.name}-", dir=directory.parent))
+    try:
+        yield tmp
+        old = directory.with_name(f".{directory.name}-old")
+        if directory.exists():
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(directory, old)
+        os.replace(tmp, directory)
+        shutil.rmtree(old, ignore_errors=True)
+    finally:
+        if tmp.exists():
+            shutil.rmtree(tmp, ignore_errors=True)
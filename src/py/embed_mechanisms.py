@@ -1,25 +1,63 @@
 #!/usr/bin/env python
+from __future__ import annotations
+
 import argparse
 import sqlite3
-from typing import Iterable, Tuple
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Tuple
 
 import numpy as np
-import pandas as pd
-from sentence_transformers import SentenceTransformer
+
+from encoders import BACKENDS, DEFAULT_BACKEND, get_encoder
+from profiling import add_profile_arguments, get_profiler, profile_session
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+FIELD_CHOICES = ("context_statement", "mechanism_statement", "outcome_statement")
+
+# The encoder backend (torch or onnxruntime), pandas and the Parquet table are imported
+# on first use so cache hits and the TF-IDF triage path start fast; see check_startup_budget.py.
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Embed mechanism statements.")
     parser.add_argument(
         "--input",
-        default="data/cmo_statements.csv",
-        help="Path to cmo_statements.csv",
+        default=None,
+        help="Optional cmo_statements.csv to read instead of the Parquet table built by cmo_table.py",
+    )
+    parser.add_argument(
+        "--cmo-dir",
+        default="data/cmo",
+        help="CMO YAML directory used to build/refresh the Parquet table",
+    )
+    parser.add_argument(
+        "--table-cache",
+        default="data/cache/cmo_statements.parquet",
+        help="Parquet cache for the consolidated CMO table",
     )
     parser.add_argument(
         "--output",
         default="data/mechanism_embeddings.csv",
         help="Output CSV path for embeddings",
     )
+    parser.add_argument(
+        "--fields",
+        nargs="+",
+        choices=FIELD_CHOICES,
+        default=None,
+        help=(
+            "Embed several statement columns in one model session and write "
+            "<output-dir>/<field>.npy plus a shared index.csv instead of --output"
+        ),
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="data/embeddings",
+        help="Output directory for --fields matrices",
+    )
     parser.add_argument(
         "--model",
         default="all-MiniLM-L6-v2",
@@ -30,6 +68,11 @@ def parse_args() -> argparse.Namespace:
         default="data/embeddings_cache.sqlite",
         help="SQLite cache for embeddings",
     )
+    parser.add_argument(
+        "--track-access",
+        action="store_true",
+        help="Refresh last_used on cache hits (for age-based eviction); off so cache hits never write",
+    )
     parser.add_argument(
         "--batch-size",
         type=int,
@@ -41,30 +84,70 @@ def parse_args() -> argparse.Namespace:
         default="cpu",
         help="Device to run embeddings on (e.g. cpu, cuda)",
     )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=DEFAULT_BACKEND,
+        help="Encoder backend; onnx-int8 needs `python src/py/encoders.py export` first",
+    )
     parser.add_argument(
         "--normalize",
         action="store_true",
         help="Normalize embeddings to unit length",
     )
+    parser.add_argument(
+        "--dedupe",
+        default=None,
+        help="near_duplicates.yml; embed only each duplicate cluster's representative",
+    )
+    add_profile_arguments(parser)
     return parser.parse_args()
 
 
-def _ensure_cache_schema(conn: sqlite3.Connection) -> None:
+def _create_embeddings_table(conn: sqlite3.Connection) -> None:
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS embeddings (
             model TEXT NOT NULL,
+            backend TEXT NOT NULL,
             normalize INTEGER NOT NULL,
             text TEXT NOT NULL,
             dim INTEGER NOT NULL,
             dtype TEXT NOT NULL,
             embedding BLOB NOT NULL,
-            PRIMARY KEY (model, normalize, text)
+            last_used INTEGER,
+            PRIMARY KEY (model, backend, normalize, text)
         )
         """
     )
+
+
+def _cache_columns(conn: sqlite3.Connection) -> set[str]:
+    return {row[1] for row in conn.execute("PRAGMA table_info(embeddings)")}
+
+
+def ensure_cache_schema(conn: sqlite3.Connection) -> None:
+    # Called only before writing: a cache that is just read (e.g. the git-tracked one
+    # the notebooks render from) is never migrated in place.
+    _create_embeddings_table(conn)
+    # Caches created before last-access tracking: add the column and treat every
+    # existing row as used now, so age-based eviction starts counting from here.
+    columns = _cache_columns(conn)
+    if "last_used" not in columns:
+        conn.execute("ALTER TABLE embeddings ADD COLUMN last_used INTEGER")
+        conn.execute("UPDATE embeddings SET last_used = ?", (int(time.time()),))
+    # Caches created before encoder backends hold PyTorch vectors only. SQLite cannot
+    # change a primary key in place, so the table is copied with backend = 'torch'.
+    if "backend" not in columns:
+        conn.execute("ALTER TABLE embeddings RENAME TO embeddings_old")
+        _create_embeddings_table(conn)
+        conn.execute(
+            "INSERT INTO embeddings (model, backend, normalize, text, dim, dtype, embedding, last_used) "
+            "SELECT model, 'torch', normalize, text, dim, dtype, embedding, last_used FROM embeddings_old"
+        )
+        conn.execute("DROP TABLE embeddings_old")
     conn.execute(
-        "CREATE INDEX IF NOT EXISTS idx_embeddings_model ON embeddings(model, normalize)"
+        "CREATE INDEX IF NOT EXISTS idx_embeddings_model ON embeddings(model, backend, normalize)"
     )
     conn.commit()
 
@@ -79,12 +162,25 @@ def _deserialize_embedding(blob: bytes, dim: int, dtype: str) -> np.ndarray:
 
 
 def _load_cached(
-    conn: sqlite3.Connection, model: str, normalize: bool
+    conn: sqlite3.Connection, model: str, normalize: bool, backend: str = DEFAULT_BACKEND
 ) -> dict:
-    cur = conn.execute(
-        "SELECT text, dim, dtype, embedding FROM embeddings WHERE model = ? AND normalize = ?",
-        (model, 1 if normalize else 0),
-    )
+    columns = _cache_columns(conn)
+    if not columns:
+        return {}
+    if "backend" in columns:
+        cur = conn.execute(
+            "SELECT text, dim, dtype, embedding FROM embeddings "
+            "WHERE model = ? AND backend = ? AND normalize = ?",
+            (model, backend, 1 if normalize else 0),
+        )
+    elif backend == "torch":
+        # Not yet migrated: every row is a PyTorch vector.
+        cur = conn.execute(
+            "SELECT text, dim, dtype, embedding FROM embeddings WHERE model = ? AND normalize = ?",
+            (model, 1 if normalize else 0),
+        )
+    else:
+        return {}
     cache = {}
     for text, dim, dtype, blob in cur.fetchall():
         cache[text] = _deserialize_embedding(blob, dim, dtype)
@@ -96,19 +192,40 @@ def _save_cached(
     model: str,
     normalize: bool,
     items: Iterable[Tuple[str, np.ndarray]],
+    backend: str = DEFAULT_BACKEND,
 ) -> None:
     rows = []
+    now = int(time.time())
     for text, vec in items:
         blob, dim, dtype = _serialize_embedding(vec)
-        rows.append((model, 1 if normalize else 0, text, dim, dtype, blob))
+        rows.append((model, backend, 1 if normalize else 0, text, dim, dtype, blob, now))
     conn.executemany(
-        "INSERT OR REPLACE INTO embeddings (model, normalize, text, dim, dtype, embedding) "
-        "VALUES (?, ?, ?, ?, ?, ?)",
+        "INSERT OR REPLACE INTO embeddings "
+        "(model, backend, normalize, text, dim, dtype, embedding, last_used) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
         rows,
     )
     conn.commit()
 
 
+def _touch_cached(
+    conn: sqlite3.Connection,
+    model: str,
+    normalize: bool,
+    texts: Iterable[str],
+    backend: str = DEFAULT_BACKEND,
+) -> None:
+    # Day granularity: repeated runs on the same day do not rewrite the rows.
+    now = int(time.time())
+    conn.executemany(
+        "UPDATE embeddings SET last_used = ? "
+        "WHERE model = ? AND backend = ? AND normalize = ? AND text = ? "
+        "AND (last_used IS NULL OR last_used < ?)",
+        [(now, model, backend, 1 if normalize else 0, t, now - 86400) for t in texts],
+    )
+    conn.commit()
+
+
 def embed_texts(
     texts: list[str],
     model_name: str = "all-MiniLM-L6-v2",
@@ -116,24 +233,39 @@ def embed_texts(
     normalize: bool = False,
     device: str = "cpu",
     cache_path: str = "data/embeddings_cache.sqlite",
+    backend: str = DEFAULT_BACKEND,
+    track_access: bool = False,
 ) -> np.ndarray:
+    # Vectors are cached per (model, backend, normalize): int8 ONNX vectors are close
+    # to, but not interchangeable with, the PyTorch ones.
     if not texts:
         return np.empty((0, 0), dtype=np.float32)
 
-    conn = sqlite3.connect(cache_path)
-    _ensure_cache_schema(conn)
-    cache = _load_cached(conn, model_name, normalize)
+    prof = get_profiler()
+    with prof.stage("cache_load"):
+        conn = sqlite3.connect(cache_path)
+        cache = _load_cached(conn, model_name, normalize, backend)
+        prof.rows(len(cache))
 
-    missing = [t for t in texts if t not in cache]
+    # Duplicate strings (within or across fields) are encoded and cached once.
+    missing = list(dict.fromkeys(t for t in texts if t not in cache))
+    prof.rows(len(texts))
+    hits = [t for t in dict.fromkeys(texts) if t in cache]
+    prof.cache(hits=sum(t in cache for t in texts), misses=len(missing))
+    if hits and track_access:
+        with prof.stage("cache_touch"):
+            ensure_cache_schema(conn)
+            _touch_cached(conn, model_name, normalize, hits, backend)
     if missing:
-        model = SentenceTransformer(model_name, device=device)
-        new_embeddings = model.encode(
-            missing,
-            batch_size=batch_size,
-            normalize_embeddings=normalize,
-            show_progress_bar=True,
-        )
-        _save_cached(conn, model_name, normalize, zip(missing, new_embeddings))
+        with prof.stage("model_load"):
+            encoder = get_encoder(backend, model_name, device=device)
+        with prof.stage("encode"):
+            new_embeddings = encoder.encode(missing, batch_size=batch_size, normalize=normalize)
+            prof.rows(len(missing))
+        with prof.stage("cache_write"):
+            ensure_cache_schema(conn)
+            _save_cached(conn, model_name, normalize, zip(missing, new_embeddings), backend)
+            prof.rows(len(missing))
         for text, vec in zip(missing, new_embeddings):
             cache[text] = np.asarray(vec, dtype=np.float32)
 
@@ -149,6 +281,8 @@ def embed_mechanisms(
     normalize: bool = False,
     device: str = "cpu",
     cache_path: str = "data/embeddings_cache.sqlite",
+    backend: str = DEFAULT_BACKEND,
+    track_access: bool = False,
 ) -> np.ndarray:
     texts = df[text_col].tolist()
     return embed_texts(
@@ -158,9 +292,52 @@ def embed_mechanisms(
         normalize=normalize,
         device=device,
         cache_path=cache_path,
+        backend=backend,
+        track_access=track_access,
     )
 
 
+def embed_fields(
+    df: pd.DataFrame,
+    fields: list[str],
+    model_name: str = "all-MiniLM-L6-v2",
+    batch_size: int = 32,
+    normalize: bool = False,
+    device: str = "cpu",
+    cache_path: str = "data/embeddings_cache.sqlite",
+    backend: str = DEFAULT_BACKEND,
+    track_access: bool = False,
+) -> dict[str, np.ndarray]:
+    # One model session over the union of all fields; each matrix shares df's row
+    # order, with NaN rows where a field is empty for that CMO.
+    columns = {
+        field: [t.strip() if isinstance(t, str) else "" for t in df[field].tolist()]
+        for field in fields
+    }
+    unique = list(dict.fromkeys(t for texts in columns.values() for t in texts if t))
+    get_profiler().count("unique_texts", len(unique))
+    vectors = embed_texts(
+        texts=unique,
+        model_name=model_name,
+        batch_size=batch_size,
+        normalize=normalize,
+        device=device,
+        cache_path=cache_path,
+        backend=backend,
+        track_access=track_access,
+    )
+    row_of = {text: i for i, text in enumerate(unique)}
+    dim = vectors.shape[1] if unique else 0
+    matrices: dict[str, np.ndarray] = {}
+    for field, texts in columns.items():
+        matrix = np.full((len(texts), dim), np.nan, dtype=np.float32)
+        present = [i for i, t in enumerate(texts) if t]
+        if present:
+            matrix[present] = vectors[[row_of[texts[i]] for i in present]]
+        matrices[field] = matrix
+    return matrices
+
+
 def cosine_similarity_matrix(embeddings: np.ndarray) -> np.ndarray:
     if embeddings.size == 0:
         return np.empty((0, 0), dtype=np.float32)
@@ -172,30 +349,93 @@ def cosine_similarity_matrix(embeddings: np.ndarray) -> np.ndarray:
 
 def main() -> None:
     args = parse_args()
+    with profile_session(args, "embed_mechanisms"):
+        _run(args)
 
-    df = pd.read_csv(args.input)
-    df = df[df["mechanism_statement"].notna()].copy()
-    df["mechanism_statement"] = df["mechanism_statement"].str.strip()
-    df = df[df["mechanism_statement"] != ""]
 
-    embeddings = embed_mechanisms(
-        df,
-        model_name=args.model,
-        batch_size=args.batch_size,
-        normalize=args.normalize,
-        device=args.device,
-        cache_path=args.cache,
-    )
+def _run(args: argparse.Namespace) -> None:
+    prof = get_profiler()
+    import pandas as pd
 
-    emb_cols = [f"emb_{i}" for i in range(embeddings.shape[1])]
-    emb_df = pd.DataFrame(embeddings, columns=emb_cols)
-    out = pd.concat(
-        [df[["chunk_id", "file_id", "mechanism_statement"]].reset_index(drop=True), emb_df],
-        axis=1,
-    )
-    out.to_csv(args.output, index=False)
+    fields = args.fields or ["mechanism_statement"]
+    with prof.stage("load_table"):
+        if args.input:
+            df = pd.read_csv(args.input)
+            for field in fields:
+                df[field] = df[field].where(df[field].notna(), "").astype(str).str.strip()
+                df.loc[df[field] == "", field] = None
+        else:
+            from cmo_table import load_cmo_statements
+
+            # The Parquet table already strips statements and stores blanks as missing.
+            df = load_cmo_statements(args.cmo_dir, args.table_cache)
+        df = df[df[fields].notna().any(axis=1)].copy()
+        if args.dedupe:
+            from near_duplicates import non_representative_ids
+
+            df = df[~df["chunk_id"].isin(non_representative_ids(args.dedupe))]
+        prof.rows(len(df))
+
+    if args.fields:
+        _write_fields(df, args)
+        return
+
+    with prof.stage("embed"):
+        embeddings = embed_mechanisms(
+            df,
+            model_name=args.model,
+            batch_size=args.batch_size,
+            normalize=args.normalize,
+            device=args.device,
+            cache_path=args.cache,
+            track_access=args.track_access,
+            backend=args.backend,
+        )
+
+    with prof.stage("write_csv"):
+        emb_cols = [f"emb_{i}" for i in range(embeddings.shape[1])]
+        emb_df = pd.DataFrame(embeddings, columns=emb_cols)
+        out = pd.concat(
+            [df[["chunk_id", "file_id", "mechanism_statement"]].reset_index(drop=True), emb_df],
+            axis=1,
+        )
+        out.to_csv(args.output, index=False)
+        prof.rows(len(out))
     print(f"Wrote {args.output} with {len(out)} rows and {len(emb_cols)} dims")
 
 
+def _write_fields(df: pd.DataFrame, args: argparse.Namespace) -> None:
+    prof = get_profiler()
+    with prof.stage("embed"):
+        matrices = embed_fields(
+            df,
+            args.fields,
+            model_name=args.model,
+            batch_size=args.batch_size,
+            normalize=args.normalize,
+            device=args.device,
+            cache_path=args.cache,
+            track_access=args.track_access,
+            backend=args.backend,
+        )
+
+    with prof.stage("write_npy"):
+        out_dir = Path(args.output_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        # Row i of every <field>.npy is row i of index.csv.
+        index = df[["chunk_id", "file_id"]].reset_index(drop=True)
+        for field in args.fields:
+            index[f"has_{field}"] = df[field].notna().to_numpy()
+        index.to_csv(out_dir / "index.csv", index_label="row")
+        for field, matrix in matrices.items():
+            np.save(out_dir / f"{field}.npy", matrix)
+        prof.rows(len(index))
+    dims = next(iter(matrices.values())).shape[1]
+    print(
+        f"Wrote {len(matrices)} matrices ({', '.join(matrices)}) with {len(index)} rows "
+        f"and {dims} dims to {out_dir.as_posix()}"
+    )
+
+
 if __name__ == "__main__":
     main()
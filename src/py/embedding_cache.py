@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from embed_mechanisms import ensure_cache_schema
+from encoders import BACKENDS, DEFAULT_BACKEND
+from proto_themes import load_proto_themes
+
+DEFAULT_CACHE = Path("data/embeddings_cache.sqlite")
+# Format 2 adds the encoder backend; format 1 files predate it and hold torch vectors.
+EXPORT_FORMAT = 2
+STATEMENT_FIELDS = ("context_statement", "mechanism_statement", "outcome_statement")
+
+
+@dataclass(frozen=True)
+class ModelStats:
+    model: str
+    backend: str
+    normalize: bool
+    rows: int
+    dim: int
+    bytes: int
+    oldest_used: int | None
+    newest_used: int | None
+
+
+def open_cache(path: Path) -> sqlite3.Connection:
+    if not path.exists():
+        raise FileNotFoundError(f"No embedding cache at {path}")
+    conn = sqlite3.connect(path)
+    ensure_cache_schema(conn)
+    return conn
+
+
+def cache_stats(conn: sqlite3.Connection) -> list[ModelStats]:
+    rows = conn.execute(
+        """
+        SELECT model, backend, normalize, COUNT(*), MAX(dim),
+               SUM(LENGTH(embedding) + LENGTH(CAST(text AS BLOB))),
+               MIN(last_used), MAX(last_used)
+        FROM embeddings
+        GROUP BY model, backend, normalize
+        ORDER BY model, backend, normalize
+        """
+    ).fetchall()
+    return [
+        ModelStats(model, backend, bool(norm), count, dim or 0, size or 0, oldest, newest)
+        for model, backend, norm, count, dim, size, oldest, newest in rows
+    ]
+
+
+def referenced_texts(
+    cmo_dir: Path = Path("data/cmo"),
+    table_cache: Path = Path("data/cache/cmo_statements.parquet"),
+    proto_themes: Path | None = Path("data/mechanism_themes/proto_themes.yml"),
+) -> set[str]:
+    # Every string the pipeline embeds: CMO statements (embed_mechanisms, outcome
+    # BERTopic), proto-theme mechanisms (preassign) and "label explanation" theme
+    # texts (triage / audit inputs).
+    from cmo_table import load_cmo_statements
+
+    df = load_cmo_statements(cmo_dir, table_cache)
+    texts: set[str] = set()
+    for field in STATEMENT_FIELDS:
+        texts.update(t for t in df[field].dropna().tolist() if t)
+    if proto_themes is not None and proto_themes.exists():
+        themes = load_proto_themes(proto_themes)
+        texts.update(themes.theme_texts.values())
+        texts.update(m.text.strip() for m in themes.mechanisms[: themes.n_assigned] if m.text.strip())
+    return texts
+
+
+def select_evictions(
+    conn: sqlite3.Connection,
+    referenced: set[str] | None = None,
+    older_than_days: float | None = None,
+    model: str | None = None,
+) -> list[tuple[int, str, str, int]]:
+    # A row is evicted only if it matches every criterion given.
+    cutoff = int(time.time() - older_than_days * 86400) if older_than_days is not None else None
+    sql = "SELECT rowid, model, backend, normalize, text, last_used FROM embeddings"
+    params: tuple = ()
+    if model is not None:
+        sql += " WHERE model = ?"
+        params = (model,)
+    victims = []
+    for rowid, row_model, backend, norm, text, last_used in conn.execute(sql, params):
+        if referenced is not None and text in referenced:
+            continue
+        if cutoff is not None and last_used is not None and last_used >= cutoff:
+            continue
+        victims.append((rowid, row_model, backend, norm))
+    return victims
+
+
+def delete_rows(conn: sqlite3.Connection, rowids: list[int]) -> None:
+    conn.executemany("DELETE FROM embeddings WHERE rowid = ?", [(r,) for r in rowids])
+    conn.commit()
+
+
+def export_model(
+    conn: sqlite3.Connection,
+    model: str,
+    normalize: bool,
+    path: Path,
+    backend: str = DEFAULT_BACKEND,
+) -> int:
+    import numpy as np
+
+    rows = conn.execute(
+        "SELECT text, dim, dtype, embedding FROM embeddings "
+        "WHERE model = ? AND backend = ? AND normalize = ? ORDER BY text",
+        (model, backend, 1 if normalize else 0),
+    ).fetchall()
+    if not rows:
+        raise ValueError(f"No cached vectors for model={model} backend={backend} normalize={normalize}")
+    layouts = {(dim, dtype) for _, dim, dtype, _ in rows}
+    if len(layouts) != 1:
+        raise ValueError(f"Mixed vector layouts for {model}: {sorted(layouts)}")
+    dim, dtype = layouts.pop()
+    vectors = np.vstack([np.frombuffer(blob, dtype=np.dtype(dtype), count=dim) for _, _, _, blob in rows])
+    # Texts as one UTF-8 buffer plus offsets so the file loads without pickle.
+    encoded = [text.encode("utf-8") for text, _, _, _ in rows]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    meta = {
+        "format": EXPORT_FORMAT,
+        "model": model,
+        "backend": backend,
+        "normalize": normalize,
+        "dim": dim,
+        "dtype": dtype,
+        "rows": len(rows),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        np.savez_compressed(
+            f,
+            meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+            vectors=vectors,
+            text_bytes=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            text_offsets=offsets,
+        )
+    return len(rows)
+
+
+def import_model(conn: sqlite3.Connection, path: Path, replace: bool = False) -> tuple[dict, int]:
+    import numpy as np
+
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+        if meta.get("format") not in (1, EXPORT_FORMAT):
+            raise ValueError(f"Unsupported export format {meta.get('format')!r} in {path}")
+        vectors = data["vectors"]
+        text_bytes = data["text_bytes"].tobytes()
+        offsets = data["text_offsets"]
+    texts = [text_bytes[offsets[i] : offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+    if len(texts) != vectors.shape[0]:
+        raise ValueError(f"{path}: {len(texts)} texts but {vectors.shape[0]} vectors")
+    meta.setdefault("backend", DEFAULT_BACKEND)
+    now = int(time.time())
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    before = conn.total_changes
+    conn.executemany(
+        f"{verb} INTO embeddings (model, backend, normalize, text, dim, dtype, embedding, last_used) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                meta["model"],
+                meta["backend"],
+                1 if meta["normalize"] else 0,
+                text,
+                int(meta["dim"]),
+                meta["dtype"],
+                vec.astype(np.dtype(meta["dtype"])).tobytes(),
+                now,
+            )
+            for text, vec in zip(texts, vectors)
+        ],
+    )
+    conn.commit()
+    return meta, conn.total_changes - before
+
+
+def _fmt_time(ts: int | None) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(ts)) if ts else "-"
+
+
+def _cmd_stats(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    stats = cache_stats(conn)
+    print("model\tbackend\tnormalize\trows\tdim\tmb\toldest_used\tnewest_used")
+    for s in stats:
+        print(
+            f"{s.model}\t{s.backend}\t{int(s.normalize)}\t{s.rows}\t{s.dim}\t{s.bytes / 1e6:.2f}\t"
+            f"{_fmt_time(s.oldest_used)}\t{_fmt_time(s.newest_used)}"
+        )
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    print(
+        f"{sum(s.rows for s in stats)} rows; file {args.cache.stat().st_size / 1e6:.2f} MB, "
+        f"{free_pages * page_size / 1e6:.2f} MB reclaimable by vacuum"
+    )
+    return 0
+
+
+def _cmd_evict(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    if not args.unreferenced and args.older_than is None:
+        print("Nothing to do: pass --unreferenced and/or --older-than DAYS.")
+        return 2
+    referenced = None
+    if args.unreferenced:
+        referenced = referenced_texts(args.cmo_dir, args.table_cache, args.proto_themes)
+    victims = select_evictions(conn, referenced, args.older_than, args.model)
+    by_model: dict[tuple[str, str, int], int] = {}
+    for _, model, backend, norm in victims:
+        by_model[(model, backend, norm)] = by_model.get((model, backend, norm), 0) + 1
+    for (model, backend, norm), count in sorted(by_model.items()):
+        print(f"{model}\t{backend}\tnormalize={norm}\t{count} row(s)")
+    if args.dry_run:
+        print(f"Would evict {len(victims)} row(s) (dry run).")
+        return 0
+    delete_rows(conn, [rowid for rowid, _, _, _ in victims])
+    print(f"Evicted {len(victims)} row(s).")
+    if args.vacuum and victims:
+        conn.execute("VACUUM")
+        print(f"Vacuumed; file now {args.cache.stat().st_size / 1e6:.2f} MB")
+    return 0
+
+
+def _cmd_vacuum(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    before = args.cache.stat().st_size
+    conn.execute("VACUUM")
+    after = args.cache.stat().st_size
+    print(f"Vacuumed {args.cache.as_posix()}: {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB")
+    return 0
+
+
+def _cmd_export(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    count = export_model(conn, args.model, args.normalize, args.output, args.backend)
+    print(
+        f"Exported {count} vector(s) for {args.model} ({args.backend}, normalize={int(args.normalize)}) "
+        f"to {args.output.as_posix()}"
+    )
+    return 0
+
+
+def _cmd_import(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    meta, written = import_model(conn, args.input, replace=args.replace)
+    print(
+        f"Imported {written} of {meta['rows']} vector(s) for {meta['model']} "
+        f"({meta['backend']}, normalize={int(meta['normalize'])}) into {args.cache.as_posix()}"
+    )
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Inspect, evict, compact and ship the sentence-embedding cache used by embed_mechanisms.py."
+    )
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("stats", help="Row counts and sizes per model, encoder backend and normalize flag.")
+
+    evict = sub.add_parser("evict", help="Delete rows; with several criteria a row must match all of them.")
+    evict.add_argument(
+        "--unreferenced",
+        action="store_true",
+        help="Rows whose text is not a current CMO statement, proto-theme mechanism or theme text.",
+    )
+    evict.add_argument("--older-than", type=float, default=None, metavar="DAYS", help="Rows not used in DAYS days.")
+    evict.add_argument("--model", default=None, help="Only consider this model's rows.")
+    evict.add_argument("--cmo-dir", type=Path, default=Path("data/cmo"))
+    evict.add_argument("--table-cache", type=Path, default=Path("data/cache/cmo_statements.parquet"))
+    evict.add_argument(
+        "--proto-themes", type=Path, default=Path("data/mechanism_themes/proto_themes.yml")
+    )
+    evict.add_argument("--dry-run", action="store_true")
+    evict.add_argument("--vacuum", action="store_true", help="VACUUM after deleting.")
+
+    sub.add_parser("vacuum", help="Rebuild the file to reclaim space from deleted rows.")
+
+    export = sub.add_parser("export", help="Write one model's vectors to a portable .npz file.")
+    export.add_argument("--model", default="all-MiniLM-L6-v2")
+    export.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND)
+    export.add_argument("--normalize", action="store_true")
+    export.add_argument("output", type=Path)
+
+    imp = sub.add_parser("import", help="Load vectors from an exported .npz file.")
+    imp.add_argument("input", type=Path)
+    imp.add_argument("--replace", action="store_true", help="Overwrite vectors already cached for the same text.")
+
+    args = parser.parse_args()
+    if args.command == "import":
+        args.cache.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(args.cache)
+        ensure_cache_schema(conn)
+    else:
+        conn = open_cache(args.cache)
+    commands = {
+        "stats": _cmd_stats,
+        "evict": _cmd_evict,
+        "vacuum": _cmd_vacuum,
+        "export": _cmd_export,
+        "import": _cmd_import,
+    }
+    try:
+        return commands[args.command](conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
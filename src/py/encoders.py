@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import re
+from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+
+from profiling import add_profile_arguments, get_profiler, profile_session
+
+BACKENDS = ("torch", "onnx-int8")
+DEFAULT_BACKEND = "torch"
+DEFAULT_ONNX_DIR = Path("data/cache/onnx")
+# Bump when the exported graph, pooling or tokenizer settings change so exports are redone.
+EXPORT_VERSION = 1
+POOLING_MODES = ("mean", "cls", "max")
+
+# torch/sentence_transformers and onnxruntime are imported inside the backends, so
+# the ONNX path never loads torch and cache hits load neither.
+
+
+class Encoder(Protocol):
+    backend: str
+    model_name: str
+
+    def encode(self, texts: list[str], batch_size: int = 32, normalize: bool = False) -> np.ndarray: ...
+
+
+class TorchEncoder:
+    backend = "torch"
+
+    def __init__(self, model_name: str, device: str = "cpu") -> None:
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def encode(self, texts: list[str], batch_size: int = 32, normalize: bool = False) -> np.ndarray:
+        vectors = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            normalize_embeddings=normalize,
+            show_progress_bar=True,
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def onnx_model_dir(model_name: str, root: Path = DEFAULT_ONNX_DIR) -> Path:
+    return Path(root) / re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+
+class OnnxInt8Encoder:
+    # Runs the int8 export written by export_onnx() on onnxruntime's CPU provider,
+    # with the Rust tokenizer and numpy pooling in place of the PyTorch stack.
+    backend = "onnx-int8"
+
+    def __init__(self, model_name: str, onnx_dir: Path = DEFAULT_ONNX_DIR, threads: int | None = None) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = onnx_model_dir(model_name, onnx_dir)
+        config_path = model_dir / "encoder.json"
+        if not config_path.exists():
+            raise FileNotFoundError(
+                f"No ONNX export for {model_name} in {model_dir.as_posix()}; run "
+                f"python src/py/encoders.py export --model {model_name}"
+            )
+        config = json.loads(config_path.read_text(encoding="utf-8"))
+        if config.get("export_version") != EXPORT_VERSION:
+            raise ValueError(
+                f"{config_path.as_posix()} was written by export version {config.get('export_version')!r}; "
+                f"re-run python src/py/encoders.py export --model {model_name}"
+            )
+        self.model_name = model_name
+        self.config = config
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=config["pad_token_id"], pad_token=config["pad_token"])
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            str(model_dir / "model.int8.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+
+    def encode(self, texts: list[str], batch_size: int = 32, normalize: bool = False) -> np.ndarray:
+        # Length-sorted batches keep padding (and wasted int8 matmuls) to a minimum.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out = np.empty((len(texts), self.config["dim"]), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            idx = order[start : start + batch_size]
+            out[idx] = self._encode_batch([texts[i] for i in idx])
+        if normalize or self.config["normalize"]:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            out /= norms
+        return out
+
+    def _encode_batch(self, texts: list[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64), "attention_mask": mask}
+        if "token_type_ids" in self.config["input_names"]:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        (tokens,) = self.session.run(["token_embeddings"], feeds)
+        return pool(tokens, mask, self.config["pooling"])
+
+
+def pool(tokens: np.ndarray, mask: np.ndarray, mode: str) -> np.ndarray:
+    # Same reductions as sentence_transformers.models.Pooling for the supported modes.
+    if mode == "cls":
+        return tokens[:, 0]
+    weights = mask[:, :, None].astype(tokens.dtype)
+    if mode == "max":
+        return np.where(weights > 0, tokens, -1e9).max(axis=1)
+    return (tokens * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+
+
+def get_encoder(
+    backend: str = DEFAULT_BACKEND,
+    model_name: str = "all-MiniLM-L6-v2",
+    device: str = "cpu",
+    onnx_dir: Path = DEFAULT_ONNX_DIR,
+) -> Encoder:
+    if backend == "torch":
+        return TorchEncoder(model_name, device=device)
+    if backend == "onnx-int8":
+        if device != "cpu":
+            raise ValueError(f"The {backend} backend runs on CPU only (got device={device!r})")
+        return OnnxInt8Encoder(model_name, onnx_dir)
+    raise ValueError(f"Unknown encoder backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def _pooling_mode(config: dict) -> str | None:
+    # sentence-transformers >= 5 stores one pooling_mode; older releases one flag per mode.
+    if "pooling_mode" in config:
+        return config["pooling_mode"]
+    flags = {"cls": "pooling_mode_cls_token", "mean": "pooling_mode_mean_tokens", "max": "pooling_mode_max_tokens"}
+    enabled = [key for key, on in config.items() if key.startswith("pooling_mode_") and on]
+    modes = [mode for mode, key in flags.items() if key in enabled]
+    return modes[0] if len(enabled) == 1 and modes else None
+
+
+def export_onnx(model_name: str, onnx_dir: Path = DEFAULT_ONNX_DIR, opset: int = 14) -> Path:
+    # One-off step on a machine with torch: trace the transformer to ONNX, quantize
+    # its weights to int8 and record the tokenizer and pooling that follow it.
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    modules = list(st)
+    kinds = [type(m).__name__ for m in modules]
+    if kinds[:2] != ["Transformer", "Pooling"] or any(k != "Normalize" for k in kinds[2:]):
+        raise ValueError(f"{model_name}: unsupported module stack {kinds} for ONNX export")
+    transformer, pooling = modules[0], modules[1]
+    mode = _pooling_mode(pooling.get_config_dict())
+    if mode not in POOLING_MODES:
+        raise ValueError(f"{model_name}: unsupported pooling mode {mode!r} for ONNX export")
+    tokenizer = transformer.tokenizer
+    if not getattr(tokenizer, "is_fast", False):
+        raise ValueError(f"{model_name}: ONNX export needs a fast (Rust) tokenizer")
+
+    hf_model = transformer.auto_model.eval()
+    sample = tokenizer(["offset obligations", "industrial participation"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self) -> None:
+            super().__init__()
+            self.model = hf_model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)), return_dict=False)[0]
+
+    model_dir = onnx_model_dir(model_name, onnx_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = model_dir / "model.fp32.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(),
+            tuple(sample[name] for name in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in [*input_names, "token_embeddings"]},
+            opset_version=opset,
+            dynamo=False,
+        )
+    quantize_dynamic(str(fp32_path), str(model_dir / "model.int8.onnx"), weight_type=QuantType.QInt8)
+    fp32_path.unlink()
+    tokenizer.backend_tokenizer.save(str(model_dir / "tokenizer.json"))
+    config = {
+        "export_version": EXPORT_VERSION,
+        "model": model_name,
+        "dim": st.get_sentence_embedding_dimension(),
+        "max_seq_length": st.max_seq_length,
+        "pooling": mode,
+        "normalize": "Normalize" in kinds,
+        "input_names": input_names,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+    (model_dir / "encoder.json").write_text(json.dumps(config, indent=2) + "\n", encoding="utf-8")
+    return model_dir
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Export a Sentence-Transformers model to an int8 ONNX encoder for the onnx-int8 backend."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Trace, quantize and write the model under --onnx-dir.")
+    export.add_argument("--model", default="all-MiniLM-L6-v2")
+    export.add_argument("--onnx-dir", type=Path, default=DEFAULT_ONNX_DIR)
+    export.add_argument("--opset", type=int, default=14)
+    add_profile_arguments(export)
+    args = parser.parse_args()
+
+    with profile_session(args, "encoders"):
+        with get_profiler().stage("export"):
+            model_dir = export_onnx(args.model, args.onnx_dir, args.opset)
+    size = (model_dir / "model.int8.onnx").stat().st_size
+    print(f"Wrote {model_dir.as_posix()} (int8 model {size / 1e6:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,13 +3,15 @@
 from __future__ import annotations
 
 import argparse
-import os
-import re
 import sys
 from pathlib import Path
 
 import yaml
 
+from bibtex_index import load_bib_index
+from profiling import add_profile_arguments, get_profiler, profile_session
+from yaml_loader import is_cmo_document_map, load_cmo_files
+
 
 def _parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -30,6 +32,12 @@ def _parse_args() -> argparse.Namespace:
         default=Path("references/offsets.bib"),
         help="BibTeX file to read (default: references/offsets.bib).",
     )
+    parser.add_argument(
+        "--bib-cache",
+        type=Path,
+        default=None,
+        help="Parsed BibTeX index cache (default: data/cache/<bib name>.index.pickle).",
+    )
     parser.add_argument(
         "--out",
         type=Path,
@@ -41,28 +49,25 @@ def _parse_args() -> argparse.Namespace:
         action="store_true",
         help="Print info about skipped YAML files.",
     )
+    add_profile_arguments(parser)
     return parser.parse_args()
 
 
 def _load_cmo_pdf_filenames(cmo_dir: Path, *, verbose: bool) -> tuple[list[str], set[str]]:
-    yaml_files = sorted(p for p in cmo_dir.glob("*.yml") if p.is_file())
-    if not yaml_files:
+    loaded_files = load_cmo_files(cmo_dir)
+    if not loaded_files:
         raise FileNotFoundError(f"No .yml files found under {cmo_dir}")
 
     cmo_files: list[Path] = []
     pdfs: set[str] = set()
-    for cmo_path in yaml_files:
-        data = yaml.safe_load(cmo_path.read_text())
+    for loaded in loaded_files:
+        cmo_path, data = loaded.path, loaded.data
         if not isinstance(data, dict):
             if verbose:
                 print(f"Skipping non-mapping YAML: {cmo_path}", file=sys.stderr)
             continue
 
-        keys = list(data.keys())
-        is_cmo_yaml = bool(keys) and all(
-            isinstance(key, str) and key.lower().endswith(".pdf") for key in keys
-        )
-        if not is_cmo_yaml:
+        if not is_cmo_document_map(data):
             if verbose:
                 print(f"Skipping non-CMO YAML: {cmo_path}", file=sys.stderr)
             continue
@@ -78,42 +83,33 @@ def _load_cmo_pdf_filenames(cmo_dir: Path, *, verbose: bool) -> tuple[list[str],
     return [str(p.as_posix()) for p in cmo_files], pdfs
 
 
-def _parse_bib_file_basename_to_key(bib_path: Path) -> dict[str, str]:
-    header_re = re.compile(r"^@\w+\{([^,]+),")
-    file_re = re.compile(r"\bfile\s*=\s*[{\\\"]([^}\\\"]+)[}\\\"]")
-
-    basename_to_key: dict[str, str] = {}
-    current_key: str | None = None
-
-    for raw_line in bib_path.read_text().splitlines():
-        line = raw_line.strip()
-        header_match = header_re.match(line)
-        if header_match:
-            current_key = header_match.group(1).strip()
-            continue
-
-        file_match = file_re.search(line)
-        if file_match and current_key:
-            basename = os.path.basename(file_match.group(1).strip())
-            previous = basename_to_key.get(basename)
-            if previous and previous != current_key:
-                raise ValueError(
-                    f"BibTeX file basename collision for {basename!r}: "
-                    f"{previous!r} vs {current_key!r}"
-                )
-            basename_to_key[basename] = current_key
-
-    if not basename_to_key:
+def _parse_bib_file_basename_to_key(bib_path: Path, cache_path: Path | None = None) -> dict[str, str]:
+    index = load_bib_index(bib_path, cache_path)
+    if index.collisions:
+        basename, keys = next(iter(sorted(index.collisions.items())))
+        raise ValueError(
+            f"BibTeX file basename collision for {basename!r}: "
+            f"{keys[0]!r} vs {keys[1]!r}"
+        )
+    if not index.basename_to_key:
         raise ValueError(f"No BibTeX 'file' fields found in {bib_path}")
 
-    return basename_to_key
+    return index.basename_to_key
 
 
 def main() -> int:
     args = _parse_args()
+    with profile_session(args, "generate_cmo_pdf_bibtex_key_map"):
+        return _run(args)
 
-    cmo_files, pdfs = _load_cmo_pdf_filenames(args.cmo_dir, verbose=args.verbose)
-    basename_to_key = _parse_bib_file_basename_to_key(args.bib)
+
+def _run(args: argparse.Namespace) -> int:
+    prof = get_profiler()
+    with prof.stage("load_cmo_yaml"):
+        cmo_files, pdfs = _load_cmo_pdf_filenames(args.cmo_dir, verbose=args.verbose)
+        prof.rows(len(pdfs))
+    with prof.stage("load_bib_index"):
+        basename_to_key = _parse_bib_file_basename_to_key(args.bib, args.bib_cache)
 
     missing = sorted(pdf for pdf in pdfs if pdf not in basename_to_key)
     if missing:
@@ -128,11 +124,13 @@ def main() -> int:
         "pdf_to_bibtex_key": mapping,
     }
 
-    args.out.parent.mkdir(parents=True, exist_ok=True)
-    args.out.write_text(
-        yaml.safe_dump(out_obj, sort_keys=False, allow_unicode=True),
-        encoding="utf-8",
-    )
+    with prof.stage("write"):
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(
+            yaml.safe_dump(out_obj, sort_keys=False, allow_unicode=True),
+            encoding="utf-8",
+        )
+        prof.rows(len(mapping))
     return 0
 
 
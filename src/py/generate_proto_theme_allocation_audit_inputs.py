@@ -2,11 +2,30 @@
 from __future__ import annotations
 
 import argparse
+import csv
+import hashlib
+import os
+import re
 from dataclasses import dataclass
 from pathlib import Path
 
 import yaml
 
+from profiling import add_profile_arguments, get_profiler, profile_session
+from proto_themes import ProtoThemes, load_proto_themes
+
+TRIMMED_CONTEXT_NOTE = (
+    "NOTE: trimmed context. proto_themes_yml lists every theme's label and explanation, "
+    "but `mechanisms` are included only for the target theme and its most similar themes "
+    "({neighbors}). proto_themes_changelog_yml contains only the entries touching those "
+    "themes plus the latest entry (for numbering). This overrides the OUTPUT FORMAT above: "
+    "your documents are NOT saved over the two files but merged back into them, so in "
+    "Document 1 return every theme shown with `mechanisms` (with all of its remaining "
+    "mechanisms), any other theme you move a mechanism into (listing only the moved "
+    "mechanisms), and the `ambiguous_mechanisms` shown plus any you add; in Document 2 "
+    "return only the new change_log entries. Everything omitted is unchanged."
+)
+
 
 @dataclass(frozen=True)
 class ThemeSummary:
@@ -23,36 +42,145 @@ def _load_yaml(path: Path):
     return yaml.safe_load(_read_text(path))
 
 
-def _summarize_themes(proto: dict) -> list[ThemeSummary]:
-    summaries: list[ThemeSummary] = []
-    for theme in proto.get("proto_mechanism_themes", []) or []:
-        theme_id = str(theme.get("theme_id", "")).strip()
-        if not theme_id:
-            continue
-        label = str(theme.get("theme_label", "")).strip()
-        mechanisms = theme.get("mechanisms") or []
-        summaries.append(
-            ThemeSummary(
-                theme_id=theme_id,
-                mechanism_count=len(mechanisms),
-                theme_label=label,
-            )
+def _write_text_atomic(path: Path, text: str) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _read_index_hashes(index_path: Path) -> dict[str, str]:
+    # output_path -> input_hash from a previous run (older indexes have no hash column).
+    if not index_path.exists():
+        return {}
+    with open(index_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+        return {
+            row["output_path"]: row["input_hash"]
+            for row in reader
+            if row.get("output_path") and row.get("input_hash")
+        }
+
+
+def _summarize_themes(themes: ProtoThemes) -> list[ThemeSummary]:
+    summaries = [
+        ThemeSummary(
+            theme_id=theme.theme_id,
+            mechanism_count=theme.mechanism_count,
+            theme_label=theme.label.strip(),
         )
+        for theme in themes.themes
+    ]
     summaries.sort(key=lambda s: (-s.mechanism_count, s.theme_id))
     return summaries
 
 
+def _rank_similar_themes(
+    themes: ProtoThemes,
+    method: str,
+    model_name: str = "all-MiniLM-L6-v2",
+    cache_path: str = "data/embeddings_cache.sqlite",
+) -> dict[str, list[tuple[str, float]]]:
+    theme_texts = themes.theme_texts
+    theme_ids = list(theme_texts)
+
+    # Imported here so the default (untrimmed) run needs neither module.
+    if method == "embedding":
+        from embed_mechanisms import cosine_similarity_matrix, embed_texts
+
+        embeddings = embed_texts(
+            texts=[theme_texts[t] for t in theme_ids],
+            model_name=model_name,
+            normalize=True,
+            cache_path=cache_path,
+        )
+        sims = cosine_similarity_matrix(embeddings)
+
+        def score(i: int, j: int) -> float:
+            return float(sims[i, j])
+
+    else:
+        from triage_theme_pairs import build_tfidf_vectors, cosine
+
+        vectors, _ = build_tfidf_vectors(theme_texts)
+
+        def score(i: int, j: int) -> float:
+            return cosine(vectors[theme_ids[i]], vectors[theme_ids[j]])
+
+    ranked: dict[str, list[tuple[str, float]]] = {}
+    for i, theme_id in enumerate(theme_ids):
+        scored = [(other, score(i, j)) for j, other in enumerate(theme_ids) if j != i]
+        scored.sort(key=lambda x: (-x[1], x[0]))
+        ranked[theme_id] = scored
+    return ranked
+
+
+def _dump_yaml(data: dict) -> str:
+    return yaml.safe_dump(data, sort_keys=False, allow_unicode=True, width=120)
+
+
+def _trim_proto_themes(proto: dict, keep_ids: set[str]) -> dict:
+    themes = []
+    for theme in proto.get("proto_mechanism_themes", []) or []:
+        if str(theme.get("theme_id", "")).strip() in keep_ids:
+            themes.append(theme)
+        else:
+            themes.append({k: v for k, v in theme.items() if k != "mechanisms"})
+    ambiguous = [
+        m
+        for m in proto.get("ambiguous_mechanisms", []) or []
+        if keep_ids.intersection(m.get("possible_themes") or [])
+    ]
+    return {"proto_mechanism_themes": themes, "ambiguous_mechanisms": ambiguous}
+
+
+def _change_number(change: dict) -> int:
+    m = re.search(r"CHG_(\d+)$", str(change.get("change_id", "")))
+    return int(m.group(1)) if m else -1
+
+
+def _trim_changelog(changelog: dict, trimmed_proto: dict, keep_ids: set[str]) -> dict:
+    changes = changelog.get("change_log", []) or []
+    mechanism_ids = {
+        m.get("id")
+        for theme in trimmed_proto["proto_mechanism_themes"]
+        for m in theme.get("mechanisms", []) or []
+    }
+    mechanism_ids.update(m.get("id") for m in trimmed_proto["ambiguous_mechanisms"])
+    latest = max(changes, key=_change_number) if changes else None
+
+    kept = []
+    for change in changes:
+        details = change.get("details") or {}
+        merged = set(details.get("merged_from") or []) | {details.get("merged_into")}
+        if (
+            change.get("theme_id") in keep_ids
+            or change.get("mechanism_id") in mechanism_ids
+            or keep_ids.intersection(merged)
+            or change is latest
+        ):
+            kept.append(change)
+    return {"change_log": kept}
+
+
 def _build_run_markdown(
     prompt_text: str,
     target_theme_id: str,
     proto_themes_yml_text: str,
     proto_themes_changelog_yml_text: str,
+    context_note: str = "",
 ) -> str:
     parts: list[str] = []
     parts.append(prompt_text.rstrip())
     parts.append("")
     parts.append("INPUTS")
     parts.append("")
+    if context_note:
+        parts.append(context_note)
+        parts.append("")
     parts.append(f"1) target_theme_id\n{target_theme_id}")
     parts.append("")
     parts.append("2) proto_themes_yml")
@@ -103,16 +231,57 @@ def main() -> int:
         default="data/mechanism_themes/audit_inputs/index.tsv",
         help="Write a TSV index of generated files here.",
     )
+    parser.add_argument(
+        "--trim-context",
+        action="store_true",
+        help="Include mechanisms/changelog entries only for the target and its most similar themes.",
+    )
+    parser.add_argument(
+        "--neighbors",
+        type=int,
+        default=5,
+        help="Number of most similar themes to include with --trim-context (default 5).",
+    )
+    parser.add_argument(
+        "--similarity",
+        choices=["tfidf", "embedding"],
+        default="tfidf",
+        help="Theme similarity used to pick neighbours with --trim-context (default tfidf).",
+    )
+    parser.add_argument(
+        "--model",
+        default="all-MiniLM-L6-v2",
+        help="Sentence-Transformers model for --similarity embedding.",
+    )
+    parser.add_argument(
+        "--cache",
+        default="data/embeddings_cache.sqlite",
+        help="SQLite embeddings cache for --similarity embedding.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rewrite every run file even when its input hash is unchanged.",
+    )
+    add_profile_arguments(parser)
     args = parser.parse_args()
 
+    with profile_session(args, "generate_proto_theme_allocation_audit_inputs"):
+        return _run(args)
+
+
+def _run(args: argparse.Namespace) -> int:
+    prof = get_profiler()
     proto_path = Path(args.proto_themes)
     changelog_path = Path(args.changelog)
     prompt_path = Path(args.prompt)
     outdir = Path(args.outdir)
     index_path = Path(args.index)
 
-    proto = _load_yaml(proto_path)
-    summaries = _summarize_themes(proto)
+    with prof.stage("load_yaml"):
+        themes = load_proto_themes(proto_path)
+        summaries = _summarize_themes(themes)
+        prof.rows(len(summaries))
     selected = [s for s in summaries if s.mechanism_count >= args.min_mechanisms]
 
     outdir.mkdir(parents=True, exist_ok=True)
@@ -121,29 +290,96 @@ def main() -> int:
     proto_text = _read_text(proto_path)
     changelog_text = _read_text(changelog_path)
 
-    index_lines = ["theme_id\tmechanism_count\ttheme_label\toutput_path"]
+    ranked = {}
+    proto = {}
+    changelog = {}
+    if args.trim_context:
+        with prof.stage("similarity"):
+            ranked = _rank_similar_themes(
+                themes, args.similarity, model_name=args.model, cache_path=args.cache
+            )
+            prof.rows(len(ranked))
+        # Trimmed run files re-dump theme entries verbatim, so they need the raw tree.
+        with prof.stage("load_yaml"):
+            proto = _load_yaml(proto_path) or {}
+            changelog = _load_yaml(changelog_path) or {}
+
+    previous_hashes = {} if args.force else _read_index_hashes(index_path)
+    written: list[str] = []
+    full_lines = None
+    sizes: dict[str, tuple[int, int]] = {}
+    index_lines = ["theme_id\tmechanism_count\ttheme_label\toutput_path\tinput_hash"]
     for s in selected:
         out_path = outdir / f"proto_theme_allocation_audit_{s.theme_id}.md"
-        out_path.write_text(
-            _build_run_markdown(
-                prompt_text=prompt_text,
-                target_theme_id=s.theme_id,
-                proto_themes_yml_text=proto_text,
-                proto_themes_changelog_yml_text=changelog_text,
-            ),
-            encoding="utf-8",
-        )
+        with prof.stage("render"):
+            if args.trim_context:
+                neighbor_ids = [t for t, _ in ranked.get(s.theme_id, [])[: args.neighbors]]
+                keep_ids = {s.theme_id, *neighbor_ids}
+                trimmed_proto = _trim_proto_themes(proto, keep_ids)
+                content = _build_run_markdown(
+                    prompt_text=prompt_text,
+                    target_theme_id=s.theme_id,
+                    proto_themes_yml_text=_dump_yaml(trimmed_proto),
+                    proto_themes_changelog_yml_text=_dump_yaml(
+                        _trim_changelog(changelog, trimmed_proto, keep_ids)
+                    ),
+                    context_note=TRIMMED_CONTEXT_NOTE.format(
+                        neighbors=", ".join(neighbor_ids) or "none"
+                    ),
+                )
+                if full_lines is None:
+                    full_lines = _build_run_markdown(
+                        prompt_text=prompt_text,
+                        target_theme_id=s.theme_id,
+                        proto_themes_yml_text=proto_text,
+                        proto_themes_changelog_yml_text=changelog_text,
+                    ).count("\n")
+                sizes[s.theme_id] = (full_lines, content.count("\n"))
+            else:
+                content = _build_run_markdown(
+                    prompt_text=prompt_text,
+                    target_theme_id=s.theme_id,
+                    proto_themes_yml_text=proto_text,
+                    proto_themes_changelog_yml_text=changelog_text,
+                )
+            prof.rows(1)
+        input_hash = _content_hash(content)
+        with prof.stage("write"):
+            if previous_hashes.get(out_path.as_posix()) != input_hash or not out_path.exists():
+                _write_text_atomic(out_path, content)
+                written.append(s.theme_id)
+                prof.cache(misses=1)
+            else:
+                prof.cache(hits=1)
         index_lines.append(
-            f"{s.theme_id}\t{s.mechanism_count}\t{s.theme_label}\t{out_path.as_posix()}"
+            f"{s.theme_id}\t{s.mechanism_count}\t{s.theme_label}\t{out_path.as_posix()}\t{input_hash}"
         )
 
     index_path.parent.mkdir(parents=True, exist_ok=True)
-    index_path.write_text("\n".join(index_lines) + "\n", encoding="utf-8")
+    index_text = "\n".join(index_lines) + "\n"
+    if not index_path.exists() or _read_text(index_path) != index_text:
+        _write_text_atomic(index_path, index_text)
 
-    print(f"Generated {len(selected)} run file(s) in: {outdir.as_posix()}")
+    print(
+        f"Generated {len(written)} run file(s) in: {outdir.as_posix()} "
+        f"({len(selected) - len(written)} unchanged)"
+    )
     print(f"Index: {index_path.as_posix()}")
     for s in selected:
-        print(f"- {s.theme_id} ({s.mechanism_count}) {s.theme_label}")
+        line = f"- {s.theme_id} ({s.mechanism_count}) {s.theme_label}"
+        if s.theme_id not in written:
+            line += " (unchanged)"
+        if s.theme_id in sizes:
+            full, trimmed = sizes[s.theme_id]
+            line += f" [{full} -> {trimmed} lines, -{1 - trimmed / max(1, full):.1%}]"
+        print(line)
+    if sizes:
+        full_total = sum(full for full, _ in sizes.values())
+        trimmed_total = sum(trimmed for _, trimmed in sizes.values())
+        print(
+            f"Trimmed context: {full_total} -> {trimmed_total} lines across "
+            f"{len(sizes)} file(s), -{1 - trimmed_total / max(1, full_total):.1%}"
+        )
 
     return 0
 
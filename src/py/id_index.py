@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from cmo_store import cmo_yaml_paths
+from profiling import add_profile_arguments, get_profiler, profile_session
+from yaml_loader import is_cmo_document_map, load_yaml_files
+
+DEFAULT_INDEX = Path("data/cache/id_index.sqlite")
+DEFAULT_CMO_DIR = Path("data/cmo")
+DEFAULT_THEMES_DIR = Path("data/mechanism_themes")
+DEFAULT_FAMILY_MAPPING = Path("data/outcome_family_mapping.yml")
+_SCHEMA_VERSION = 1
+
+# Every row carries the source file it came from, so a changed source is
+# re-indexed by deleting its rows and inserting the new ones.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cmos (cmo_id TEXT PRIMARY KEY, file_id TEXT NOT NULL, source TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS files (file_id TEXT PRIMARY KEY, bibtex_key TEXT NOT NULL, source TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS themes (
+    theme_id TEXT PRIMARY KEY, theme_label TEXT, source TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS theme_members (
+    theme_id TEXT NOT NULL, cmo_id TEXT NOT NULL, role TEXT NOT NULL, source TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS families (family_id TEXT PRIMARY KEY, label TEXT, source TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS family_assignments (
+    cmo_id TEXT PRIMARY KEY, family_id TEXT NOT NULL, confidence TEXT, source TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS demi_theme_cmos (
+    theme_id TEXT NOT NULL, cmo_id TEXT NOT NULL, listed_as TEXT NOT NULL, source TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS demi_regularities (
+    demi_regularity_id TEXT PRIMARY KEY, theme_id TEXT NOT NULL, statement TEXT, source TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS demi_support (
+    demi_regularity_id TEXT NOT NULL, cmo_id TEXT NOT NULL, source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cmos_file ON cmos(file_id);
+CREATE INDEX IF NOT EXISTS idx_theme_members_cmo ON theme_members(cmo_id);
+CREATE INDEX IF NOT EXISTS idx_theme_members_theme ON theme_members(theme_id);
+CREATE INDEX IF NOT EXISTS idx_family_assignments_family ON family_assignments(family_id);
+CREATE INDEX IF NOT EXISTS idx_demi_theme_cmos_theme ON demi_theme_cmos(theme_id);
+CREATE INDEX IF NOT EXISTS idx_demi_regularities_theme ON demi_regularities(theme_id);
+CREATE INDEX IF NOT EXISTS idx_demi_support_cmo ON demi_support(cmo_id);
+"""
+_SOURCE_TABLES = (
+    "cmos",
+    "files",
+    "themes",
+    "theme_members",
+    "families",
+    "family_assignments",
+    "demi_theme_cmos",
+    "demi_regularities",
+    "demi_support",
+)
+
+
+@dataclass(frozen=True)
+class Issue:
+    check: str
+    subject: str
+    ids: tuple[str, ...]
+
+
+def discover_sources(
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    themes_dir: Path = DEFAULT_THEMES_DIR,
+    family_mapping: Path = DEFAULT_FAMILY_MAPPING,
+) -> list[Path]:
+    paths = cmo_yaml_paths(cmo_dir)
+    paths.append(Path(themes_dir) / "proto_themes.yml")
+    paths.extend(sorted(Path(themes_dir).glob("demi_regularities_PM*.yml")))
+    paths.append(Path(family_mapping))
+    return [p for p in paths if p.is_file()]
+
+
+def _file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _source_kind(data: Any) -> str:
+    if not isinstance(data, dict):
+        return "unknown"
+    if "pdf_to_bibtex_key" in data:
+        return "bibtex_map"
+    if "proto_mechanism_themes" in data:
+        return "proto_themes"
+    if "demi_regularities_by_theme" in data:
+        return "demi_regularities"
+    if "assignments" in data and "families" in data:
+        return "outcome_families"
+    if is_cmo_document_map(data):
+        return "cmo"
+    return "unknown"
+
+
+def _rows_for_source(kind: str, data: dict) -> dict[str, list[tuple]]:
+    rows: dict[str, list[tuple]] = {table: [] for table in _SOURCE_TABLES}
+    if kind == "cmo":
+        for file_id, doc in data.items():
+            for cmo_id in ((doc or {}).get("cmos") or {}):
+                rows["cmos"].append((cmo_id, file_id))
+    elif kind == "bibtex_map":
+        for file_id, key in (data.get("pdf_to_bibtex_key") or {}).items():
+            rows["files"].append((file_id, key))
+    elif kind == "proto_themes":
+        for theme in data.get("proto_mechanism_themes", []) or []:
+            theme_id = theme.get("theme_id")
+            rows["themes"].append((theme_id, theme.get("theme_label")))
+            for m in theme.get("mechanisms", []) or []:
+                if m.get("id"):
+                    rows["theme_members"].append((theme_id, m["id"], "mechanism"))
+        for m in data.get("ambiguous_mechanisms", []) or []:
+            for theme_id in m.get("possible_themes", []) or []:
+                if m.get("id"):
+                    rows["theme_members"].append((theme_id, m["id"], "ambiguous"))
+    elif kind == "demi_regularities":
+        for theme in data.get("demi_regularities_by_theme", []) or []:
+            theme_id = theme.get("theme_id")
+            for cmo_id in theme.get("cmo_ids_in_theme", []) or []:
+                rows["demi_theme_cmos"].append((theme_id, cmo_id, "in_theme"))
+            for cmo_id in theme.get("missing_cmo_ids", []) or []:
+                rows["demi_theme_cmos"].append((theme_id, cmo_id, "missing"))
+            for dr in theme.get("demi_regularities", []) or []:
+                dr_id = dr.get("demi_regularity_id")
+                if not dr_id:
+                    continue
+                rows["demi_regularities"].append((dr_id, theme_id, dr.get("statement")))
+                for cmo_id in dict.fromkeys(dr.get("supporting_cmo_ids", []) or []):
+                    rows["demi_support"].append((dr_id, cmo_id))
+    elif kind == "outcome_families":
+        for family_id, family in (data.get("families") or {}).items():
+            rows["families"].append((family_id, (family or {}).get("label")))
+        for cmo_id, assignment in (data.get("assignments") or {}).items():
+            assignment = assignment or {}
+            rows["family_assignments"].append(
+                (cmo_id, assignment.get("family_id") or "", assignment.get("confidence"))
+            )
+    return rows
+
+
+class IdIndex:
+    def __init__(self, path: Path = DEFAULT_INDEX):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+        version = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if version is None or int(version[0]) != _SCHEMA_VERSION:
+            for table in _SOURCE_TABLES + ("sources",):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+                (str(_SCHEMA_VERSION),),
+            )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def refresh(self, sources: list[Path], force: bool = False) -> list[str]:
+        # Re-index changed/new sources and drop vanished ones; returns re-indexed paths.
+        prof = get_profiler()
+        known = {
+            row[0]: row[1:]
+            for row in self.conn.execute("SELECT path, sha256, mtime_ns, size FROM sources")
+        }
+        wanted = {p.as_posix(): p for p in sources}
+        changed: list[Path] = []
+        hashes: dict[str, str] = {}
+        for key, path in wanted.items():
+            stat = path.stat()
+            previous = known.get(key)
+            if not force and previous and previous[1:] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            sha256 = _file_sha256(path)
+            if not force and previous and previous[0] == sha256:
+                self.conn.execute(
+                    "UPDATE sources SET mtime_ns = ?, size = ? WHERE path = ?",
+                    (stat.st_mtime_ns, stat.st_size, key),
+                )
+                continue
+            hashes[key] = sha256
+            changed.append(path)
+        prof.cache(hits=len(wanted) - len(changed), misses=len(changed))
+
+        with self.conn:
+            for key in set(known) - set(wanted):
+                self._delete_source(key)
+            for loaded in load_yaml_files(changed):
+                key = loaded.path.as_posix()
+                kind = _source_kind(loaded.data)
+                self._delete_source(key)
+                for table, table_rows in _rows_for_source(kind, loaded.data or {}).items():
+                    if not table_rows:
+                        continue
+                    placeholders = ", ".join("?" * (len(table_rows[0]) + 1))
+                    self.conn.executemany(
+                        f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})",
+                        [row + (key,) for row in table_rows],
+                    )
+                    prof.rows(len(table_rows))
+                stat = loaded.path.stat()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, kind, hashes[key], stat.st_mtime_ns, stat.st_size, time.time()),
+                )
+        return [p.as_posix() for p in changed]
+
+    def _delete_source(self, key: str) -> None:
+        for table in _SOURCE_TABLES:
+            self.conn.execute(f"DELETE FROM {table} WHERE source = ?", (key,))
+        self.conn.execute("DELETE FROM sources WHERE path = ?", (key,))
+
+    def _column(self, sql: str, *params: Any) -> list[str]:
+        return [row[0] for row in self.conn.execute(sql, params)]
+
+    def cmo(self, cmo_id: str) -> dict | None:
+        row = self.conn.execute(
+            "SELECT c.file_id, f.bibtex_key, fa.family_id, fa.confidence FROM cmos c "
+            "LEFT JOIN files f ON f.file_id = c.file_id "
+            "LEFT JOIN family_assignments fa ON fa.cmo_id = c.cmo_id WHERE c.cmo_id = ?",
+            (cmo_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "cmo_id": cmo_id,
+            "file_id": row[0],
+            "bibtex_key": row[1],
+            "family_id": row[2],
+            "family_confidence": row[3],
+            "theme_ids": self._column(
+                "SELECT theme_id FROM theme_members WHERE cmo_id = ? AND role = 'mechanism' "
+                "ORDER BY theme_id",
+                cmo_id,
+            ),
+            "ambiguous_theme_ids": self._column(
+                "SELECT theme_id FROM theme_members WHERE cmo_id = ? AND role = 'ambiguous' "
+                "ORDER BY theme_id",
+                cmo_id,
+            ),
+            "demi_regularity_ids": self._column(
+                "SELECT demi_regularity_id FROM demi_support WHERE cmo_id = ? ORDER BY 1", cmo_id
+            ),
+        }
+
+    def theme(self, theme_id: str) -> dict | None:
+        row = self.conn.execute(
+            "SELECT theme_label FROM themes WHERE theme_id = ?", (theme_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "theme_id": theme_id,
+            "theme_label": row[0],
+            "cmo_ids": self._column(
+                "SELECT cmo_id FROM theme_members WHERE theme_id = ? AND role = 'mechanism'",
+                theme_id,
+            ),
+            "ambiguous_cmo_ids": self._column(
+                "SELECT cmo_id FROM theme_members WHERE theme_id = ? AND role = 'ambiguous'",
+                theme_id,
+            ),
+            "demi_regularity_ids": self._column(
+                "SELECT demi_regularity_id FROM demi_regularities WHERE theme_id = ? ORDER BY 1",
+                theme_id,
+            ),
+        }
+
+    def family(self, family_id: str) -> dict | None:
+        row = self.conn.execute(
+            "SELECT label FROM families WHERE family_id = ?", (family_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "family_id": family_id,
+            "label": row[0],
+            "cmo_ids": self._column(
+                "SELECT cmo_id FROM family_assignments WHERE family_id = ? ORDER BY 1", family_id
+            ),
+        }
+
+    def demi_regularity(self, demi_regularity_id: str) -> dict | None:
+        row = self.conn.execute(
+            "SELECT theme_id, statement FROM demi_regularities WHERE demi_regularity_id = ?",
+            (demi_regularity_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "demi_regularity_id": demi_regularity_id,
+            "theme_id": row[0],
+            "statement": row[1],
+            "supporting_cmo_ids": self._column(
+                "SELECT cmo_id FROM demi_support WHERE demi_regularity_id = ?", demi_regularity_id
+            ),
+        }
+
+    def file(self, file_id: str) -> dict | None:
+        cmo_ids = self._column("SELECT cmo_id FROM cmos WHERE file_id = ? ORDER BY 1", file_id)
+        key = self._column("SELECT bibtex_key FROM files WHERE file_id = ?", file_id)
+        if not cmo_ids and not key:
+            return None
+        return {"file_id": file_id, "bibtex_key": key[0] if key else None, "cmo_ids": cmo_ids}
+
+    def check(self) -> list[Issue]:
+        issues: list[Issue] = []
+
+        def add(check: str, subject: str, sql: str, *params: Any) -> None:
+            ids = self._column(sql, *params)
+            if ids:
+                issues.append(Issue(check, subject, tuple(ids)))
+
+        add(
+            "cmo_without_family",
+            "outcome_family_mapping",
+            "SELECT cmo_id FROM cmos WHERE cmo_id NOT IN (SELECT cmo_id FROM family_assignments) "
+            "ORDER BY 1",
+        )
+        add(
+            "family_assignment_for_unknown_cmo",
+            "outcome_family_mapping",
+            "SELECT cmo_id FROM family_assignments WHERE cmo_id NOT IN (SELECT cmo_id FROM cmos) "
+            "ORDER BY 1",
+        )
+        add(
+            "invalid_family_id",
+            "outcome_family_mapping",
+            "SELECT cmo_id FROM family_assignments "
+            "WHERE family_id NOT IN (SELECT family_id FROM families) ORDER BY 1",
+        )
+        add(
+            "cmo_without_theme",
+            "proto_themes",
+            "SELECT cmo_id FROM cmos WHERE cmo_id NOT IN (SELECT cmo_id FROM theme_members) "
+            "ORDER BY 1",
+        )
+        add(
+            "theme_member_not_in_cmos",
+            "proto_themes",
+            "SELECT DISTINCT cmo_id FROM theme_members WHERE cmo_id NOT IN (SELECT cmo_id FROM cmos) "
+            "ORDER BY 1",
+        )
+        add(
+            "file_without_bibtex_key",
+            "pdf_to_bibtex_key",
+            "SELECT DISTINCT file_id FROM cmos WHERE file_id NOT IN (SELECT file_id FROM files) "
+            "ORDER BY 1",
+        )
+
+        # missing_cmo_ids must be exactly the theme's mechanism ids absent from the CMO
+        # YAML, and cmo_ids_in_theme the ones present.
+        for (theme_id,) in self.conn.execute(
+            "SELECT DISTINCT theme_id FROM demi_theme_cmos ORDER BY theme_id"
+        ).fetchall():
+            subject = f"demi_regularities_{theme_id}"
+            add(
+                "theme_cmo_not_listed_in_demi_file",
+                subject,
+                "SELECT cmo_id FROM theme_members WHERE theme_id = ?1 AND role = 'mechanism' "
+                "AND cmo_id IN (SELECT cmo_id FROM cmos) AND cmo_id NOT IN "
+                "(SELECT cmo_id FROM demi_theme_cmos WHERE theme_id = ?1 AND listed_as = 'in_theme') "
+                "ORDER BY 1",
+                theme_id,
+            )
+            add(
+                "demi_cmo_no_longer_in_theme",
+                subject,
+                "SELECT cmo_id FROM demi_theme_cmos WHERE theme_id = ?1 AND listed_as = 'in_theme' "
+                "AND cmo_id NOT IN (SELECT cmo_id FROM theme_members WHERE theme_id = ?1 "
+                "AND role = 'mechanism') ORDER BY 1",
+                theme_id,
+            )
+            add(
+                "missing_cmo_ids_stale",
+                subject,
+                "SELECT cmo_id FROM demi_theme_cmos WHERE theme_id = ?1 AND listed_as = 'missing' "
+                "AND cmo_id IN (SELECT cmo_id FROM cmos) ORDER BY 1",
+                theme_id,
+            )
+            add(
+                "missing_cmo_ids_unlisted",
+                subject,
+                "SELECT cmo_id FROM theme_members WHERE theme_id = ?1 AND role = 'mechanism' "
+                "AND cmo_id NOT IN (SELECT cmo_id FROM cmos) AND cmo_id NOT IN "
+                "(SELECT cmo_id FROM demi_theme_cmos WHERE theme_id = ?1 AND listed_as = 'missing') "
+                "ORDER BY 1",
+                theme_id,
+            )
+            add(
+                "supporting_cmo_outside_theme",
+                subject,
+                "SELECT DISTINCT s.cmo_id FROM demi_support s "
+                "JOIN demi_regularities d ON d.demi_regularity_id = s.demi_regularity_id "
+                "WHERE d.theme_id = ?1 AND s.cmo_id NOT IN "
+                "(SELECT cmo_id FROM demi_theme_cmos WHERE theme_id = ?1 AND listed_as = 'in_theme') "
+                "ORDER BY 1",
+                theme_id,
+            )
+        return issues
+
+
+def open_index(
+    index_path: Path = DEFAULT_INDEX,
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    themes_dir: Path = DEFAULT_THEMES_DIR,
+    family_mapping: Path = DEFAULT_FAMILY_MAPPING,
+    force: bool = False,
+) -> IdIndex:
+    index = IdIndex(index_path)
+    index.refresh(discover_sources(cmo_dir, themes_dir, family_mapping), force=force)
+    return index
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Build/query the SQLite index joining CMO, theme, family, demi-regularity and file ids."
+    )
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX)
+    parser.add_argument("--cmo-dir", type=Path, default=DEFAULT_CMO_DIR)
+    parser.add_argument("--themes-dir", type=Path, default=DEFAULT_THEMES_DIR)
+    parser.add_argument("--family-mapping", type=Path, default=DEFAULT_FAMILY_MAPPING)
+    parser.add_argument("--force", action="store_true", help="Re-index every source file.")
+    lookup = parser.add_mutually_exclusive_group()
+    lookup.add_argument("--cmo", help="Look up a cmo_id.")
+    lookup.add_argument("--theme", help="Look up a theme_id.")
+    lookup.add_argument("--family", help="Look up a family_id.")
+    lookup.add_argument("--demi", help="Look up a demi_regularity_id.")
+    lookup.add_argument("--file", help="Look up a file_id (PDF name).")
+    lookup.add_argument(
+        "--check",
+        action="store_true",
+        help="Check missing_cmo_ids / coverage consistency across the artefacts.",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profile_session(args, "id_index"):
+        prof = get_profiler()
+        start = time.perf_counter()
+        with prof.stage("refresh"):
+            index = IdIndex(args.index)
+            sources = discover_sources(args.cmo_dir, args.themes_dir, args.family_mapping)
+            refreshed = index.refresh(sources, force=args.force)
+        refresh_ms = (time.perf_counter() - start) * 1000
+
+        try:
+            for flag, method in (
+                ("cmo", index.cmo),
+                ("theme", index.theme),
+                ("family", index.family),
+                ("demi", index.demi_regularity),
+                ("file", index.file),
+            ):
+                value = getattr(args, flag)
+                if value is None:
+                    continue
+                with prof.stage("query"):
+                    result = method(value)
+                if result is None:
+                    print(f"Not found: {value}", file=sys.stderr)
+                    return 1
+                print(yaml.safe_dump(result, sort_keys=False, allow_unicode=True, width=120), end="")
+                return 0
+
+            if args.check:
+                start = time.perf_counter()
+                with prof.stage("check"):
+                    issues = index.check()
+                check_ms = (time.perf_counter() - start) * 1000
+                for issue in issues:
+                    print(f"- {issue.check} [{issue.subject}]: {len(issue.ids)} id(s)")
+                    for item in issue.ids[:10]:
+                        print(f"    {item}")
+                    if len(issue.ids) > 10:
+                        print(f"    ... {len(issue.ids) - 10} more")
+                print(
+                    f"{len(issues)} consistency issue(s); refresh {refresh_ms:.0f} ms "
+                    f"({len(refreshed)} source(s) re-indexed), check {check_ms:.0f} ms."
+                )
+                return 1 if issues else 0
+        finally:
+            index.close()
+
+    print(
+        f"Index {args.index.as_posix()}: {len(sources)} source(s), "
+        f"{len(refreshed)} re-indexed in {refresh_ms:.0f} ms."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
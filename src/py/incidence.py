@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from cmo_store import cmo_yaml_paths
+from derived_data import load_families, replace_directory, source_md5s, split_values
+from profiling import add_profile_arguments, get_profiler, profile_session
+from proto_themes import DEFAULT_PROTO_THEMES, load_proto_themes
+
+DEFAULT_DIR = Path("data/cache/incidence")
+DEFAULT_CMO_DIR = Path("data/cmo")
+DEFAULT_TABLE_CACHE = Path("data/cache/cmo_statements.parquet")
+DEFAULT_FAMILIES = Path("data/outcome_family_mapping.yml")
+# Bump when matrix layout or crosstab columns change so old caches are rebuilt.
+INCIDENCE_VERSION = 1
+DIMENSIONS = ("theme", "rq", "country", "family")
+
+# scipy and pandas are imported inside the functions that build or multiply the
+# matrices, so checking the cache is cheap.
+
+
+@dataclass(frozen=True)
+class Incidence:
+    dim: str
+    matrix: object  # scipy.sparse.csr_matrix (n_cmo, n_values), 0/1 int32
+    columns: tuple[str, ...]
+    labels: tuple[str, ...]
+
+
+def _natural_key(value: str) -> list:
+    # rq2 before rq10; the UNMAPPED_* column always last.
+    return [value.startswith("UNMAPPED_")] + [
+        (0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", value) if part
+    ]
+
+
+def source_paths(
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    proto_themes: Path = DEFAULT_PROTO_THEMES,
+    families: Path = DEFAULT_FAMILIES,
+) -> list[Path]:
+    return [*cmo_yaml_paths(cmo_dir), Path(proto_themes), Path(families)]
+
+
+def row_values(df, themes, families: dict[str, str], assignments: dict[str, str]) -> dict[str, dict]:
+    # dim -> {"rows": [values per CMO row], "labels": {value: label}}
+    members: dict[str, list[str]] = {}
+    theme_labels = {}
+    for theme, mechanisms in themes.iter_members():
+        theme_labels[theme.theme_id] = theme.label
+        for m in mechanisms:
+            if m.id:
+                members.setdefault(m.id, []).append(theme.theme_id)
+    chunk_ids = df["chunk_id"].astype(str).tolist()
+    return {
+        "theme": {"rows": [members.get(c, []) for c in chunk_ids], "labels": theme_labels},
+        "rq": {"rows": [split_values(v) for v in df["research_question_mapped"].tolist()], "labels": {}},
+        "country": {"rows": [split_values(v) for v in df["country"].tolist()], "labels": {}},
+        "family": {
+            "rows": [[assignments[c]] if c in assignments else [] for c in chunk_ids],
+            "labels": families,
+        },
+    }
+
+
+def build_incidence(dim: str, rows: list[list[str]], labels: dict[str, str]) -> Incidence:
+    import numpy as np
+    from scipy import sparse
+
+    unmapped = f"UNMAPPED_{dim.upper()}"
+    rows = [list(dict.fromkeys(values)) or [unmapped] for values in rows]
+    columns = sorted({v for values in rows for v in values}, key=_natural_key)
+    col_of = {v: j for j, v in enumerate(columns)}
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(values) for values in rows])
+    indices = np.fromiter((col_of[v] for values in rows for v in values), dtype=np.int32, count=int(indptr[-1]))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(len(rows), len(columns))
+    )
+    matrix.sort_indices()
+    label_list = tuple(
+        f"Unmapped {dim}" if v == unmapped else labels.get(v) or v for v in columns
+    )
+    return Incidence(dim, matrix, tuple(columns), label_list)
+
+
+class IncidenceSet:
+    def __init__(self, directory: Path, rows: tuple[str, ...], dims: dict[str, Incidence], manifest: dict) -> None:
+        self.directory = Path(directory)
+        self.rows = rows
+        self.dims = dims
+        self.manifest = manifest
+
+    def matrix(self, dim: str):
+        return self.dims[dim].matrix
+
+    def crosstab(self, a: str, b: str):
+        # Counts of CMO rows per (a value, b value): A.T @ B. Results are cached as
+        # CSV next to the matrices and go stale with them.
+        import pandas as pd
+
+        path = self.directory / "crosstabs" / f"{a}__{b}.csv"
+        if path.exists():
+            return pd.read_csv(path, keep_default_na=False)
+        table = crosstab_frame(self.dims[a], self.dims[b])
+        _write_csv(table, path)
+        return table
+
+    def cooccurrence(self, dim: str):
+        return self.crosstab(dim, dim)
+
+
+def crosstab_frame(a: Incidence, b: Incidence):
+    import pandas as pd
+
+    counts = (a.matrix.T @ b.matrix).toarray()
+    table = pd.DataFrame(counts, columns=list(b.columns))
+    table.insert(0, f"{a.dim}_label", list(a.labels))
+    table.insert(0, f"{a.dim}_id", list(a.columns))
+    table["total"] = counts.sum(axis=1)
+    table = table[table["total"] > 0]
+    return table.sort_values(["total", f"{a.dim}_id"], ascending=[False, True]).reset_index(drop=True)
+
+
+def _write_csv(table, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}-", dir=path.parent)
+    with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+        table.to_csv(f, index=False)
+    os.replace(tmp, path)
+
+
+def _read_manifest(directory: Path) -> dict | None:
+    path = Path(directory) / "manifest.json"
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except ValueError:
+        return None
+
+
+def is_current(manifest: dict | None, sources: list[Path]) -> bool:
+    if not manifest or manifest.get("version") != INCIDENCE_VERSION:
+        return False
+    return manifest.get("sources") == source_md5s(sources)
+
+
+def write_incidence(
+    directory: Path = DEFAULT_DIR,
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    table_cache: Path = DEFAULT_TABLE_CACHE,
+    proto_themes: Path = DEFAULT_PROTO_THEMES,
+    families_path: Path = DEFAULT_FAMILIES,
+) -> IncidenceSet:
+    from scipy import sparse
+
+    from cmo_table import load_cmo_statements
+
+    prof = get_profiler()
+    sources = source_paths(cmo_dir, proto_themes, families_path)
+    with prof.stage("load"):
+        df = load_cmo_statements(cmo_dir, table_cache)
+        themes = load_proto_themes(proto_themes)
+        families, assignments = load_families(families_path)
+        prof.rows(len(df))
+
+    with prof.stage("build"):
+        values = row_values(df, themes, families, assignments)
+        dims = {dim: build_incidence(dim, values[dim]["rows"], values[dim]["labels"]) for dim in DIMENSIONS}
+        rows = tuple(df["chunk_id"].astype(str).tolist())
+        prof.rows(sum(inc.matrix.nnz for inc in dims.values()))
+
+    # Built in a sibling temp dir and swapped in, so readers never see a mix of
+    # old matrices and new crosstabs.
+    directory = Path(directory)
+    with replace_directory(directory) as tmp:
+        with prof.stage("write"):
+            (tmp / "rows.txt").write_text("\n".join(rows) + "\n", encoding="utf-8")
+            dim_info = {}
+            for dim, inc in dims.items():
+                sparse.save_npz(tmp / f"{dim}.npz", inc.matrix)
+                per_row = inc.matrix.getnnz(axis=1)
+                unmapped = f"UNMAPPED_{dim.upper()}"
+                dim_info[dim] = {
+                    "file": f"{dim}.npz",
+                    "columns": list(inc.columns),
+                    "labels": list(inc.labels),
+                    "nnz": int(inc.matrix.nnz),
+                    "unmapped_rows": int(inc.matrix[:, inc.columns.index(unmapped)].nnz)
+                    if unmapped in inc.columns
+                    else 0,
+                    "multi_valued": {rows[i]: int(per_row[i]) for i in per_row.nonzero()[0] if per_row[i] > 1},
+                }
+            # Every pair is a handful of small sparse products; precompute them all.
+            crosstabs = {}
+            for i, a in enumerate(DIMENSIONS):
+                for b in DIMENSIONS[i:]:
+                    name = f"{a}__{b}"
+                    _write_csv(crosstab_frame(dims[a], dims[b]), tmp / "crosstabs" / f"{name}.csv")
+                    crosstabs[name] = f"crosstabs/{name}.csv"
+            manifest = {
+                "version": INCIDENCE_VERSION,
+                "built": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "n_rows": len(rows),
+                "dims": dim_info,
+                "crosstabs": crosstabs,
+                # Repo-relative source paths -> md5; readers rebuild (or fall back)
+                # when any of these changed.
+                "sources": source_md5s(sources),
+            }
+            (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+            prof.rows(len(crosstabs))
+    return IncidenceSet(directory, rows, dims, manifest)
+
+
+def read_incidence(directory: Path, manifest: dict) -> IncidenceSet:
+    from scipy import sparse
+
+    directory = Path(directory)
+    rows = tuple((directory / "rows.txt").read_text(encoding="utf-8").splitlines())
+    dims = {
+        dim: Incidence(dim, sparse.load_npz(directory / info["file"]).tocsr(), tuple(info["columns"]), tuple(info["labels"]))
+        for dim, info in manifest["dims"].items()
+    }
+    return IncidenceSet(directory, rows, dims, manifest)
+
+
+def load_incidence(
+    directory: Path = DEFAULT_DIR,
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    table_cache: Path = DEFAULT_TABLE_CACHE,
+    proto_themes: Path = DEFAULT_PROTO_THEMES,
+    families_path: Path = DEFAULT_FAMILIES,
+    rebuild: bool = False,
+) -> IncidenceSet:
+    prof = get_profiler()
+    manifest = _read_manifest(directory)
+    if not rebuild and is_current(manifest, source_paths(cmo_dir, proto_themes, families_path)):
+        prof.cache(hits=1)
+        return read_incidence(directory, manifest)
+    prof.cache(misses=1)
+    return write_incidence(directory, cmo_dir, table_cache, proto_themes, families_path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Build sparse CMO x theme/RQ/country/family incidence matrices and answer crosstab and "
+            "co-occurrence queries from them (results cached as CSV)."
+        )
+    )
+    parser.add_argument("--dir", type=Path, default=DEFAULT_DIR)
+    parser.add_argument("--cmo-dir", type=Path, default=DEFAULT_CMO_DIR)
+    parser.add_argument("--table-cache", type=Path, default=DEFAULT_TABLE_CACHE)
+    parser.add_argument("--proto-themes", type=Path, default=DEFAULT_PROTO_THEMES)
+    parser.add_argument("--families", type=Path, default=DEFAULT_FAMILIES)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Refresh the matrices and precomputed crosstabs if a source changed.")
+    build.add_argument("--rebuild", action="store_true", help="Rebuild even when the cache is current.")
+    cross = sub.add_parser("crosstab", help="CMO counts per ROWS value x COLS value (same dim = co-occurrence).")
+    cross.add_argument("rows", choices=DIMENSIONS)
+    cross.add_argument("cols", choices=DIMENSIONS)
+    cross.add_argument("--output", type=Path, default=None, help="Write CSV here instead of stdout.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profile_session(args, "incidence"):
+        incidence = load_incidence(
+            args.dir,
+            args.cmo_dir,
+            args.table_cache,
+            args.proto_themes,
+            args.families,
+            rebuild=getattr(args, "rebuild", False),
+        )
+        if args.command == "crosstab":
+            with get_profiler().stage("crosstab"):
+                table = incidence.crosstab(args.rows, args.cols)
+
+    if args.command == "build":
+        for dim, info in incidence.manifest["dims"].items():
+            print(
+                f"{dim}: {len(info['columns'])} column(s), {info['nnz']} entries, "
+                f"{info['unmapped_rows']} unmapped and {len(info['multi_valued'])} multi-valued row(s)"
+            )
+        print(f"{len(incidence.rows)} CMO rows; {incidence.directory.as_posix()} built {incidence.manifest['built']}")
+        return 0
+    if args.output:
+        _write_csv(table, args.output)
+        print(f"Wrote {args.output.as_posix()} ({len(table)} rows)")
+    else:
+        table.to_csv(sys.stdout, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
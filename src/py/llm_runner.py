@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import os
+import random
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import openai
+import yaml
+from dotenv import load_dotenv
+
+DEFAULT_CACHE = Path("data/cache/llm_responses.sqlite")
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class RunTarget:
+    target_id: str
+    input_path: Path
+    output_path: Path
+
+
+@dataclass(frozen=True)
+class Completion:
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    finish_reason: str | None = None
+
+
+@dataclass(frozen=True)
+class RunResult:
+    target: RunTarget
+    status: str  # cached | completed | incomplete | failed
+    cache_key: str
+    seconds: float
+    attempts: int = 0
+    error: str = ""
+
+
+CompleteFn = Callable[[str], Awaitable[Completion]]
+
+
+def _output_path_for(input_path: Path, logs_dir: Path) -> Path:
+    stem = input_path.stem
+    if stem.endswith("_input"):
+        stem = stem[: -len("_input")]
+    return logs_dir / f"{stem}_output.yml"
+
+
+def load_manifest(manifest_path: Path, logs_dir: Path) -> list[RunTarget]:
+    # Accepts the audit index.tsv (output_path column) or a batches manifest.yml.
+    manifest_path = Path(manifest_path)
+    targets: list[RunTarget] = []
+    if manifest_path.suffix in {".yml", ".yaml"}:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = yaml.safe_load(f) or {}
+        for batch in manifest.get("batches", []) or []:
+            input_path = Path(batch["path"])
+            targets.append(
+                RunTarget(
+                    target_id=str(batch.get("batch_id") or input_path.stem),
+                    input_path=input_path,
+                    output_path=_output_path_for(input_path, logs_dir),
+                )
+            )
+        return targets
+
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+        for row in reader:
+            input_path = Path(row.get("output_path") or row.get("path") or "")
+            if not input_path.name:
+                continue
+            target_id = row.get("theme_id") or row.get("batch_id") or input_path.stem
+            targets.append(
+                RunTarget(
+                    target_id=target_id,
+                    input_path=input_path,
+                    output_path=_output_path_for(input_path, logs_dir),
+                )
+            )
+    return targets
+
+
+def cache_key(model: str, prompt: str, temperature: float, max_output_tokens: int) -> str:
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(f"{temperature:g}".encode("utf-8"))
+    h.update(b"\0")
+    h.update(str(max_output_tokens).encode("ascii"))
+    h.update(b"\0")
+    h.update(prompt.encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get(self, key: str) -> Completion | None:
+        row = self.conn.execute(
+            "SELECT response, prompt_tokens, completion_tokens FROM responses WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        return Completion(text=row[0], prompt_tokens=row[1], completion_tokens=row[2])
+
+    def put(self, key: str, model: str, completion: Completion) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses "
+            "(key, model, response, prompt_tokens, completion_tokens, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                model,
+                completion.text,
+                completion.prompt_tokens,
+                completion.completion_tokens,
+                time.time(),
+            ),
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class TokenRateLimiter:
+    # Token bucket refilled continuously at tokens_per_minute / 60 per second.
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.available = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> None:
+        if self.capacity <= 0:
+            return
+        tokens = min(float(tokens), self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                await asyncio.sleep((tokens - self.available) / self.rate)
+
+
+def estimate_tokens(prompt: str, max_output_tokens: int) -> int:
+    return len(prompt) // 4 + max_output_tokens
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return getattr(exc, "status_code", None) in _RETRYABLE_STATUS
+
+
+def _write_text_atomic(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _write_output(path: Path, text: str) -> None:
+    if not text.endswith("\n"):
+        text += "\n"
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return
+    _write_text_atomic(path, text)
+
+
+async def run_targets(
+    targets: list[RunTarget],
+    complete: CompleteFn,
+    cache: ResponseCache,
+    model: str,
+    temperature: float = 0.0,
+    prompt_template: str = "",
+    concurrency: int = 4,
+    tokens_per_minute: int = 0,
+    max_output_tokens: int = 4096,
+    max_retries: int = 5,
+    backoff_seconds: float = 2.0,
+) -> list[RunResult]:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    limiter = TokenRateLimiter(tokens_per_minute)
+
+    async def run_one(target: RunTarget) -> RunResult:
+        start = time.perf_counter()
+        prompt = target.input_path.read_text(encoding="utf-8")
+        if prompt_template:
+            prompt = prompt_template.rstrip() + "\n\n" + prompt
+        key = cache_key(model, prompt, temperature, max_output_tokens)
+
+        cached = cache.get(key)
+        if cached is not None:
+            _write_output(target.output_path, cached.text)
+            return RunResult(target, "cached", key, time.perf_counter() - start)
+
+        attempts = 0
+        async with semaphore:
+            while True:
+                attempts += 1
+                await limiter.acquire(estimate_tokens(prompt, max_output_tokens))
+                try:
+                    completion = await complete(prompt)
+                    break
+                except Exception as exc:  # noqa: BLE001 - surfaced in the result
+                    if attempts > max_retries or not _is_retryable(exc):
+                        return RunResult(
+                            target,
+                            "failed",
+                            key,
+                            time.perf_counter() - start,
+                            attempts,
+                            f"{type(exc).__name__}: {exc}",
+                        )
+                    delay = backoff_seconds * 2 ** (attempts - 1)
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+        # Truncated or empty responses are neither cached nor written, so a rerun
+        # (e.g. with a larger --max-output-tokens) asks again.
+        problem = _incomplete_reason(completion, max_output_tokens)
+        if problem:
+            return RunResult(target, "incomplete", key, time.perf_counter() - start, attempts, problem)
+        cache.put(key, model, completion)
+        _write_output(target.output_path, completion.text)
+        return RunResult(target, "completed", key, time.perf_counter() - start, attempts)
+
+    return list(await asyncio.gather(*(run_one(t) for t in targets)))
+
+
+def _incomplete_reason(completion: Completion, max_output_tokens: int) -> str:
+    if completion.finish_reason == "length":
+        return f"response cut off at --max-output-tokens {max_output_tokens}"
+    if not completion.text.strip():
+        return f"empty response (finish_reason {completion.finish_reason})"
+    return ""
+
+
+def openai_completer(
+    model: str,
+    temperature: float,
+    max_output_tokens: int,
+    base_url: str | None = None,
+    timeout: float = 600.0,
+) -> CompleteFn:
+    # SDK retries are disabled; run_targets owns retry/backoff.
+    client = openai.AsyncOpenAI(base_url=base_url, max_retries=0, timeout=timeout)
+
+    async def complete(prompt: str) -> Completion:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_output_tokens,
+        )
+        usage = response.usage
+        choice = response.choices[0]
+        return Completion(
+            text=choice.message.content or "",
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            finish_reason=choice.finish_reason,
+        )
+
+    return complete
+
+
+def _write_run_log(path: Path, results: list[RunResult]) -> None:
+    lines = ["target_id\tstatus\tattempts\tseconds\tcache_key\toutput_path\terror"]
+    for r in results:
+        lines.append(
+            f"{r.target.target_id}\t{r.status}\t{r.attempts}\t{r.seconds:.2f}\t{r.cache_key}\t"
+            f"{r.target.output_path.as_posix()}\t{r.error.replace(chr(9), ' ').replace(chr(10), ' ')}"
+        )
+    _write_text_atomic(path, "\n".join(lines) + "\n")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Run prompt files listed in a manifest through an LLM with caching and rate limits."
+    )
+    parser.add_argument(
+        "manifest",
+        type=Path,
+        help="Audit index.tsv (output_path column) or batches manifest.yml.",
+    )
+    parser.add_argument(
+        "--logs-dir",
+        type=Path,
+        default=Path("data/mechanism_themes/logs"),
+        help="Directory for <target>_output.yml responses and run_log.tsv.",
+    )
+    parser.add_argument(
+        "--prompt-template",
+        type=Path,
+        default=None,
+        help="Prompt prepended to each input (e.g. prompts/iterate_mechanism_theme.md for batches).",
+    )
+    parser.add_argument("--model", default="gpt-4.1")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--max-output-tokens", type=int, default=16000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--tokens-per-minute",
+        type=int,
+        default=0,
+        help="Token-rate limit across all requests (0 disables).",
+    )
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument(
+        "--base-url",
+        default=None,
+        help="OpenAI-compatible endpoint (e.g. a local stub server); default from OPENAI_BASE_URL.",
+    )
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE)
+    parser.add_argument(
+        "--only",
+        nargs="*",
+        default=None,
+        help="Restrict to these target ids.",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    targets = load_manifest(args.manifest, args.logs_dir)
+    if args.only:
+        wanted = set(args.only)
+        targets = [t for t in targets if t.target_id in wanted]
+    if not targets:
+        print("No targets found in manifest.", file=sys.stderr)
+        return 2
+
+    prompt_template = ""
+    if args.prompt_template:
+        prompt_template = args.prompt_template.read_text(encoding="utf-8")
+
+    cache = ResponseCache(args.cache)
+    try:
+        results = asyncio.run(
+            run_targets(
+                targets,
+                complete=openai_completer(
+                    args.model, args.temperature, args.max_output_tokens, base_url=args.base_url
+                ),
+                cache=cache,
+                model=args.model,
+                temperature=args.temperature,
+                prompt_template=prompt_template,
+                concurrency=args.concurrency,
+                tokens_per_minute=args.tokens_per_minute,
+                max_output_tokens=args.max_output_tokens,
+                max_retries=args.max_retries,
+            )
+        )
+    finally:
+        cache.close()
+
+    _write_run_log(args.logs_dir / "run_log.tsv", results)
+    for r in results:
+        suffix = f" ({r.error})" if r.error else ""
+        print(f"- {r.target.target_id}: {r.status} in {r.seconds:.1f}s{suffix}")
+    counts = {
+        s: sum(1 for r in results if r.status == s) for s in ("cached", "completed", "incomplete", "failed")
+    }
+    print(
+        f"{counts['completed']} completed, {counts['cached']} cached, {counts['incomplete']} incomplete, "
+        f"{counts['failed']} failed. Run log: {(args.logs_dir / 'run_log.tsv').as_posix()}"
+    )
+    return 1 if counts["failed"] or counts["incomplete"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
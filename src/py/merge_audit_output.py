@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+
+import yaml
+
+from profiling import add_profile_arguments, get_profiler, profile_session
+
+_FENCE_RE = re.compile(r"^```[A-Za-z]*\s*$", re.MULTILINE)
+
+
+def _dump_yaml(data: dict) -> str:
+    return yaml.safe_dump(data, sort_keys=False, allow_unicode=True, width=120)
+
+
+def _write_text_atomic(path: Path, text: str) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def parse_audit_output(text: str) -> tuple[dict, dict]:
+    # The two YAML documents the audit prompt asks for; stray ``` fences are dropped.
+    docs = [d for d in yaml.safe_load_all(_FENCE_RE.sub("", text)) if d]
+    if len(docs) != 2:
+        raise ValueError(f"expected two YAML documents (themes, change log), found {len(docs)}")
+    themes, changes = docs
+    if not isinstance(themes, dict) or "proto_mechanism_themes" not in themes:
+        raise ValueError("document 1 has no proto_mechanism_themes")
+    if not isinstance(changes, dict) or "change_log" not in changes:
+        raise ValueError("document 2 has no change_log")
+    return themes, changes
+
+
+def parse_run_file(text: str) -> dict:
+    # The proto_themes_yml block the model was shown (full, or --trim-context).
+    m = re.search(r"^2\) proto_themes_yml\n```yaml\n(.*?)^```$", text, re.MULTILINE | re.DOTALL)
+    if not m:
+        raise ValueError("run file has no proto_themes_yml block")
+    return yaml.safe_load(m.group(1)) or {}
+
+
+def _theme_id(theme: dict) -> str:
+    return str(theme.get("theme_id", "")).strip()
+
+
+def _ids(mechanisms: list[dict]) -> list[str]:
+    return [m.get("id") for m in mechanisms or []]
+
+
+def merge_themes(proto: dict, shown: dict, returned: dict) -> tuple[dict, list[str]]:
+    # Themes shown with `mechanisms` are replaced by their returned version. Any
+    # other returned theme only receives mechanisms moved into it. The shown
+    # mechanisms (those themes plus the shown ambiguous entries) must come back
+    # exactly once each, and must still match proto_themes.yml, so a run file
+    # generated before another merge is refused instead of undoing that merge.
+    themes = list(proto.get("proto_mechanism_themes") or [])
+    ambiguous = list(proto.get("ambiguous_mechanisms") or [])
+    current = {_theme_id(t): t for t in themes}
+    shown_themes = {
+        _theme_id(t): _ids(t["mechanisms"]) for t in shown.get("proto_mechanism_themes") or [] if "mechanisms" in t
+    }
+    shown_ambiguous = set(_ids(shown.get("ambiguous_mechanisms")))
+    new_themes = {_theme_id(t): t for t in returned.get("proto_mechanism_themes") or []}
+    new_ambiguous = list(returned.get("ambiguous_mechanisms") or [])
+
+    unknown = sorted(set(new_themes) - set(current))
+    if unknown:
+        raise ValueError(f"output has theme(s) not in proto_themes.yml: {', '.join(unknown)}")
+    missing = sorted(set(shown_themes) - set(new_themes))
+    if missing:
+        raise ValueError(f"output omits shown theme(s): {', '.join(missing)}")
+    stale = sorted(
+        t for t, ids in shown_themes.items() if t not in current or _ids(current[t].get("mechanisms")) != ids
+    )
+    if stale or not shown_ambiguous <= set(_ids(ambiguous)):
+        raise ValueError(
+            "proto_themes.yml changed since the run file was generated"
+            + (f" (theme(s) {', '.join(stale)})" if stale else " (ambiguous_mechanisms)")
+        )
+
+    before = Counter(i for ids in shown_themes.values() for i in ids)
+    before.update(shown_ambiguous)
+    after = Counter(i for t in new_themes.values() for i in _ids(t.get("mechanisms")))
+    after.update(_ids(new_ambiguous))
+    problems = []
+    lost = sorted(set(before) - set(after))
+    added = sorted(set(after) - set(before))
+    duplicated = sorted(i for i, n in after.items() if i in before and n > before[i])
+    if lost:
+        problems.append(f"missing mechanism(s): {', '.join(lost)}")
+    if added:
+        problems.append(f"mechanism(s) that were not shown: {', '.join(added)}")
+    if duplicated:
+        problems.append(f"mechanism(s) listed more than once: {', '.join(duplicated)}")
+    if problems:
+        raise ValueError("; ".join(problems))
+
+    merged_themes = []
+    for theme in themes:
+        theme_id = _theme_id(theme)
+        if theme_id in shown_themes:
+            theme = new_themes[theme_id]
+        elif theme_id in new_themes:
+            moved = list(new_themes[theme_id].get("mechanisms") or [])
+            theme = dict(theme)
+            theme["mechanisms"] = list(theme.get("mechanisms") or []) + moved
+        merged_themes.append(theme)
+    by_id = {m.get("id"): m for m in new_ambiguous}
+    merged_ambiguous = []
+    for m in ambiguous:
+        if m.get("id") in by_id:
+            merged_ambiguous.append(by_id.pop(m.get("id")))
+        elif m.get("id") not in shown_ambiguous:
+            merged_ambiguous.append(m)
+    merged_ambiguous.extend(by_id.values())
+
+    merged = dict(proto)
+    merged["proto_mechanism_themes"] = merged_themes
+    merged["ambiguous_mechanisms"] = merged_ambiguous
+    return merged, sorted(new_themes)
+
+
+def _change_number(change: dict) -> int:
+    m = re.search(r"CHG_(\d+)$", str(change.get("change_id", "")))
+    return int(m.group(1)) if m else -1
+
+
+def merge_changelog(changelog: dict, returned: dict) -> tuple[dict, list[str]]:
+    # Appends the returned entries that are not already in the log (a full output
+    # echoes them). New entries are renumbered after the current latest change_id,
+    # since runs generated from the same log all continue from the same number.
+    changes = list(changelog.get("change_log") or [])
+    latest = max((_change_number(c) for c in changes), default=0)
+    added = []
+    for change in returned.get("change_log") or []:
+        if change in changes:
+            continue
+        latest += 1
+        change = dict(change)
+        change["change_id"] = f"CHG_{latest:03d}"
+        changes.append(change)
+        added.append(change["change_id"])
+    merged = dict(changelog)
+    merged["change_log"] = changes
+    return merged, added
+
+
+def run_file_for(output: Path, index_path: Path) -> Path:
+    # llm_runner writes logs/<run file stem>_output.yml for each row of the audit index.
+    stem = output.stem[: -len("_output")] if output.stem.endswith("_output") else output.stem
+    with open(index_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if Path(row.get("output_path") or "").stem == stem:
+                return Path(row["output_path"])
+    raise ValueError(f"no run file for it in {index_path.as_posix()}; pass --run-file")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Merge proto_theme_allocation_audit responses (full or --trim-context runs) back into "
+            "proto_themes.yml and proto_themes_changelog.yml."
+        )
+    )
+    parser.add_argument("outputs", nargs="+", type=Path, help="Model response file(s), e.g. logs/<run>_output.yml.")
+    parser.add_argument("--proto-themes", type=Path, default=Path("data/mechanism_themes/proto_themes.yml"))
+    parser.add_argument(
+        "--changelog", type=Path, default=Path("data/mechanism_themes/proto_themes_changelog.yml")
+    )
+    parser.add_argument(
+        "--index",
+        type=Path,
+        default=Path("data/mechanism_themes/audit_inputs/index.tsv"),
+        help="Audit index used to find the run file each output answers.",
+    )
+    parser.add_argument("--run-file", type=Path, default=None, help="Run file for a single output (skips --index).")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and report without writing.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    if args.run_file and len(args.outputs) > 1:
+        parser.error("--run-file applies to a single output")
+
+    with profile_session(args, "merge_audit_output"):
+        prof = get_profiler()
+        with prof.stage("load_yaml"):
+            proto = yaml.safe_load(args.proto_themes.read_text(encoding="utf-8")) or {}
+            changelog = yaml.safe_load(args.changelog.read_text(encoding="utf-8")) or {}
+        # Outputs are applied in order. One that fails validation (typically because an
+        # earlier merge touched the themes it was shown) is skipped and reported.
+        merged = []
+        failed = []
+        with prof.stage("merge"):
+            for path in args.outputs:
+                try:
+                    run_file = args.run_file or run_file_for(path, args.index)
+                    shown = parse_run_file(run_file.read_text(encoding="utf-8"))
+                    themes, changes = parse_audit_output(path.read_text(encoding="utf-8"))
+                    new_proto, theme_ids = merge_themes(proto, shown, themes)
+                    new_changelog, change_ids = merge_changelog(changelog, changes)
+                except (OSError, ValueError, yaml.YAMLError) as exc:
+                    print(f"{path.as_posix()}: {exc}", file=sys.stderr)
+                    failed.append(path)
+                    continue
+                proto, changelog = new_proto, new_changelog
+                merged.append(path)
+                print(
+                    f"{path.as_posix()}: {len(theme_ids)} theme(s) ({', '.join(theme_ids[:10])}"
+                    f"{', ...' if len(theme_ids) > 10 else ''}), "
+                    f"{len(change_ids)} new change(s)"
+                )
+                prof.rows(1)
+        if merged and not args.dry_run:
+            with prof.stage("write"):
+                _write_text_atomic(args.proto_themes, _dump_yaml(proto))
+                _write_text_atomic(args.changelog, _dump_yaml(changelog))
+            print(f"Wrote {args.proto_themes.as_posix()} and {args.changelog.as_posix()}")
+    if failed:
+        print(
+            f"{len(failed)} output(s) not merged; regenerate their run files from the updated YAML "
+            "(generate_proto_theme_allocation_audit_inputs.py) and re-run them.",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
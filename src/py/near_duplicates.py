@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import random
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+import yaml
+
+from profiling import add_profile_arguments, get_profiler, profile_session
+
+DEFAULT_OUTPUT = Path("data/mechanism_themes/near_duplicates.yml")
+FIELD_CHOICES = ("mechanism_statement", "context_statement", "outcome_statement")
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+@dataclass(frozen=True)
+class DuplicateCluster:
+    cluster_id: str
+    representative: str
+    members: tuple[str, ...]
+    mean_jaccard: float
+
+
+def shingles(text: str, k: int = 3) -> set[int]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < k:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i : i + k]) for i in range(len(words) - k + 1)]
+    return {
+        int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little")
+        for g in grams
+    }
+
+
+def _permutations(num_perm: int, seed: int) -> list[tuple[int, int]]:
+    rng = random.Random(seed)
+    return [
+        (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+        for _ in range(num_perm)
+    ]
+
+
+def minhash(shingle_set: set[int], perms: list[tuple[int, int]]) -> tuple[int, ...]:
+    if not shingle_set:
+        return tuple(_MAX_HASH for _ in perms)
+    return tuple(
+        min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in shingle_set) for a, b in perms
+    )
+
+
+def jaccard(a: set[int], b: set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def candidate_pairs(
+    signatures: dict[str, tuple[int, ...]], bands: int
+) -> set[tuple[str, str]]:
+    # Banded LSH: ids sharing any band bucket become candidates; every id is
+    # bucketed once per band, so the cost is linear in the number of rows.
+    num_perm = len(next(iter(signatures.values()))) if signatures else 0
+    rows = max(1, num_perm // bands)
+    pairs: set[tuple[str, str]] = set()
+    for band in range(bands):
+        buckets: dict[tuple[int, ...], list[str]] = defaultdict(list)
+        lo = band * rows
+        for item_id, sig in signatures.items():
+            buckets[sig[lo : lo + rows]].append(item_id)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            members = sorted(members)
+            for i, a in enumerate(members):
+                for b in members[i + 1 :]:
+                    pairs.add((a, b))
+    return pairs
+
+
+def _find(parent: dict[str, str], x: str) -> str:
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+def find_near_duplicates(
+    texts: dict[str, str],
+    threshold: float = 0.6,
+    k: int = 3,
+    num_perm: int = 128,
+    bands: int = 32,
+    seed: int = 1,
+) -> list[DuplicateCluster]:
+    prof = get_profiler()
+    with prof.stage("shingle"):
+        shingle_sets = {item_id: shingles(text, k) for item_id, text in texts.items()}
+        prof.rows(len(shingle_sets))
+    with prof.stage("minhash"):
+        perms = _permutations(num_perm, seed)
+        signatures = {item_id: minhash(s, perms) for item_id, s in shingle_sets.items()}
+        prof.rows(len(signatures))
+    with prof.stage("lsh"):
+        candidates = candidate_pairs(signatures, bands)
+        prof.rows(len(candidates))
+
+    with prof.stage("verify"):
+        parent = {item_id: item_id for item_id in texts}
+        similar: dict[tuple[str, str], float] = {}
+        for a, b in candidates:
+            score = jaccard(shingle_sets[a], shingle_sets[b])
+            if score >= threshold:
+                similar[(a, b)] = score
+                ra, rb = _find(parent, a), _find(parent, b)
+                if ra != rb:
+                    parent[max(ra, rb)] = min(ra, rb)
+        prof.rows(len(candidates))
+        prof.count("verified_pairs", len(similar))
+
+    groups: dict[str, list[str]] = defaultdict(list)
+    for item_id in texts:
+        groups[_find(parent, item_id)].append(item_id)
+
+    clusters: list[DuplicateCluster] = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members = sorted(members)
+        # Representative = medoid: highest mean Jaccard to the other members.
+        scores = {
+            m: sum(jaccard(shingle_sets[m], shingle_sets[o]) for o in members if o != m)
+            / (len(members) - 1)
+            for m in members
+        }
+        representative = max(members, key=lambda m: (scores[m], -members.index(m)))
+        pair_scores = [
+            similar.get((a, b), jaccard(shingle_sets[a], shingle_sets[b]))
+            for i, a in enumerate(members)
+            for b in members[i + 1 :]
+        ]
+        clusters.append(
+            DuplicateCluster(
+                cluster_id="",
+                representative=representative,
+                members=tuple(members),
+                mean_jaccard=round(sum(pair_scores) / len(pair_scores), 4),
+            )
+        )
+
+    clusters.sort(key=lambda c: (-len(c.members), c.representative))
+    return [
+        DuplicateCluster(f"DUP_{i:03d}", c.representative, c.members, c.mean_jaccard)
+        for i, c in enumerate(clusters, start=1)
+    ]
+
+
+def load_texts(
+    input_csv: Path | None,
+    fields: list[str],
+    cmo_dir: Path = Path("data/cmo"),
+    table_cache: Path = Path("data/cache/cmo_statements.parquet"),
+) -> dict[str, str]:
+    texts: dict[str, str] = {}
+    if input_csv is None:
+        from cmo_table import load_cmo_statements
+
+        df = load_cmo_statements(cmo_dir, table_cache)
+        rows = df[["chunk_id", *fields]].fillna("").to_dict("records")
+    else:
+        with open(input_csv, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    for row in rows:
+        chunk_id = (row.get("chunk_id") or "").strip()
+        parts = [(row.get(field) or "").strip() for field in fields]
+        if chunk_id and parts[0]:
+            texts[chunk_id] = " | ".join(p for p in parts if p)
+    return texts
+
+
+def load_representative_map(path: Path) -> dict[str, str]:
+    # chunk_id -> representative chunk_id for every clustered (non-singleton) id.
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    mapping: dict[str, str] = {}
+    for cluster in data.get("clusters", []) or []:
+        for member in cluster.get("members", []) or []:
+            mapping[member] = cluster["representative"]
+    return mapping
+
+
+def non_representative_ids(path: Path) -> set[str]:
+    return {m for m, rep in load_representative_map(path).items() if m != rep}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Find near-duplicate CMO statements with shingling + MinHash LSH."
+    )
+    parser.add_argument(
+        "--input",
+        type=Path,
+        default=None,
+        help="Optional cmo_statements.csv (default: Parquet table built by cmo_table.py).",
+    )
+    parser.add_argument("--cmo-dir", type=Path, default=Path("data/cmo"))
+    parser.add_argument(
+        "--table-cache", type=Path, default=Path("data/cache/cmo_statements.parquet")
+    )
+    parser.add_argument(
+        "--fields",
+        nargs="+",
+        choices=FIELD_CHOICES,
+        default=["mechanism_statement"],
+        help="Statement columns compared together; the first must be present (default mechanism_statement).",
+    )
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.6,
+        help="Minimum shingle Jaccard similarity for a duplicate pair (default 0.6).",
+    )
+    parser.add_argument("--shingle-size", type=int, default=3, help="Word n-gram size (default 3).")
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument(
+        "--bands",
+        type=int,
+        default=32,
+        help="LSH bands; more bands find lower-similarity candidates (default 32).",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    if args.num_perm % args.bands:
+        parser.error("--num-perm must be divisible by --bands")
+
+    with profile_session(args, "near_duplicates"):
+        prof = get_profiler()
+        with prof.stage("load_table"):
+            texts = load_texts(args.input, args.fields, args.cmo_dir, args.table_cache)
+            prof.rows(len(texts))
+        clusters = find_near_duplicates(
+            texts,
+            threshold=args.threshold,
+            k=args.shingle_size,
+            num_perm=args.num_perm,
+            bands=args.bands,
+            seed=args.seed,
+        )
+
+        out_obj = {
+            "settings": {
+                "input": (args.input or args.table_cache).as_posix(),
+                "fields": list(args.fields),
+                "threshold": args.threshold,
+                "shingle_size": args.shingle_size,
+                "num_perm": args.num_perm,
+                "bands": args.bands,
+                "statements": len(texts),
+            },
+            "clusters": [
+                {
+                    "cluster_id": c.cluster_id,
+                    "representative": c.representative,
+                    "size": len(c.members),
+                    "mean_jaccard": c.mean_jaccard,
+                    "members": list(c.members),
+                }
+                for c in clusters
+            ],
+        }
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(
+            yaml.safe_dump(out_obj, sort_keys=False, allow_unicode=True, width=120),
+            encoding="utf-8",
+        )
+
+    redundant = sum(len(c.members) - 1 for c in clusters)
+    print(
+        f"{len(clusters)} near-duplicate cluster(s) covering {redundant + len(clusters)} of "
+        f"{len(texts)} statement(s); {len(texts) - redundant} representative(s) remain."
+    )
+    print(f"Wrote {args.output.as_posix()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from profiling import add_profile_arguments, get_profiler, profile_session
+
+DEFAULT_RAW_DIR = Path("data-raw")
+DEFAULT_CACHE_DIR = Path("data/cache/pdf_text")
+# Bump when extraction or cleanup changes so cached text is rebuilt.
+EXTRACTOR_VERSION = 1
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    file_id: str
+    page: int  # 1-based
+    index: int  # position within the page
+    text: str
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def pdf_paths(raw_dir: Path = DEFAULT_RAW_DIR) -> dict[str, Path]:
+    # CMO YAML keys are PDF basenames; data-raw/ basenames are unique.
+    paths: dict[str, Path] = {}
+    for path in sorted(Path(raw_dir).rglob("*.pdf")):
+        paths.setdefault(path.name, path)
+    return paths
+
+
+def _extract_with_pypdf(path: Path) -> list[str]:
+    from pypdf import PdfReader
+
+    # pypdf logs every font/xref oddity; the text is still usable.
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+    reader = PdfReader(str(path))
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+def _cache_path(cache_dir: Path, digest: str) -> Path:
+    return Path(cache_dir) / f"{digest}.json"
+
+
+def _read_cached(cache_file: Path) -> list[str] | None:
+    if not cache_file.exists():
+        return None
+    cached = json.loads(cache_file.read_text(encoding="utf-8"))
+    if cached.get("extractor_version") != EXTRACTOR_VERSION:
+        return None
+    return cached["pages"]
+
+
+def cached_pages(path: Path, cache_dir: Path = DEFAULT_CACHE_DIR) -> list[str] | None:
+    return _read_cached(_cache_path(cache_dir, file_sha256(path)))
+
+
+def extract_pages(path: Path, cache_dir: Path = DEFAULT_CACHE_DIR) -> list[str]:
+    digest = file_sha256(path)
+    cache_file = _cache_path(cache_dir, digest)
+    pages = _read_cached(cache_file)
+    if pages is not None:
+        return pages
+
+    pages = _extract_with_pypdf(path)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".pdf_text-", suffix=".json", dir=cache_file.parent)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "extractor_version": EXTRACTOR_VERSION,
+                "sha256": digest,
+                "source": Path(path).as_posix(),
+                "pages": pages,
+            },
+            f,
+            ensure_ascii=False,
+        )
+    os.replace(tmp, cache_file)
+    return pages
+
+
+def _extract_job(job: tuple[str, str]) -> list[str]:
+    path, cache_dir = job
+    return extract_pages(Path(path), Path(cache_dir))
+
+
+def iter_pages(
+    paths: Iterable[Path],
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    jobs: int | None = None,
+) -> Iterator[tuple[Path, list[str]]]:
+    # Cached files are yielded straight away; cache misses are then parsed in a
+    # process pool, largest first, and yielded in that order as they finish.
+    prof = get_profiler()
+    misses: list[Path] = []
+    hits = 0
+    for path in paths:
+        pages = cached_pages(path, cache_dir)
+        if pages is None:
+            misses.append(path)
+            continue
+        hits += 1
+        yield path, pages
+    prof.cache(hits=hits, misses=len(misses))
+    if not misses:
+        return
+    misses.sort(key=lambda p: -p.stat().st_size)
+    workers = min(jobs or os.cpu_count() or 1, len(misses))
+    job_list = [(str(p), str(cache_dir)) for p in misses]
+    if workers <= 1:
+        for path, job in zip(misses, job_list):
+            yield path, _extract_job(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from zip(misses, pool.map(_extract_job, job_list))
+
+
+def chunk_text(text: str, max_tokens: int = 300, overlap: int = 30) -> list[str]:
+    # Tokens are whitespace-separated words. Sentences are packed whole until the
+    # budget is reached; a sentence longer than the budget is split on words.
+    sentences = [s.split() for s in _SENTENCE_RE.split(text) if s.strip()]
+    chunks: list[list[str]] = []
+    current: list[str] = []
+    for sentence in sentences:
+        while len(sentence) > max_tokens:
+            if current:
+                chunks.append(current)
+                current = []
+            chunks.append(sentence[:max_tokens])
+            sentence = sentence[max_tokens - overlap :] if overlap else sentence[max_tokens:]
+        if current and len(current) + len(sentence) > max_tokens:
+            chunks.append(current)
+            current = current[-overlap:] if overlap else []
+            if len(current) + len(sentence) > max_tokens:
+                current = []
+        current = current + sentence
+    if current:
+        chunks.append(current)
+    return [" ".join(words) for words in chunks]
+
+
+def iter_chunks(
+    raw_dir: Path = DEFAULT_RAW_DIR,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    max_tokens: int = 300,
+    overlap: int = 30,
+    jobs: int | None = None,
+    file_ids: Iterable[str] | None = None,
+) -> Iterator[Chunk]:
+    paths = pdf_paths(raw_dir)
+    if file_ids is not None:
+        wanted = set(file_ids)
+        paths = {k: v for k, v in paths.items() if k in wanted}
+    for path, pages in iter_pages(list(paths.values()), cache_dir, jobs):
+        for page_number, page_text in enumerate(pages, start=1):
+            for index, text in enumerate(chunk_text(page_text, max_tokens, overlap)):
+                yield Chunk(path.name, page_number, index, text)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Extract page text from the PDFs under data-raw/ (cached by content hash) and "
+            "split it into token-bounded chunks."
+        )
+    )
+    parser.add_argument("--raw-dir", type=Path, default=DEFAULT_RAW_DIR)
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR)
+    parser.add_argument(
+        "--file-id",
+        action="append",
+        default=None,
+        help="Only this PDF basename (repeatable; default all).",
+    )
+    parser.add_argument("--max-tokens", type=int, default=300, help="Words per chunk (default 300).")
+    parser.add_argument("--overlap", type=int, default=30, help="Words repeated between chunks (default 30).")
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Optional JSONL of {file_id, page, chunk, text} records.",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    if not 0 <= args.overlap < args.max_tokens:
+        parser.error("--overlap must be smaller than --max-tokens")
+
+    with profile_session(args, "pdf_text"):
+        prof = get_profiler()
+        files: set[str] = set()
+        pages: set[tuple[str, int]] = set()
+        count = 0
+        out = None
+        if args.output:
+            args.output.parent.mkdir(parents=True, exist_ok=True)
+            out = open(args.output, "w", encoding="utf-8")
+        try:
+            with prof.stage("extract_chunk"):
+                for chunk in iter_chunks(
+                    args.raw_dir,
+                    args.cache_dir,
+                    max_tokens=args.max_tokens,
+                    overlap=args.overlap,
+                    jobs=args.jobs,
+                    file_ids=args.file_id,
+                ):
+                    files.add(chunk.file_id)
+                    pages.add((chunk.file_id, chunk.page))
+                    count += 1
+                    if out is not None:
+                        out.write(
+                            json.dumps(
+                                {
+                                    "file_id": chunk.file_id,
+                                    "page": chunk.page,
+                                    "chunk": chunk.index,
+                                    "text": chunk.text,
+                                },
+                                ensure_ascii=False,
+                            )
+                            + "\n"
+                        )
+                prof.rows(count)
+        finally:
+            if out is not None:
+                out.close()
+
+    print(f"{len(files)} PDF(s), {len(pages)} page(s) with text, {count} chunk(s)")
+    if args.output:
+        print(f"Wrote {args.output.as_posix()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import yaml
+
+DEFAULT_STATE = Path("data/cache/pipeline_state.json")
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    cmd: str
+    inputs: tuple[str, ...]
+    outputs: tuple[str, ...]
+    deps: tuple[str, ...] = ()
+    # Globs removed from the input matches (e.g. another stage's output that
+    # happens to share a directory with the real inputs).
+    exclude: tuple[str, ...] = ()
+
+    def excluded(self, path: str) -> bool:
+        return any(fnmatch.fnmatch(path, pattern) for pattern in self.exclude)
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str  # ran | up_to_date | failed | blocked | would_run
+    seconds: float = 0.0
+    input_hash: str = ""
+    returncode: int | None = None
+
+
+@dataclass
+class Pipeline:
+    stages: dict[str, Stage]
+    upstream: dict[str, set[str]] = field(default_factory=dict)
+
+
+def load_pipeline(config_path: Path) -> Pipeline:
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+
+    stages: dict[str, Stage] = {}
+    for name, spec in (config.get("stages") or {}).items():
+        stages[name] = Stage(
+            name=name,
+            cmd=spec["cmd"],
+            inputs=tuple(spec.get("inputs") or []),
+            outputs=tuple(spec.get("outputs") or []),
+            deps=tuple(spec.get("deps") or []),
+            exclude=tuple(spec.get("exclude") or []),
+        )
+
+    upstream: dict[str, set[str]] = {name: set(stage.deps) for name, stage in stages.items()}
+    for name, stage in stages.items():
+        unknown = upstream[name] - set(stages)
+        if unknown:
+            raise ValueError(f"Stage {name!r} depends on unknown stage(s): {sorted(unknown)}")
+        for other in stages.values():
+            if other.name == name:
+                continue
+            if any(
+                fnmatch.fnmatch(out, pattern) and not stage.excluded(out)
+                for out in other.outputs
+                for pattern in stage.inputs
+            ):
+                upstream[name].add(other.name)
+
+    pipeline = Pipeline(stages=stages, upstream=upstream)
+    topological_order(pipeline, list(stages))  # raises on cycles
+    return pipeline
+
+
+def topological_order(pipeline: Pipeline, names: list[str]) -> list[str]:
+    order: list[str] = []
+    state: dict[str, int] = {}  # 1 = visiting, 2 = done
+
+    def visit(name: str, path: list[str]) -> None:
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        state[name] = 1
+        for dep in sorted(pipeline.upstream[name]):
+            visit(dep, path + [name])
+        state[name] = 2
+        order.append(name)
+
+    for name in names:
+        visit(name, [])
+    return order
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stage_input_hash(stage: Stage) -> str:
+    h = hashlib.sha256()
+    h.update(stage.cmd.encode("utf-8"))
+    for pattern in stage.inputs:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for path in matches:
+            if stage.excluded(path):
+                continue
+            h.update(b"\0" + path.encode("utf-8") + b"\0")
+            h.update(_file_sha256(path).encode("ascii") if os.path.isfile(path) else b"missing")
+    return h.hexdigest()
+
+
+def _outputs_exist(stage: Stage) -> bool:
+    return all(glob.glob(pattern) for pattern in stage.outputs)
+
+
+def _read_state(state_path: Path) -> dict:
+    try:
+        return json.loads(state_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(state_path: Path, state: dict) -> None:
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(state, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    os.replace(tmp_path, state_path)
+
+
+def _run_stage(stage: Stage, log_dir: Path) -> tuple[int, float]:
+    log_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    with open(log_dir / f"{stage.name}.log", "w", encoding="utf-8") as log:
+        proc = subprocess.run(
+            shlex.split(stage.cmd),
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            check=False,
+        )
+    return proc.returncode, time.perf_counter() - start
+
+
+def run_pipeline(
+    pipeline: Pipeline,
+    targets: list[str] | None = None,
+    jobs: int = 2,
+    force: bool = False,
+    dry_run: bool = False,
+    state_path: Path = DEFAULT_STATE,
+    log_dir: Path = Path("data/cache/pipeline_logs"),
+) -> list[StageResult]:
+    names = topological_order(pipeline, targets or list(pipeline.stages))
+    state = _read_state(state_path)
+    results: dict[str, StageResult] = {}
+    pending = list(names)
+    running: dict[Future, tuple[str, str]] = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            progressed = False
+            for name in list(pending):
+                upstream = pipeline.upstream[name] & set(names)
+                if any(results.get(dep) is None for dep in upstream):
+                    continue
+                pending.remove(name)
+                progressed = True
+                if any(results[dep].status in {"failed", "blocked"} for dep in upstream):
+                    results[name] = StageResult(name, "blocked")
+                    continue
+
+                stage = pipeline.stages[name]
+                input_hash = stage_input_hash(stage)
+                # A re-run upstream stage that reproduced identical outputs leaves this
+                # stage's input hash unchanged, so it stays up to date.
+                upstream_pending = any(results[dep].status == "would_run" for dep in upstream)
+                current = (
+                    not force
+                    and not upstream_pending
+                    and state.get(name, {}).get("input_hash") == input_hash
+                    and _outputs_exist(stage)
+                )
+                if current:
+                    results[name] = StageResult(name, "up_to_date", input_hash=input_hash)
+                elif dry_run:
+                    results[name] = StageResult(name, "would_run", input_hash=input_hash)
+                else:
+                    print(f"[pipeline] start {name}: {stage.cmd}", flush=True)
+                    running[pool.submit(_run_stage, stage, log_dir)] = (name, input_hash)
+
+            if not running:
+                if not progressed and pending:
+                    raise RuntimeError(f"Unschedulable stages: {pending}")
+                continue
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name, input_hash = running.pop(future)
+                returncode, seconds = future.result()
+                if returncode == 0:
+                    # Re-hash: stages such as outcome_families rewrite files they also read.
+                    state[name] = {
+                        "input_hash": stage_input_hash(pipeline.stages[name]),
+                        "completed_at": time.time(),
+                        "seconds": round(seconds, 3),
+                    }
+                    _write_state(state_path, state)
+                    status = "ran"
+                else:
+                    status = "failed"
+                results[name] = StageResult(name, status, seconds, input_hash, returncode)
+                print(f"[pipeline] {status} {name} in {seconds:.1f}s", flush=True)
+
+    return [results[name] for name in names]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Run the offsets pipeline stages declared in pipeline.yml, skipping up-to-date stages."
+    )
+    parser.add_argument(
+        "targets",
+        nargs="*",
+        help="Stages to bring up to date (with their upstream stages); default all.",
+    )
+    parser.add_argument("--config", type=Path, default=Path("pipeline.yml"))
+    parser.add_argument("--jobs", type=int, default=2, help="Stages to run in parallel (default 2).")
+    parser.add_argument("--force", action="store_true", help="Run stages even if up to date.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would run.")
+    parser.add_argument("--state", type=Path, default=DEFAULT_STATE)
+    parser.add_argument(
+        "--log-dir",
+        type=Path,
+        default=Path("data/cache/pipeline_logs"),
+        help="Per-stage stdout/stderr logs.",
+    )
+    args = parser.parse_args()
+
+    pipeline = load_pipeline(args.config)
+    unknown = [t for t in args.targets if t not in pipeline.stages]
+    if unknown:
+        print(f"Unknown stage(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    results = run_pipeline(
+        pipeline,
+        targets=args.targets or None,
+        jobs=args.jobs,
+        force=args.force,
+        dry_run=args.dry_run,
+        state_path=args.state,
+        log_dir=args.log_dir,
+    )
+
+    print("stage\tstatus\tseconds")
+    for r in results:
+        print(f"{r.name}\t{r.status}\t{r.seconds:.2f}")
+    total = sum(r.seconds for r in results)
+    print(f"Total stage time: {total:.1f}s; wall time: {time.perf_counter() - start:.1f}s")
+    return 1 if any(r.status in {"failed", "blocked"} for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import csv
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from build_mechanism_batches import assigned_mechanism_ids, load_mechanisms
+from embed_mechanisms import embed_texts
+from encoders import BACKENDS, DEFAULT_BACKEND
+from merge_audit_output import _dump_yaml, _write_text_atomic, merge_changelog
+from profiling import add_profile_arguments, get_profiler, profile_session
+
+
+@dataclass(frozen=True)
+class Preassignment:
+    chunk_id: str
+    statement: str
+    theme_id: str
+    score: float
+    runner_up_id: str
+    runner_up_score: float
+    top: tuple[tuple[str, float], ...]
+    auto: bool
+
+    @property
+    def margin(self) -> float:
+        return self.score - self.runner_up_score
+
+
+@dataclass
+class ThemeCentroids:
+    theme_ids: list[str]
+    centroids: np.ndarray  # (n_themes, dim), unit length
+    sums: np.ndarray  # (n_themes, dim), for leave-one-out calibration
+    counts: np.ndarray
+    member_vectors: dict[str, tuple[int, np.ndarray]]  # mechanism id -> (theme row, vector)
+
+
+def _unit(rows: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return rows / norms
+
+
+def theme_centroids(
+    proto: dict,
+    model_name: str = "all-MiniLM-L6-v2",
+    cache_path: str = "data/embeddings_cache.sqlite",
+    device: str = "cpu",
+    min_theme_size: int = 2,
+    backend: str = DEFAULT_BACKEND,
+) -> ThemeCentroids:
+    members: list[tuple[str, str, str]] = []  # (theme_id, mechanism id, text)
+    for theme in proto.get("proto_mechanism_themes", []) or []:
+        mechanisms = [m for m in theme.get("mechanisms", []) or [] if (m.get("text") or "").strip()]
+        if len(mechanisms) < min_theme_size:
+            continue
+        for m in mechanisms:
+            members.append((theme["theme_id"], m.get("id") or "", m["text"].strip()))
+    if not members:
+        raise ValueError("No proto themes with enough mechanisms to build centroids.")
+
+    vectors = embed_texts(
+        texts=[text for _, _, text in members],
+        model_name=model_name,
+        normalize=True,
+        device=device,
+        cache_path=cache_path,
+        backend=backend,
+    )
+    theme_ids = list(dict.fromkeys(theme_id for theme_id, _, _ in members))
+    row_of = {theme_id: i for i, theme_id in enumerate(theme_ids)}
+    sums = np.zeros((len(theme_ids), vectors.shape[1]), dtype=np.float64)
+    counts = np.zeros(len(theme_ids), dtype=np.int64)
+    member_vectors: dict[str, tuple[int, np.ndarray]] = {}
+    for (theme_id, mech_id, _), vec in zip(members, vectors):
+        row = row_of[theme_id]
+        sums[row] += vec
+        counts[row] += 1
+        if mech_id:
+            member_vectors[mech_id] = (row, vec)
+    return ThemeCentroids(theme_ids, _unit(sums), sums, counts, member_vectors)
+
+
+def _decide(
+    scores: np.ndarray, theme_ids: list[str], min_score: float, min_margin: float, top_k: int
+) -> tuple[int, int, bool, tuple[tuple[str, float], ...]]:
+    order = np.argsort(-scores)
+    best = int(order[0])
+    second = int(order[1]) if len(order) > 1 else best
+    runner_up = float(scores[second]) if second != best else -1.0
+    auto = float(scores[best]) >= min_score and float(scores[best]) - runner_up >= min_margin
+    top = tuple((theme_ids[int(i)], round(float(scores[int(i)]), 4)) for i in order[:top_k])
+    return best, second, auto, top
+
+
+def preassign(
+    rows: list[tuple[str, str]],
+    centroids: ThemeCentroids,
+    model_name: str = "all-MiniLM-L6-v2",
+    cache_path: str = "data/embeddings_cache.sqlite",
+    device: str = "cpu",
+    min_score: float = 0.6,
+    min_margin: float = 0.08,
+    top_k: int = 3,
+    backend: str = DEFAULT_BACKEND,
+) -> list[Preassignment]:
+    if not rows:
+        return []
+    vectors = embed_texts(
+        texts=[text for _, text in rows],
+        model_name=model_name,
+        normalize=True,
+        device=device,
+        cache_path=cache_path,
+        backend=backend,
+    )
+    scores = _unit(vectors) @ centroids.centroids.T
+    results: list[Preassignment] = []
+    for (chunk_id, text), row_scores in zip(rows, scores):
+        best, second, auto, top = _decide(
+            row_scores, centroids.theme_ids, min_score, min_margin, top_k
+        )
+        results.append(
+            Preassignment(
+                chunk_id=chunk_id,
+                statement=text,
+                theme_id=centroids.theme_ids[best],
+                score=round(float(row_scores[best]), 4),
+                runner_up_id=centroids.theme_ids[second],
+                runner_up_score=round(float(row_scores[second]), 4) if second != best else -1.0,
+                top=top,
+                auto=auto,
+            )
+        )
+    return results
+
+
+def calibrate(centroids: ThemeCentroids, min_score: float, min_margin: float) -> dict:
+    # Leave-one-out replay over already-themed mechanisms: how many would the
+    # auto rule assign, and how many of those match the curated theme.
+    auto = correct = 0
+    for row, vec in centroids.member_vectors.values():
+        if centroids.counts[row] <= 1:
+            continue
+        sums = centroids.sums.copy()
+        sums[row] -= vec
+        scores = _unit(sums) @ vec
+        best, _, is_auto, _ = _decide(scores, centroids.theme_ids, min_score, min_margin, 1)
+        if is_auto:
+            auto += 1
+            correct += best == row
+    total = len(centroids.member_vectors)
+    return {
+        "mechanisms": total,
+        "auto_assigned": auto,
+        "coverage": round(auto / max(1, total), 4),
+        "precision": round(correct / max(1, auto), 4),
+    }
+
+
+def _result_record(r: Preassignment) -> dict:
+    return {
+        "id": r.chunk_id,
+        "theme_id": r.theme_id,
+        "score": r.score,
+        "margin": round(r.margin, 4),
+        "runner_up": r.runner_up_id,
+        "top_candidates": [{"theme_id": t, "score": s} for t, s in r.top],
+    }
+
+
+def apply_preassignments(
+    proto: dict, records: list[dict], statements: dict[str, str]
+) -> tuple[dict, dict]:
+    # Appends each audited auto_assigned row to its theme's mechanisms, with an
+    # assignment entry for the change log. Rows must name an existing theme, a known
+    # statement and a mechanism not yet themed (or marked ambiguous), so a stale
+    # preassignments.yml is refused rather than applied twice.
+    themes = list(proto.get("proto_mechanism_themes") or [])
+    current = {str(t.get("theme_id", "")).strip(): t for t in themes}
+    themed = {m.get("id") for t in themes for m in t.get("mechanisms") or []}
+    themed.update(m.get("id") for m in proto.get("ambiguous_mechanisms") or [])
+    seen: set[str] = set()
+    problems = []
+    for r in records:
+        mech_id, theme_id = r.get("id"), r.get("theme_id")
+        if theme_id not in current:
+            problems.append(f"{mech_id}: theme {theme_id} not in proto_themes.yml")
+        elif mech_id in themed:
+            problems.append(f"{mech_id}: already in proto_themes.yml")
+        elif mech_id in seen:
+            problems.append(f"{mech_id}: listed more than once")
+        elif not statements.get(mech_id):
+            problems.append(f"{mech_id}: no mechanism_statement in the input")
+        seen.add(mech_id)
+    if problems:
+        raise ValueError("; ".join(problems))
+
+    added: dict[str, list[dict]] = {}
+    changes = []
+    for r in records:
+        rationale = (
+            f"Pre-assigned by centroid similarity (cosine {r['score']:.2f}, "
+            f"margin {r['margin']:.2f} over {r['runner_up']})."
+        )
+        added.setdefault(r["theme_id"], []).append(
+            {"id": r["id"], "text": statements[r["id"]], "rationale": rationale}
+        )
+        changes.append(
+            {
+                "change_id": "",
+                "change_type": "assignment",
+                "theme_id": r["theme_id"],
+                "mechanism_id": r["id"],
+                "summary": f"Assigned to {r['theme_id']} by preassign_mechanisms.py.",
+                "rationale": rationale,
+            }
+        )
+    merged_themes = []
+    for theme in themes:
+        theme_id = str(theme.get("theme_id", "")).strip()
+        if theme_id in added:
+            theme = dict(theme)
+            theme["mechanisms"] = list(theme.get("mechanisms") or []) + added[theme_id]
+        merged_themes.append(theme)
+    merged = dict(proto)
+    merged["proto_mechanism_themes"] = merged_themes
+    return merged, {"change_log": changes}
+
+
+def _apply(args: argparse.Namespace) -> int:
+    prof = get_profiler()
+    with prof.stage("load"):
+        proto = yaml.safe_load(args.proto_themes.read_text(encoding="utf-8")) or {}
+        changelog = yaml.safe_load(args.changelog.read_text(encoding="utf-8")) or {}
+        scores = yaml.safe_load(args.output.read_text(encoding="utf-8")) or {}
+        records = list(scores.get("auto_assigned") or [])
+        statements = dict(
+            load_mechanisms(args.input, cmo_dir=args.cmo_dir, table_cache=args.table_cache)
+        )
+        prof.rows(len(records))
+    try:
+        with prof.stage("merge"):
+            proto, returned = apply_preassignments(proto, records, statements)
+            changelog, change_ids = merge_changelog(changelog, returned)
+    except ValueError as exc:
+        print(f"{args.output.as_posix()}: {exc}", file=sys.stderr)
+        print("Re-run preassign_mechanisms.py against the current proto_themes.yml.", file=sys.stderr)
+        return 1
+    print(f"{len(records)} auto-assigned statement(s), {len(change_ids)} new change(s).")
+    if records and not args.dry_run:
+        with prof.stage("write"):
+            _write_text_atomic(args.proto_themes, _dump_yaml(proto))
+            _write_text_atomic(args.changelog, _dump_yaml(changelog))
+        print(f"Wrote {args.proto_themes.as_posix()} and {args.changelog.as_posix()}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Pre-assign new mechanism statements to proto themes by centroid similarity; "
+            "only the ambiguous residual goes to the iterate_mechanism_theme.md prompt."
+        )
+    )
+    parser.add_argument(
+        "--proto-themes",
+        type=Path,
+        default=Path("data/mechanism_themes/proto_themes.yml"),
+    )
+    parser.add_argument(
+        "--input",
+        type=Path,
+        default=None,
+        help="Optional cmo_statements.csv (default: Parquet table built by cmo_table.py).",
+    )
+    parser.add_argument("--cmo-dir", type=Path, default=Path("data/cmo"))
+    parser.add_argument(
+        "--table-cache", type=Path, default=Path("data/cache/cmo_statements.parquet")
+    )
+    parser.add_argument(
+        "--dedupe",
+        type=Path,
+        default=None,
+        help="near_duplicates.yml; only cluster representatives are scored.",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("data/mechanism_themes/preassignments.yml"),
+        help="Assignment scores for audit.",
+    )
+    parser.add_argument(
+        "--residual",
+        type=Path,
+        default=Path("data/mechanism_themes/preassign_residual.csv"),
+        help="chunk_id,mechanism_statement CSV of unassigned statements (build_mechanism_batches.py --input).",
+    )
+    parser.add_argument(
+        "--min-score",
+        type=float,
+        default=0.6,
+        help="Minimum cosine to the best theme centroid for auto-assignment (default 0.6).",
+    )
+    parser.add_argument(
+        "--min-margin",
+        type=float,
+        default=0.08,
+        help="Minimum lead of the best theme over the runner-up (default 0.08).",
+    )
+    parser.add_argument(
+        "--min-theme-size",
+        type=int,
+        default=2,
+        help="Themes with fewer mechanisms get no centroid (default 2).",
+    )
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="Report leave-one-out coverage/precision of the thresholds on already-themed mechanisms.",
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help=(
+            "Instead of scoring, append the auto_assigned rows of --output (after audit) to their "
+            "themes in --proto-themes and log them in --changelog."
+        ),
+    )
+    parser.add_argument(
+        "--changelog", type=Path, default=Path("data/mechanism_themes/proto_themes_changelog.yml")
+    )
+    parser.add_argument("--dry-run", action="store_true", help="With --apply, validate without writing.")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--cache", default="data/embeddings_cache.sqlite")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="Encoder backend.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    if args.dry_run and not args.apply:
+        parser.error("--dry-run applies to --apply")
+
+    if args.apply:
+        with profile_session(args, "preassign_mechanisms_apply"):
+            return _apply(args)
+
+    with profile_session(args, "preassign_mechanisms"):
+        prof = get_profiler()
+        with prof.stage("load"):
+            with open(args.proto_themes, "r", encoding="utf-8") as f:
+                proto = yaml.safe_load(f) or {}
+            exclude = assigned_mechanism_ids(args.proto_themes)
+            if args.dedupe:
+                from near_duplicates import non_representative_ids
+
+                exclude |= non_representative_ids(args.dedupe)
+            rows = load_mechanisms(
+                args.input, exclude_ids=exclude, cmo_dir=args.cmo_dir, table_cache=args.table_cache
+            )
+            prof.rows(len(rows))
+        with prof.stage("centroids"):
+            centroids = theme_centroids(
+                proto,
+                model_name=args.model,
+                cache_path=args.cache,
+                device=args.device,
+                min_theme_size=args.min_theme_size,
+                backend=args.backend,
+            )
+            prof.rows(len(centroids.theme_ids))
+        with prof.stage("score"):
+            results = preassign(
+                rows,
+                centroids,
+                model_name=args.model,
+                cache_path=args.cache,
+                device=args.device,
+                min_score=args.min_score,
+                min_margin=args.min_margin,
+                backend=args.backend,
+            )
+            prof.rows(len(results))
+        calibration = None
+        if args.calibrate:
+            with prof.stage("calibrate"):
+                calibration = calibrate(centroids, args.min_score, args.min_margin)
+
+        auto = [r for r in results if r.auto]
+        residual = [r for r in results if not r.auto]
+        out_obj = {
+            "settings": {
+                "proto_themes": args.proto_themes.as_posix(),
+                "model": args.model,
+                "backend": args.backend,
+                "min_score": args.min_score,
+                "min_margin": args.min_margin,
+                "min_theme_size": args.min_theme_size,
+                "themes_with_centroids": len(centroids.theme_ids),
+            },
+            "summary": {
+                "statements": len(results),
+                "auto_assigned": len(auto),
+                "residual": len(residual),
+            },
+        }
+        if calibration is not None:
+            out_obj["calibration"] = calibration
+        out_obj["auto_assigned"] = [_result_record(r) for r in auto]
+        out_obj["residual"] = [_result_record(r) for r in residual]
+
+        with prof.stage("write"):
+            args.output.parent.mkdir(parents=True, exist_ok=True)
+            args.output.write_text(
+                yaml.safe_dump(out_obj, sort_keys=False, allow_unicode=True, width=120),
+                encoding="utf-8",
+            )
+            args.residual.parent.mkdir(parents=True, exist_ok=True)
+            with open(args.residual, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["chunk_id", "mechanism_statement"])
+                writer.writerows((r.chunk_id, r.statement) for r in residual)
+
+    print(
+        f"{len(results)} unassigned statement(s): {len(auto)} auto-assigned, "
+        f"{len(residual)} residual for the LLM."
+    )
+    if calibration is not None:
+        print(
+            f"Calibration (leave-one-out): coverage {calibration['coverage']:.1%}, "
+            f"precision {calibration['precision']:.1%} over {calibration['mechanisms']} mechanisms."
+        )
+    print(f"Scores: {args.output.as_posix()}")
+    print(f"Residual: {args.residual.as_posix()}")
+    if auto:
+        print("Audit the auto_assigned rows, then add them to the themes with --apply.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
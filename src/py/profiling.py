@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    seconds: float = 0.0
+    rows: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    peak_rss_mb: float | None = None
+    counters: dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        out: dict = {
+            "calls": self.calls,
+            "seconds": round(self.seconds, 4),
+            "rows": self.rows,
+            "peak_rss_mb": self.peak_rss_mb,
+        }
+        lookups = self.cache_hits + self.cache_misses
+        if lookups:
+            out["cache_hits"] = self.cache_hits
+            out["cache_misses"] = self.cache_misses
+            out["cache_hit_rate"] = round(self.cache_hits / lookups, 4)
+        if self.counters:
+            out["counters"] = dict(self.counters)
+        return out
+
+
+class Profiler:
+    # Stage timings and counters for --profile. Disabled profilers are no-ops, so
+    # library code can instrument unconditionally via get_profiler().
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stages: dict[str, StageStats] = {}
+        self._stack: list[str] = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        full_name = "/".join(self._stack + [name])
+        stats = self.stages.setdefault(full_name, StageStats())
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            stats.calls += 1
+            stats.seconds += time.perf_counter() - start
+            stats.peak_rss_mb = peak_rss_mb()
+
+    def _current(self) -> StageStats | None:
+        if not self.enabled:
+            return None
+        return self.stages.setdefault("/".join(self._stack) or "main", StageStats())
+
+    def rows(self, n: int) -> None:
+        stats = self._current()
+        if stats is not None:
+            stats.rows += int(n)
+
+    def cache(self, hits: int = 0, misses: int = 0) -> None:
+        stats = self._current()
+        if stats is not None:
+            stats.cache_hits += int(hits)
+            stats.cache_misses += int(misses)
+
+    def count(self, name: str, n: int = 1) -> None:
+        stats = self._current()
+        if stats is not None:
+            stats.counters[name] = stats.counters.get(name, 0) + int(n)
+
+    def report(self, command: str) -> dict:
+        return {
+            "command": command,
+            "argv": sys.argv[1:],
+            "wall_seconds": round(time.perf_counter() - self._start, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": {name: stats.to_dict() for name, stats in self.stages.items()},
+        }
+
+
+_ACTIVE = Profiler(enabled=False)
+
+
+def get_profiler() -> Profiler:
+    return _ACTIVE
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    # A plain flag plus a separate path option: an optional value on --profile would
+    # swallow the next positional argument (e.g. a search query).
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report stage timings, peak RSS, row counts and cache hit rates as JSON on stderr.",
+    )
+    parser.add_argument(
+        "--profile-out",
+        default=None,
+        metavar="JSON",
+        help="Write the --profile report to this file instead (implies --profile).",
+    )
+    parser.add_argument(
+        "--profile-cprofile",
+        default=None,
+        metavar="PSTATS",
+        help="Also write a cProfile dump (inspect with python -m pstats).",
+    )
+
+
+@contextmanager
+def profile_session(args: argparse.Namespace, command: str) -> Iterator[Profiler]:
+    global _ACTIVE
+    json_path = getattr(args, "profile_out", None) or ("-" if getattr(args, "profile", False) else None)
+    pstats_path = getattr(args, "profile_cprofile", None)
+    if json_path is None and pstats_path is None:
+        yield _ACTIVE
+        return
+
+    previous, _ACTIVE = _ACTIVE, Profiler(enabled=True)
+    profiler = None
+    if pstats_path:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield _ACTIVE
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            Path(pstats_path).parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(pstats_path)
+        report = _ACTIVE.report(command)
+        if pstats_path:
+            report["cprofile"] = str(pstats_path)
+        text = json.dumps(report, indent=2)
+        if json_path == "-":
+            print(text, file=sys.stderr)
+        elif json_path is not None:
+            Path(json_path).parent.mkdir(parents=True, exist_ok=True)
+            Path(json_path).write_text(text + "\n", encoding="utf-8")
+        _ACTIVE = previous
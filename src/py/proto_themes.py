@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from profiling import add_profile_arguments, get_profiler, profile_session
+
+DEFAULT_PROTO_THEMES = Path("data/mechanism_themes/proto_themes.yml")
+DEFAULT_SNAPSHOT = Path("data/cache/proto_themes.pickle")
+# Bump when the record layout or derived maps change so old snapshots are rebuilt.
+SNAPSHOT_VERSION = 1
+
+
+@dataclass(frozen=True, slots=True)
+class MechanismRef:
+    id: str
+    text: str
+    rationale: str
+    theme_id: str | None  # None for ambiguous mechanisms
+    possible_themes: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True, slots=True)
+class Theme:
+    theme_id: str
+    label: str
+    explanation: str
+    start: int  # members are ProtoThemes.mechanisms[start:stop]
+    stop: int
+
+    @property
+    def mechanism_count(self) -> int:
+        return self.stop - self.start
+
+
+class ProtoThemes:
+    # Flat, read-only view of proto_themes.yml. Assigned mechanisms are stored
+    # contiguously per theme (ambiguous ones after them), so a theme is a slice.
+    __slots__ = (
+        "sha256",
+        "themes",
+        "mechanisms",
+        "n_assigned",
+        "theme_index",
+        "mechanism_theme",
+        "theme_counts",
+        "theme_texts",
+    )
+
+    def __init__(
+        self,
+        sha256: str,
+        themes: tuple[Theme, ...],
+        mechanisms: tuple[MechanismRef, ...],
+        n_assigned: int,
+        theme_index: dict[str, int],
+        mechanism_theme: dict[str, str],
+        theme_counts: dict[str, int],
+        theme_texts: dict[str, str],
+    ) -> None:
+        self.sha256 = sha256
+        self.themes = themes
+        self.mechanisms = mechanisms
+        self.n_assigned = n_assigned
+        self.theme_index = theme_index
+        self.mechanism_theme = mechanism_theme
+        self.theme_counts = theme_counts
+        self.theme_texts = theme_texts
+
+    @property
+    def ambiguous(self) -> tuple[MechanismRef, ...]:
+        return self.mechanisms[self.n_assigned :]
+
+    def theme(self, theme_id: str) -> Theme:
+        return self.themes[self.theme_index[theme_id]]
+
+    def members(self, theme_id: str) -> tuple[MechanismRef, ...]:
+        theme = self.theme(theme_id)
+        return self.mechanisms[theme.start : theme.stop]
+
+    def iter_members(self) -> Iterator[tuple[Theme, tuple[MechanismRef, ...]]]:
+        for theme in self.themes:
+            yield theme, self.mechanisms[theme.start : theme.stop]
+
+    def mechanism_ids(self) -> set[str]:
+        return {m.id for m in self.mechanisms if m.id}
+
+    @classmethod
+    def from_dict(cls, proto: dict, sha256: str = "") -> ProtoThemes:
+        intern = sys.intern
+        themes: list[Theme] = []
+        mechanisms: list[MechanismRef] = []
+        for raw in proto.get("proto_mechanism_themes", []) or []:
+            theme_id = intern(str(raw.get("theme_id", "")).strip())
+            if not theme_id:
+                continue
+            start = len(mechanisms)
+            for m in raw.get("mechanisms", []) or []:
+                mechanisms.append(
+                    MechanismRef(
+                        id=intern(str(m.get("id") or "")),
+                        text=str(m.get("text") or ""),
+                        rationale=str(m.get("rationale") or ""),
+                        theme_id=theme_id,
+                    )
+                )
+            themes.append(
+                Theme(
+                    theme_id=theme_id,
+                    label=str(raw.get("theme_label") or ""),
+                    explanation=str(raw.get("mechanism_explanation") or ""),
+                    start=start,
+                    stop=len(mechanisms),
+                )
+            )
+        n_assigned = len(mechanisms)
+        for m in proto.get("ambiguous_mechanisms", []) or []:
+            mechanisms.append(
+                MechanismRef(
+                    id=intern(str(m.get("id") or "")),
+                    text=str(m.get("text") or ""),
+                    rationale=str(m.get("explanation") or ""),
+                    theme_id=None,
+                    possible_themes=tuple(intern(str(t)) for t in m.get("possible_themes") or []),
+                )
+            )
+        return cls(
+            sha256=sha256,
+            themes=tuple(themes),
+            mechanisms=tuple(mechanisms),
+            n_assigned=n_assigned,
+            theme_index={t.theme_id: i for i, t in enumerate(themes)},
+            mechanism_theme={m.id: m.theme_id for m in mechanisms[:n_assigned] if m.id},
+            theme_counts={t.theme_id: t.mechanism_count for t in themes},
+            # The exact strings triage and the audit neighbours embed (embedding cache keys).
+            theme_texts={t.theme_id: f"{t.label} {t.explanation}" for t in themes},
+        )
+
+    def _to_snapshot(self) -> dict:
+        # Plain builtins only, so the snapshot loads whichever module path imported this file.
+        return {
+            "version": SNAPSHOT_VERSION,
+            "sha256": self.sha256,
+            "themes": [(t.theme_id, t.label, t.explanation, t.start, t.stop) for t in self.themes],
+            "mechanisms": [(m.id, m.text, m.rationale, m.theme_id, m.possible_themes) for m in self.mechanisms],
+            "n_assigned": self.n_assigned,
+            "theme_index": self.theme_index,
+            "mechanism_theme": self.mechanism_theme,
+            "theme_counts": self.theme_counts,
+            "theme_texts": self.theme_texts,
+        }
+
+    @classmethod
+    def _from_snapshot(cls, data: dict) -> ProtoThemes:
+        return cls(
+            sha256=data["sha256"],
+            themes=tuple(Theme(*t) for t in data["themes"]),
+            mechanisms=tuple(MechanismRef(*m) for m in data["mechanisms"]),
+            n_assigned=data["n_assigned"],
+            theme_index=data["theme_index"],
+            mechanism_theme=data["mechanism_theme"],
+            theme_counts=data["theme_counts"],
+            theme_texts=data["theme_texts"],
+        )
+
+
+def _read_snapshot(snapshot: Path, digest: str) -> ProtoThemes | None:
+    if not snapshot.exists():
+        return None
+    try:
+        with open(snapshot, "rb") as f:
+            data = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if data.get("version") != SNAPSHOT_VERSION or data.get("sha256") != digest:
+        return None
+    return ProtoThemes._from_snapshot(data)
+
+
+def _write_snapshot(snapshot: Path, themes: ProtoThemes) -> None:
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{snapshot.name}-", dir=snapshot.parent)
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(themes._to_snapshot(), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, snapshot)
+
+
+def load_proto_themes(
+    path: Path | str = DEFAULT_PROTO_THEMES,
+    snapshot: Path | str | None = DEFAULT_SNAPSHOT,
+) -> ProtoThemes:
+    # The snapshot is reused while proto_themes.yml's content hash is unchanged;
+    # snapshot=None always parses the YAML.
+    prof = get_profiler()
+    raw = Path(path).read_bytes()
+    digest = hashlib.sha256(raw).hexdigest()
+    if snapshot is not None:
+        cached = _read_snapshot(Path(snapshot), digest)
+        if cached is not None:
+            prof.cache(hits=1)
+            return cached
+        prof.cache(misses=1)
+
+    from yaml_loader import load_yaml
+
+    themes = ProtoThemes.from_dict(load_yaml(Path(path)) or {}, digest)
+    if snapshot is not None:
+        _write_snapshot(Path(snapshot), themes)
+    return themes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Load proto_themes.yml into the compact theme model and refresh its binary snapshot."
+    )
+    parser.add_argument("--proto-themes", type=Path, default=DEFAULT_PROTO_THEMES)
+    parser.add_argument("--snapshot", type=Path, default=DEFAULT_SNAPSHOT)
+    parser.add_argument("--rebuild", action="store_true", help="Ignore an existing snapshot.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profile_session(args, "proto_themes"):
+        if args.rebuild:
+            args.snapshot.unlink(missing_ok=True)
+        themes = load_proto_themes(args.proto_themes, args.snapshot)
+
+    print(
+        f"{len(themes.themes)} theme(s), {themes.n_assigned} assigned and "
+        f"{len(themes.ambiguous)} ambiguous mechanism(s); snapshot {args.snapshot.as_posix()}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
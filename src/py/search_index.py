@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator
+
+from cmo_store import cmo_yaml_paths
+from profiling import add_profile_arguments, get_profiler, profile_session
+from yaml_loader import LoadedYaml, is_cmo_document_map, iter_cmo_records, load_yaml_files
+
+DEFAULT_INDEX = Path("data/cache/search_index.sqlite")
+DEFAULT_CMO_DIR = Path("data/cmo")
+DEFAULT_BIBLIOGRAPHY = Path("data/annotated_bibliography.yml")
+DEFAULT_PROTO_THEMES = Path("data/mechanism_themes/proto_themes.yml")
+_SCHEMA_VERSION = 1
+
+# Searchable FTS5 columns, in table order; BM25 weights favour the CMO statements.
+TEXT_FIELDS = ("title", "context", "mechanism", "outcome", "evidence", "body")
+_BM25_WEIGHTS = (2.0, 1.0, 1.5, 1.0, 0.8, 0.6)
+FACETS = ("country", "programme", "rq")
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, sha256 TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS units (
+    unit_key TEXT PRIMARY KEY, source TEXT NOT NULL, sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS docs (
+    rowid INTEGER PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    file_id TEXT,
+    unit_key TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS facets (rowid INTEGER NOT NULL, facet TEXT NOT NULL, value TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_docs_unit ON docs(unit_key);
+CREATE INDEX IF NOT EXISTS idx_facets ON facets(facet, value);
+CREATE INDEX IF NOT EXISTS idx_facets_rowid ON facets(rowid);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    {", ".join(TEXT_FIELDS)}, tokenize = 'porter unicode61'
+);
+"""
+
+
+@dataclass(frozen=True)
+class SearchDoc:
+    doc_id: str
+    kind: str  # cmo | bibliography | theme
+    file_id: str | None
+    text: dict[str, str]
+    facets: dict[str, tuple[str, ...]]
+
+
+@dataclass(frozen=True)
+class Hit:
+    doc_id: str
+    kind: str
+    file_id: str | None
+    score: float
+    snippet: str
+
+
+def _as_list(value: Any) -> tuple[str, ...]:
+    if value is None:
+        return ()
+    if isinstance(value, list):
+        return tuple(str(v).strip() for v in value if str(v).strip())
+    return (str(value).strip(),) if str(value).strip() else ()
+
+
+def _join(value: Any) -> str:
+    return "\n".join(_as_list(value))
+
+
+def _unit_hash(payload: Any) -> str:
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _cmo_units(loaded: LoadedYaml) -> Iterator[tuple[str, Any, list[SearchDoc]]]:
+    # One unit per source document (PDF), so editing one chapter re-indexes only it.
+    by_file: dict[str, list[SearchDoc]] = {}
+    for record in iter_cmo_records(loaded):
+        f = record.fields
+        by_file.setdefault(record.file_id, []).append(
+            SearchDoc(
+                doc_id=record.cmo_id,
+                kind="cmo",
+                file_id=record.file_id,
+                text={
+                    "title": "",
+                    "context": _join(f.get("context")),
+                    "mechanism": _join(f.get("mechanism")),
+                    "outcome": _join(f.get("outcome")),
+                    "evidence": "\n".join(
+                        filter(
+                            None,
+                            [_join(f.get("supporting_evidence")), _join(f.get("supporting_evidence_paraphrase"))],
+                        )
+                    ),
+                    "body": _join(f.get("evidence_type_narrative")),
+                },
+                facets={
+                    "country": _as_list(f.get("country")),
+                    "programme": _as_list(f.get("programme")),
+                    "rq": _as_list(f.get("research_questions_mapped")),
+                },
+            )
+        )
+    for file_id, docs in by_file.items():
+        yield f"cmo:{file_id}", loaded.data[file_id], docs
+
+
+def _bibliography_units(loaded: LoadedYaml) -> Iterator[tuple[str, Any, list[SearchDoc]]]:
+    for book, chapters in ((loaded.data or {}).get("books") or {}).items():
+        for chapter, entry in (chapters or {}).items():
+            entry = entry or {}
+            doc_id = entry.get("pdf_file") or f"{book} / {chapter}"
+            body = "\n".join(
+                _join(entry.get(key))
+                for key in ("summary", "aim", "methods", "findings", "conclusions", "limitations")
+            )
+            doc = SearchDoc(
+                doc_id=doc_id,
+                kind="bibliography",
+                file_id=entry.get("pdf_file"),
+                text={"title": f"{chapter}\n{book}", "body": body},
+                facets={},
+            )
+            yield f"bib:{doc_id}", entry, [doc]
+
+
+def _theme_units(loaded: LoadedYaml) -> Iterator[tuple[str, Any, list[SearchDoc]]]:
+    for theme in (loaded.data or {}).get("proto_mechanism_themes", []) or []:
+        theme_id = theme.get("theme_id")
+        if not theme_id:
+            continue
+        # Mechanism texts are indexed as CMOs; only the theme header is indexed here.
+        header = {k: theme.get(k) for k in ("theme_label", "mechanism_explanation")}
+        doc = SearchDoc(
+            doc_id=theme_id,
+            kind="theme",
+            file_id=None,
+            text={"title": _join(theme.get("theme_label")), "body": _join(theme.get("mechanism_explanation"))},
+            facets={},
+        )
+        yield f"theme:{theme_id}", header, [doc]
+
+
+def units_for_source(loaded: LoadedYaml) -> Iterator[tuple[str, Any, list[SearchDoc]]]:
+    data = loaded.data
+    if not isinstance(data, dict):
+        return iter(())
+    if "books" in data:
+        return _bibliography_units(loaded)
+    if "proto_mechanism_themes" in data:
+        return _theme_units(loaded)
+    if is_cmo_document_map(data):
+        return _cmo_units(loaded)
+    return iter(())
+
+
+def discover_sources(
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    bibliography: Path = DEFAULT_BIBLIOGRAPHY,
+    proto_themes: Path = DEFAULT_PROTO_THEMES,
+) -> list[Path]:
+    paths = cmo_yaml_paths(cmo_dir)
+    paths.extend(p for p in (Path(bibliography), Path(proto_themes)) if p.is_file())
+    return paths
+
+
+def _fts_query(query: str, fields: list[str] | None) -> str:
+    if not fields:
+        return query
+    return "{" + " ".join(fields) + "} : (" + query + ")"
+
+
+class SearchIndex:
+    def __init__(self, path: Path = DEFAULT_INDEX):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+        version = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if version is None or int(version[0]) != _SCHEMA_VERSION:
+            self._clear()
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _clear(self) -> None:
+        for table in ("sources", "units", "docs", "facets", "docs_fts"):
+            self.conn.execute(f"DELETE FROM {table}")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+            (str(_SCHEMA_VERSION),),
+        )
+
+    def _delete_unit(self, unit_key: str) -> None:
+        rowids = [r[0] for r in self.conn.execute("SELECT rowid FROM docs WHERE unit_key = ?", (unit_key,))]
+        self.conn.executemany("DELETE FROM docs_fts WHERE rowid = ?", [(r,) for r in rowids])
+        self.conn.executemany("DELETE FROM facets WHERE rowid = ?", [(r,) for r in rowids])
+        self.conn.execute("DELETE FROM docs WHERE unit_key = ?", (unit_key,))
+        self.conn.execute("DELETE FROM units WHERE unit_key = ?", (unit_key,))
+
+    def _insert_doc(self, unit_key: str, doc: SearchDoc) -> None:
+        cur = self.conn.execute(
+            "INSERT INTO docs (doc_id, kind, file_id, unit_key) VALUES (?, ?, ?, ?)",
+            (doc.doc_id, doc.kind, doc.file_id, unit_key),
+        )
+        rowid = cur.lastrowid
+        self.conn.execute(
+            f"INSERT INTO docs_fts (rowid, {', '.join(TEXT_FIELDS)}) "
+            f"VALUES (?, {', '.join('?' * len(TEXT_FIELDS))})",
+            (rowid, *(doc.text.get(field, "") for field in TEXT_FIELDS)),
+        )
+        self.conn.executemany(
+            "INSERT INTO facets (rowid, facet, value) VALUES (?, ?, ?)",
+            [(rowid, facet, v.lower()) for facet, values in doc.facets.items() for v in values],
+        )
+
+    def refresh(self, sources: list[Path], force: bool = False) -> dict[str, int]:
+        # Sources whose bytes are unchanged are skipped without parsing; changed sources
+        # are diffed per unit (document / chapter / theme) and only changed units rewritten.
+        prof = get_profiler()
+        stats = {"sources_parsed": 0, "units_updated": 0, "units_removed": 0, "docs_indexed": 0}
+        with self.conn:
+            if force:
+                self._clear()
+            known_sources = dict(self.conn.execute("SELECT path, sha256 FROM sources"))
+            hashes = {p.as_posix(): hashlib.sha256(p.read_bytes()).hexdigest() for p in sources}
+            changed = [p for p in sources if known_sources.get(p.as_posix()) != hashes[p.as_posix()]]
+            prof.cache(hits=len(sources) - len(changed), misses=len(changed))
+
+            vanished = set(known_sources) - set(hashes)
+            for source in vanished:
+                for (unit_key,) in self.conn.execute(
+                    "SELECT unit_key FROM units WHERE source = ?", (source,)
+                ).fetchall():
+                    self._delete_unit(unit_key)
+                    stats["units_removed"] += 1
+                self.conn.execute("DELETE FROM sources WHERE path = ?", (source,))
+
+            for loaded in load_yaml_files(changed):
+                source = loaded.path.as_posix()
+                stats["sources_parsed"] += 1
+                known_units = dict(
+                    self.conn.execute("SELECT unit_key, sha256 FROM units WHERE source = ?", (source,))
+                )
+                seen: set[str] = set()
+                for unit_key, payload, docs in units_for_source(loaded):
+                    seen.add(unit_key)
+                    unit_hash = _unit_hash(payload)
+                    if known_units.get(unit_key) == unit_hash:
+                        continue
+                    self._delete_unit(unit_key)
+                    for doc in docs:
+                        self._insert_doc(unit_key, doc)
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO units (unit_key, source, sha256) VALUES (?, ?, ?)",
+                        (unit_key, source, unit_hash),
+                    )
+                    stats["units_updated"] += 1
+                    stats["docs_indexed"] += len(docs)
+                for unit_key in set(known_units) - seen:
+                    self._delete_unit(unit_key)
+                    stats["units_removed"] += 1
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sources (path, sha256) VALUES (?, ?)",
+                    (source, hashes[source]),
+                )
+        prof.rows(stats["docs_indexed"])
+        return stats
+
+    def search(
+        self,
+        query: str,
+        kinds: list[str] | None = None,
+        fields: list[str] | None = None,
+        country: str | None = None,
+        programme: str | None = None,
+        rq: str | None = None,
+        limit: int = 20,
+    ) -> list[Hit]:
+        where = ["docs_fts MATCH ?"]
+        params: list[Any] = [_fts_query(query, fields)]
+        if kinds:
+            where.append(f"d.kind IN ({', '.join('?' * len(kinds))})")
+            params.extend(kinds)
+        for facet, value in (("country", country), ("programme", programme), ("rq", rq)):
+            if value:
+                where.append(
+                    "EXISTS (SELECT 1 FROM facets f WHERE f.rowid = d.rowid AND f.facet = ? AND f.value = ?)"
+                )
+                params.extend([facet, value.lower()])
+        weights = ", ".join(str(w) for w in _BM25_WEIGHTS)
+        sql = (
+            f"SELECT d.doc_id, d.kind, d.file_id, bm25(docs_fts, {weights}) AS score, "
+            "snippet(docs_fts, -1, '[', ']', ' ... ', 12) "
+            "FROM docs_fts JOIN docs d ON d.rowid = docs_fts.rowid "
+            f"WHERE {' AND '.join(where)} ORDER BY score LIMIT ?"
+        )
+        params.append(limit)
+        return [
+            Hit(doc_id, kind, file_id, round(-score, 4), snippet.replace("\n", " "))
+            for doc_id, kind, file_id, score, snippet in self.conn.execute(sql, params)
+        ]
+
+    def facet_values(self, facet: str) -> list[tuple[str, int]]:
+        return list(
+            self.conn.execute(
+                "SELECT value, COUNT(*) FROM facets WHERE facet = ? GROUP BY value ORDER BY 2 DESC, 1",
+                (facet,),
+            )
+        )
+
+
+def open_index(
+    index_path: Path = DEFAULT_INDEX,
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    bibliography: Path = DEFAULT_BIBLIOGRAPHY,
+    proto_themes: Path = DEFAULT_PROTO_THEMES,
+) -> SearchIndex:
+    index = SearchIndex(index_path)
+    index.refresh(discover_sources(cmo_dir, bibliography, proto_themes))
+    return index
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="BM25 full-text search over CMOs, the annotated bibliography and proto themes (SQLite FTS5)."
+    )
+    parser.add_argument(
+        "query",
+        nargs="?",
+        help='FTS5 query, e.g. \'"security of supply"\' or \'offset* NEAR(transfer, 5)\'.',
+    )
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX)
+    parser.add_argument("--cmo-dir", type=Path, default=DEFAULT_CMO_DIR)
+    parser.add_argument("--bibliography", type=Path, default=DEFAULT_BIBLIOGRAPHY)
+    parser.add_argument("--proto-themes", type=Path, default=DEFAULT_PROTO_THEMES)
+    parser.add_argument(
+        "--kind",
+        nargs="+",
+        choices=["cmo", "bibliography", "theme"],
+        default=None,
+        help="Restrict to these record kinds.",
+    )
+    parser.add_argument(
+        "--field",
+        nargs="+",
+        choices=list(TEXT_FIELDS),
+        default=None,
+        help="Restrict matching to these columns (evidence = supporting_evidence + paraphrase).",
+    )
+    parser.add_argument("--country", default=None)
+    parser.add_argument("--programme", default=None)
+    parser.add_argument("--rq", default=None, help="Research question, e.g. rq2.")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--list-facet", choices=list(FACETS), default=None, help="List facet values.")
+    parser.add_argument("--force", action="store_true", help="Rebuild the index from scratch.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profile_session(args, "search_index"):
+        prof = get_profiler()
+        start = time.perf_counter()
+        with prof.stage("refresh"):
+            index = SearchIndex(args.index)
+            stats = index.refresh(
+                discover_sources(args.cmo_dir, args.bibliography, args.proto_themes), force=args.force
+            )
+        refresh_ms = (time.perf_counter() - start) * 1000
+        try:
+            if args.list_facet:
+                for value, count in index.facet_values(args.list_facet):
+                    print(f"{count}\t{value}")
+                return 0
+            if not args.query:
+                print(
+                    f"Index {args.index.as_posix()}: {stats['units_updated']} unit(s) updated, "
+                    f"{stats['units_removed']} removed from {stats['sources_parsed']} changed source(s) "
+                    f"in {refresh_ms:.0f} ms."
+                )
+                return 0
+
+            start = time.perf_counter()
+            with prof.stage("query"):
+                try:
+                    hits = index.search(
+                        args.query,
+                        kinds=args.kind,
+                        fields=args.field,
+                        country=args.country,
+                        programme=args.programme,
+                        rq=args.rq,
+                        limit=args.limit,
+                    )
+                except sqlite3.OperationalError as exc:
+                    print(f"Invalid query: {exc}", file=sys.stderr)
+                    return 2
+                prof.rows(len(hits))
+            query_ms = (time.perf_counter() - start) * 1000
+        finally:
+            index.close()
+
+    for hit in hits:
+        print(f"{hit.score:.2f}\t{hit.kind}\t{hit.doc_id}\t{hit.snippet}")
+    print(f"{len(hits)} hit(s) in {query_ms:.1f} ms (refresh {refresh_ms:.0f} ms).", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Sequence
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DEFAULT_ROOT = Path("data/topic-models/cache")
+DEFAULT_MAX_MB = 2048.0
+CACHE_VERSION = 1
+KINDS = ("reduction", "assignments", "model")
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    key: str
+    kind: str
+    path: Path
+    bytes: int
+    last_used: float
+    params: dict
+
+
+def array_fingerprint(array: np.ndarray) -> str:
+    import numpy as np
+
+    array = np.ascontiguousarray(array)
+    h = hashlib.sha256()
+    h.update(f"{array.dtype.str}:{array.shape}".encode("utf-8"))
+    h.update(array.tobytes())
+    return h.hexdigest()
+
+
+def docs_fingerprint(docs: Sequence[str]) -> str:
+    h = hashlib.sha256()
+    for doc in docs:
+        h.update(doc.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def cache_key(kind: str, embeddings: np.ndarray, params: dict, docs: Sequence[str] | None = None) -> str:
+    payload = {
+        "version": CACHE_VERSION,
+        "kind": kind,
+        "embeddings": array_fingerprint(embeddings),
+        "docs": docs_fingerprint(docs) if docs is not None else None,
+        "params": params,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def bertopic_serializer(embedding_model: Any = None) -> tuple[Callable[[Any, Path], None], Callable[[Path], Any]]:
+    # safetensors keeps topics, c-TF-IDF and aspects but not the embedding or
+    # representation models (an OpenAI client cannot be pickled); the embedding
+    # model is reattached on load.
+    def save(model: Any, path: Path) -> None:
+        model.save(
+            str(path),
+            serialization="safetensors",
+            save_ctfidf=True,
+            save_embedding_model=False,
+        )
+
+    def load(path: Path) -> Any:
+        from bertopic import BERTopic
+
+        return BERTopic.load(str(path), embedding_model=embedding_model)
+
+    return save, load
+
+
+def _pickle_save(obj: Any, path: Path) -> None:
+    import pickle
+
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path / "model.pkl", "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _pickle_load(path: Path) -> Any:
+    import pickle
+
+    with open(path / "model.pkl", "rb") as f:
+        return pickle.load(f)
+
+
+class TopicModelCache:
+    def __init__(self, root: Path | str = DEFAULT_ROOT, max_mb: float | None = DEFAULT_MAX_MB) -> None:
+        self.root = Path(root)
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_dir(self, kind: str, key: str) -> Path:
+        return self.root / f"{kind}-{key[:24]}"
+
+    def _lookup(self, kind: str, key: str) -> Path | None:
+        path = self._entry_dir(kind, key)
+        meta = path / "meta.json"
+        if not meta.exists():
+            self.misses += 1
+            return None
+        # meta.json mtime is the LRU clock for eviction.
+        os.utime(meta)
+        self.hits += 1
+        return path
+
+    def _store(self, kind: str, key: str, params: dict, write: Callable[[Path], None], fit_seconds: float) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        final = self._entry_dir(kind, key)
+        tmp = Path(tempfile.mkdtemp(prefix=f".{kind}-", dir=self.root))
+        try:
+            write(tmp)
+            meta = {
+                "key": key,
+                "kind": kind,
+                "params": params,
+                "fit_seconds": round(fit_seconds, 3),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            (tmp / "meta.json").write_text(json.dumps(meta, indent=2, sort_keys=True, default=str), encoding="utf-8")
+            if final.exists():
+                shutil.rmtree(final)
+            os.replace(tmp, final)
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep={final})
+        return final
+
+    def reduction(self, embeddings: np.ndarray, params: dict, fit: Callable[[], np.ndarray]) -> np.ndarray:
+        import numpy as np
+
+        key = cache_key("reduction", embeddings, params)
+        path = self._lookup("reduction", key)
+        if path is not None:
+            return np.load(path / "reduction.npy")
+        start = time.perf_counter()
+        reduced = np.asarray(fit())
+        self._store(
+            "reduction",
+            key,
+            params,
+            lambda d: np.save(d / "reduction.npy", reduced),
+            time.perf_counter() - start,
+        )
+        return reduced
+
+    def assignments(
+        self,
+        embeddings: np.ndarray,
+        params: dict,
+        fit: Callable[[], Sequence[int]],
+        docs: Sequence[str] | None = None,
+    ) -> np.ndarray:
+        import numpy as np
+
+        key = cache_key("assignments", embeddings, params, docs)
+        path = self._lookup("assignments", key)
+        if path is not None:
+            return np.load(path / "topics.npy")
+        start = time.perf_counter()
+        topics = np.asarray(fit(), dtype=np.int64)
+        self._store(
+            "assignments",
+            key,
+            params,
+            lambda d: np.save(d / "topics.npy", topics),
+            time.perf_counter() - start,
+        )
+        return topics
+
+    def model(
+        self,
+        embeddings: np.ndarray,
+        params: dict,
+        fit: Callable[[], tuple[Any, Sequence[int]]],
+        docs: Sequence[str] | None = None,
+        save: Callable[[Any, Path], None] = _pickle_save,
+        load: Callable[[Path], Any] = _pickle_load,
+    ) -> tuple[Any, list[int]]:
+        import numpy as np
+
+        key = cache_key("model", embeddings, params, docs)
+        path = self._lookup("model", key)
+        if path is not None:
+            return load(path / "model"), np.load(path / "topics.npy").tolist()
+        start = time.perf_counter()
+        model, topics = fit()
+        topics = [int(t) for t in topics]
+
+        def write(d: Path) -> None:
+            np.save(d / "topics.npy", np.asarray(topics, dtype=np.int64))
+            save(model, d / "model")
+
+        self._store("model", key, params, write, time.perf_counter() - start)
+        return model, topics
+
+    def entries(self) -> list[CacheEntry]:
+        if not self.root.exists():
+            return []
+        entries = []
+        for path in self.root.iterdir():
+            meta_path = path / "meta.json"
+            if not path.is_dir() or not meta_path.exists():
+                continue
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            entries.append(
+                CacheEntry(
+                    key=meta.get("key", ""),
+                    kind=meta.get("kind", ""),
+                    path=path,
+                    bytes=_dir_bytes(path),
+                    last_used=meta_path.stat().st_mtime,
+                    params=meta.get("params", {}),
+                )
+            )
+        return sorted(entries, key=lambda e: e.last_used, reverse=True)
+
+    def evict(self, max_bytes: int | None = None, keep: set[Path] | None = None) -> list[CacheEntry]:
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        if limit is None:
+            return []
+        entries = self.entries()
+        total = sum(e.bytes for e in entries)
+        removed = []
+        # Least recently used first; the entry just written is never evicted.
+        for entry in reversed(entries):
+            if total <= limit:
+                break
+            if keep and entry.path in keep:
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+            total -= entry.bytes
+            removed.append(entry)
+        return removed
+
+    def clear(self) -> int:
+        entries = self.entries()
+        for entry in entries:
+            shutil.rmtree(entry.path, ignore_errors=True)
+        return len(entries)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Inspect or prune the UMAP/BERTopic cache used by the topic-model notebooks."
+    )
+    parser.add_argument("--root", type=Path, default=DEFAULT_ROOT)
+    parser.add_argument(
+        "--max-mb",
+        type=float,
+        default=None,
+        help="Evict least recently used entries until the cache fits in this many MB.",
+    )
+    parser.add_argument("--kind", choices=KINDS, default=None, help="Only list entries of this kind.")
+    parser.add_argument("--clear", action="store_true", help="Remove every cache entry.")
+    args = parser.parse_args()
+
+    cache = TopicModelCache(args.root, max_mb=None)
+    if args.clear:
+        print(f"Removed {cache.clear()} entries from {args.root.as_posix()}")
+        return 0
+    if args.max_mb is not None:
+        removed = cache.evict(max_bytes=int(args.max_mb * 1024 * 1024))
+        print(f"Evicted {len(removed)} entries, {sum(e.bytes for e in removed) / 1e6:.1f} MB")
+
+    entries = [e for e in cache.entries() if args.kind in (None, e.kind)]
+    print("kind\tkey\tmb\tlast_used\tparams")
+    for e in entries:
+        print(
+            f"{e.kind}\t{e.key[:12]}\t{e.bytes / 1e6:.2f}\t"
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(e.last_used))}\t"
+            + json.dumps(e.params, sort_keys=True, default=str)
+        )
+    print(f"{len(entries)} entries, {sum(e.bytes for e in entries) / 1e6:.1f} MB in {args.root.as_posix()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,12 +1,13 @@
+import argparse
 import csv
 import math
 import re
 from collections import Counter, defaultdict
 
-import numpy as np
 import yaml
 
-from embed_mechanisms import embed_texts
+from profiling import add_profile_arguments, get_profiler, profile_session
+from proto_themes import load_proto_themes
 
 _WORD_RE = re.compile(r"[a-zA-Z']+")
 
@@ -111,20 +112,16 @@ def triage_theme_pairs(
     likely_threshold=0.2,
     possible_threshold=0.1,
 ):
-    with open(proto_themes_yml, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f)
+    prof = get_profiler()
+    with prof.stage("load_yaml"):
+        theme_texts = load_proto_themes(proto_themes_yml).theme_texts
 
-    theme_texts = {}
-    for theme in data.get("proto_mechanism_themes", []):
-        theme_id = theme.get("theme_id")
-        label = theme.get("theme_label", "")
-        explanation = theme.get("mechanism_explanation", "")
-        theme_texts[theme_id] = f"{label} {explanation}"
-
-    vectors, key_terms = build_tfidf_vectors(theme_texts)
+    with prof.stage("vectorize"):
+        vectors, key_terms = build_tfidf_vectors(theme_texts)
+        prof.rows(len(theme_texts))
 
     triage_pairs = []
-    with open(theme_pairs_csv, newline="", encoding="utf-8") as f:
+    with prof.stage("score_pairs"), open(theme_pairs_csv, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
             a = row["theme_a_id"]
@@ -154,9 +151,11 @@ def triage_theme_pairs(
                     "note": note,
                 }
             )
+        prof.rows(len(triage_pairs))
 
-    with open(output_yml, "w", encoding="utf-8") as f:
+    with prof.stage("write"), open(output_yml, "w", encoding="utf-8") as f:
         yaml.safe_dump({"triage_pairs": triage_pairs}, f, sort_keys=False, allow_unicode=True, width=120)
+        prof.rows(len(triage_pairs))
 
     return triage_pairs
 
@@ -173,31 +172,31 @@ def triage_theme_pairs_embeddings(
     likely_threshold=0.6,
     possible_threshold=0.45,
 ):
-    with open(proto_themes_yml, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f)
-
-    theme_ids = []
-    texts = []
-    for theme in data.get("proto_mechanism_themes", []):
-        theme_id = theme.get("theme_id")
-        label = theme.get("theme_label", "")
-        explanation = theme.get("mechanism_explanation", "")
-        theme_ids.append(theme_id)
-        texts.append(f"{label} {explanation}")
-
-    embeddings = embed_texts(
-        texts=texts,
-        model_name=model_name,
-        batch_size=batch_size,
-        normalize=normalize,
-        device=device,
-        cache_path=cache_path,
-    )
+    # Imported here so the TF-IDF path never loads numpy or the embedding stack.
+    import numpy as np
+
+    from embed_mechanisms import embed_texts
+
+    prof = get_profiler()
+    with prof.stage("load_yaml"):
+        theme_texts = load_proto_themes(proto_themes_yml).theme_texts
+    theme_ids = list(theme_texts)
+    texts = list(theme_texts.values())
+
+    with prof.stage("embed"):
+        embeddings = embed_texts(
+            texts=texts,
+            model_name=model_name,
+            batch_size=batch_size,
+            normalize=normalize,
+            device=device,
+            cache_path=cache_path,
+        )
 
     theme_vecs = {tid: embeddings[i] for i, tid in enumerate(theme_ids)}
 
     triage_pairs = []
-    with open(theme_pairs_csv, newline="", encoding="utf-8") as f:
+    with prof.stage("score_pairs"), open(theme_pairs_csv, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
             a = row["theme_a_id"]
@@ -232,8 +231,67 @@ def triage_theme_pairs_embeddings(
                     "note": note,
                 }
             )
+        prof.rows(len(triage_pairs))
 
-    with open(output_yml, "w", encoding="utf-8") as f:
+    with prof.stage("write"), open(output_yml, "w", encoding="utf-8") as f:
         yaml.safe_dump({"triage_pairs": triage_pairs}, f, sort_keys=False, allow_unicode=True, width=120)
+        prof.rows(len(triage_pairs))
 
     return triage_pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Triage proto-theme pairs for overlap.")
+    parser.add_argument(
+        "--pairs",
+        default="data/mechanism_themes/theme_pairs.csv",
+        help="theme_pairs.csv from src/r/create_theme_pairs.R",
+    )
+    parser.add_argument(
+        "--proto-themes",
+        default="data/mechanism_themes/proto_themes.yml",
+        help="Path to proto_themes.yml",
+    )
+    parser.add_argument(
+        "--output",
+        default="data/mechanism_themes/theme_pair_triage.yml",
+        help="Output YAML path",
+    )
+    parser.add_argument(
+        "--method",
+        choices=["tfidf", "embedding"],
+        default="tfidf",
+        help="Similarity used for triage (default tfidf)",
+    )
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--cache", default="data/embeddings_cache.sqlite")
+    parser.add_argument("--device", default="cpu")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profile_session(args, "triage_theme_pairs"):
+        _run(args)
+
+
+def _run(args):
+    if args.method == "embedding":
+        pairs = triage_theme_pairs_embeddings(
+            args.pairs,
+            args.proto_themes,
+            args.output,
+            model_name=args.model,
+            device=args.device,
+            cache_path=args.cache,
+        )
+    else:
+        pairs = triage_theme_pairs(args.pairs, args.proto_themes, args.output)
+
+    counts = Counter(p["triage"] for p in pairs)
+    print(
+        f"Wrote {args.output}: {len(pairs)} pairs "
+        f"({counts['likely_overlap']} likely, {counts['possible_overlap']} possible)"
+    )
+
+
+if __name__ == "__main__":
+    main()
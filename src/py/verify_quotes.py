@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import bisect
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from pathlib import Path
+
+import yaml
+
+from pdf_text import DEFAULT_CACHE_DIR, DEFAULT_RAW_DIR, extract_pages, pdf_paths
+from profiling import add_profile_arguments, get_profiler, profile_session
+from yaml_loader import DEFAULT_CMO_DIR, is_cmo_document_map, iter_cmo_records, load_cmo_files
+
+DEFAULT_OUTPUT = Path("data/checks/quote_traceability.yml")
+STATUSES = ("verbatim", "altered", "missing", "no_pdf", "no_text")
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Hyphens are dropped on both sides: PDF line breaks make "procure-\nment" and
+# "civilian-\noriented" indistinguishable, so compounds are compared joined.
+_HYPHEN_RE = re.compile(r"(\w)[-\xad\u2010\u2011]\s*(\w)")
+_ELLIPSIS_RE = re.compile(r"\[?(?:\.\s*){3}\]?|…")
+_EDITORIAL_RE = re.compile(r"\[[^\]]*\]")
+# Shingles occurring more often than this carry no location signal ("of the offset").
+_MAX_POSTINGS = 64
+# Scanned PDFs yield little more than a watermark line per page.
+_MIN_WORDS_PER_PAGE = 20
+
+
+@dataclass(frozen=True)
+class QuoteCheck:
+    cmo_id: str
+    file_id: str
+    status: str
+    score: float
+    page: int | None
+    quote: str
+
+
+def words(text: str) -> list[str]:
+    text = unicodedata.normalize("NFKC", text)
+    text = _HYPHEN_RE.sub(r"\1\2", text).replace("\xad", "")
+    return _WORD_RE.findall(text.lower())
+
+
+def _matched_share(needle, haystack) -> float:
+    matcher = SequenceMatcher(None, needle, haystack, autojunk=False)
+    return sum(block.size for block in matcher.get_matching_blocks()) / len(needle)
+
+
+class DocumentIndex:
+    def __init__(self, pages: list[str], k: int = 3) -> None:
+        self.k = k
+        self.words: list[str] = []
+        self.page_starts: list[int] = []
+        for page in pages:
+            self.page_starts.append(len(self.words))
+            self.words.extend(words(page))
+        self.postings: dict[tuple[str, ...], list[int]] = defaultdict(list)
+        for i in range(len(self.words) - k + 1):
+            self.postings[tuple(self.words[i : i + k])].append(i)
+
+    def page_of(self, position: int) -> int:
+        return bisect.bisect_right(self.page_starts, position)
+
+    def locate(self, fragment: list[str]) -> tuple[float, int | None]:
+        # Each quote shingle votes for the document offset its occurrences imply;
+        # only the best-voted offsets are aligned word by word.
+        k = self.k
+        if len(fragment) < k:
+            return self._scan_short(fragment)
+        votes: Counter[int] = Counter()
+        for i in range(len(fragment) - k + 1):
+            positions = self.postings.get(tuple(fragment[i : i + k]), ())
+            if len(positions) > _MAX_POSTINGS:
+                continue
+            for pos in positions:
+                votes[pos - i] += 1
+        best_score, best_start = 0.0, None
+        slack = max(3, len(fragment) // 5)
+        for start, _ in votes.most_common(3):
+            lo = max(0, start - slack)
+            window = self.words[lo : start + len(fragment) + slack]
+            score = _matched_share(fragment, window)
+            if score < 1.0:
+                # Extraction splits words ("largel y"); compare again ignoring spaces.
+                score = max(score, _matched_share("".join(fragment), "".join(window)))
+            if score > best_score:
+                best_score, best_start = score, max(start, 0)
+        return best_score, best_start
+
+    def _scan_short(self, fragment: list[str]) -> tuple[float, int | None]:
+        n = len(fragment)
+        for i in range(len(self.words) - n + 1):
+            if self.words[i : i + n] == fragment:
+                return 1.0, i
+        return 0.0, None
+
+
+def quote_fragments(quote: str) -> list[list[str]]:
+    quote = _EDITORIAL_RE.sub(" ", quote)
+    return [w for w in (words(part) for part in _ELLIPSIS_RE.split(quote)) if w]
+
+
+def check_quote(index: DocumentIndex, quote: str) -> tuple[float, int | None]:
+    fragments = quote_fragments(quote)
+    total = sum(len(f) for f in fragments)
+    if not total:
+        return 0.0, None
+    score = 0.0
+    page = None
+    longest = 0
+    for fragment in fragments:
+        frag_score, start = index.locate(fragment)
+        score += frag_score * len(fragment)
+        if start is not None and len(fragment) > longest:
+            longest = len(fragment)
+            page = index.page_of(start)
+    return score / total, page
+
+
+def _verify_document(
+    job: tuple[str, str, list[tuple[str, str]], int, float, float],
+) -> tuple[int, int, list[tuple[str, str, float, int | None]]]:
+    pdf_path, cache_dir, quotes, k, verbatim_threshold, altered_threshold = job
+    pages = extract_pages(Path(pdf_path), Path(cache_dir))
+    index = DocumentIndex(pages, k=k)
+    has_text = len(index.words) >= _MIN_WORDS_PER_PAGE * max(1, len(pages))
+    results = []
+    for cmo_id, quote in quotes:
+        if not has_text:
+            results.append((cmo_id, "no_text", 0.0, None))
+            continue
+        score, page = check_quote(index, quote)
+        if score >= verbatim_threshold:
+            status = "verbatim"
+        elif score >= altered_threshold:
+            status = "altered"
+        else:
+            status = "missing"
+        results.append((cmo_id, status, round(score, 4), page))
+    return len(pages), len(index.words), results
+
+
+def _traceability_claims(loaded) -> dict[str, str]:
+    claims: dict[str, str] = {}
+    for item in loaded:
+        if not is_cmo_document_map(item.data):
+            continue
+        for file_id, doc in item.data.items():
+            for entry in (doc or {}).get("v_and_v_log") or []:
+                if isinstance(entry, dict) and entry.get("check") == "evidence_traceability":
+                    claims[file_id] = str(entry.get("status", ""))
+    return claims
+
+
+def verify_quotes(
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    raw_dir: Path = DEFAULT_RAW_DIR,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    k: int = 3,
+    verbatim_threshold: float = 0.98,
+    altered_threshold: float = 0.6,
+    jobs: int | None = None,
+) -> tuple[list[QuoteCheck], dict[str, dict]]:
+    prof = get_profiler()
+    with prof.stage("load_cmo"):
+        loaded = load_cmo_files(cmo_dir)
+        by_file: dict[str, list[tuple[str, str]]] = defaultdict(list)
+        for record in (r for item in loaded for r in iter_cmo_records(item)):
+            quote = str(record.fields.get("supporting_evidence") or "").strip()
+            if quote:
+                by_file[record.file_id].append((record.cmo_id, quote))
+        claims = _traceability_claims(loaded)
+        prof.rows(sum(len(q) for q in by_file.values()))
+
+    paths = pdf_paths(raw_dir)
+    checks: list[QuoteCheck] = []
+    documents: dict[str, dict] = {}
+    jobs_list = []
+    for file_id, quotes in by_file.items():
+        path = paths.get(file_id)
+        if path is None:
+            checks.extend(QuoteCheck(cmo_id, file_id, "no_pdf", 0.0, None, q) for cmo_id, q in quotes)
+            documents[file_id] = {"pdf": None}
+            continue
+        jobs_list.append(
+            (str(path), str(cache_dir), quotes, k, verbatim_threshold, altered_threshold)
+        )
+    # Largest PDFs first so one big book does not finish last on its own.
+    jobs_list.sort(key=lambda job: -Path(job[0]).stat().st_size)
+
+    with prof.stage("verify"):
+        workers = min(jobs or os.cpu_count() or 1, max(1, len(jobs_list)))
+        if workers <= 1:
+            outputs = [_verify_document(job) for job in jobs_list]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                outputs = list(pool.map(_verify_document, jobs_list))
+        for job, (n_pages, n_words, results) in zip(jobs_list, outputs):
+            file_id = Path(job[0]).name
+            quote_text = dict(job[2])
+            documents[file_id] = {"pdf": Path(job[0]).as_posix(), "pages": n_pages, "words": n_words}
+            checks.extend(
+                QuoteCheck(cmo_id, file_id, status, score, page, quote_text[cmo_id])
+                for cmo_id, status, score, page in results
+            )
+        prof.rows(len(checks))
+
+    for file_id, info in documents.items():
+        statuses = Counter(c.status for c in checks if c.file_id == file_id)
+        info["quotes"] = {s: statuses[s] for s in STATUSES if statuses[s]}
+        claim = claims.get(file_id)
+        if claim:
+            info["v_and_v_evidence_traceability"] = claim
+    checks.sort(key=lambda c: (c.file_id, c.cmo_id))
+    return checks, documents
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Locate every CMO supporting_evidence quote in its source PDF (page + match score) "
+            "and report missing or altered quotes."
+        )
+    )
+    parser.add_argument("--cmo-dir", type=Path, default=DEFAULT_CMO_DIR)
+    parser.add_argument("--raw-dir", type=Path, default=DEFAULT_RAW_DIR)
+    parser.add_argument(
+        "--text-cache",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="Per-PDF extracted text, keyed by content hash.",
+    )
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--shingle-size", type=int, default=3, help="Word n-gram size (default 3).")
+    parser.add_argument(
+        "--verbatim-threshold",
+        type=float,
+        default=0.98,
+        help="Share of quote words matched in order to count as verbatim (default 0.98).",
+    )
+    parser.add_argument(
+        "--altered-threshold",
+        type=float,
+        default=0.6,
+        help="Below this share a quote is reported missing (default 0.6).",
+    )
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument(
+        "--fail-on-missing",
+        action="store_true",
+        help="Exit 1 when any quote is missing or its PDF cannot be found.",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profile_session(args, "verify_quotes"):
+        checks, documents = verify_quotes(
+            cmo_dir=args.cmo_dir,
+            raw_dir=args.raw_dir,
+            cache_dir=args.text_cache,
+            k=args.shingle_size,
+            verbatim_threshold=args.verbatim_threshold,
+            altered_threshold=args.altered_threshold,
+            jobs=args.jobs,
+        )
+        summary = Counter(c.status for c in checks)
+        out_obj = {
+            "settings": {
+                "cmo_dir": args.cmo_dir.as_posix(),
+                "raw_dir": args.raw_dir.as_posix(),
+                "shingle_size": args.shingle_size,
+                "verbatim_threshold": args.verbatim_threshold,
+                "altered_threshold": args.altered_threshold,
+            },
+            "summary": {s: summary[s] for s in STATUSES},
+            "issues": [
+                {
+                    "cmo_id": c.cmo_id,
+                    "file_id": c.file_id,
+                    "status": c.status,
+                    "score": c.score,
+                    "page": c.page,
+                    "quote": c.quote,
+                }
+                for c in checks
+                if c.status != "verbatim"
+            ],
+            "documents": documents,
+            "pages": {c.cmo_id: c.page for c in checks if c.page is not None},
+        }
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(
+            yaml.safe_dump(out_obj, sort_keys=False, allow_unicode=True, width=120),
+            encoding="utf-8",
+        )
+
+    print(
+        f"{len(checks)} quote(s): "
+        + ", ".join(f"{summary[s]} {s}" for s in STATUSES if summary[s])
+    )
+    print(f"Wrote {args.output.as_posix()}")
+    failed = summary["missing"] + summary["no_pdf"]
+    return 1 if args.fail_on_missing and failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import yaml
+
+from cmo_store import cmo_yaml_paths
+
+try:
+    _SafeLoader = yaml.CSafeLoader
+except AttributeError:  # PyYAML built without libyaml
+    _SafeLoader = yaml.SafeLoader
+
+DEFAULT_CMO_DIR = Path("data/cmo")
+DEFAULT_THEMES_DIR = Path("data/mechanism_themes")
+
+
+@dataclass(frozen=True)
+class LoadedYaml:
+    path: Path
+    data: Any
+    seconds: float
+    size_bytes: int
+
+
+@dataclass(frozen=True)
+class CmoRecord:
+    cmo_id: str
+    file_id: str
+    source_path: Path
+    fields: dict
+
+
+@dataclass(frozen=True)
+class DemiRegularityTheme:
+    theme_id: str
+    theme_label: str
+    mechanism_explanation: str
+    cmo_ids_in_theme: tuple[str, ...]
+    missing_cmo_ids: tuple[str, ...]
+    demi_regularities: tuple[dict, ...]
+    source_path: Path
+
+
+@dataclass
+class EvidenceBase:
+    cmos: list[CmoRecord] = field(default_factory=list)
+    demi_regularity_themes: list[DemiRegularityTheme] = field(default_factory=list)
+    files: list[LoadedYaml] = field(default_factory=list)
+    wall_seconds: float = 0.0
+
+
+def load_yaml(path: Path) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=_SafeLoader)
+
+
+def _load_timed(path: str) -> tuple[str, Any, float, int]:
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        raw = f.read()
+    data = yaml.load(raw.decode("utf-8"), Loader=_SafeLoader)
+    return path, data, time.perf_counter() - start, len(raw)
+
+
+def load_yaml_files(paths: Iterable[Path], max_workers: int | None = None) -> list[LoadedYaml]:
+    # Largest files are submitted first so the pool's wall time is bounded by the
+    # biggest file rather than by whichever large file happens to be queued last.
+    paths = sorted({Path(p) for p in paths}, key=lambda p: -p.stat().st_size)
+    if not paths:
+        return []
+    workers = min(max_workers or os.cpu_count() or 1, len(paths))
+
+    if workers <= 1:
+        results = [_load_timed(str(p)) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_load_timed, [str(p) for p in paths]))
+
+    loaded = [
+        LoadedYaml(path=Path(path), data=data, seconds=seconds, size_bytes=size)
+        for path, data, seconds, size in results
+    ]
+    loaded.sort(key=lambda item: item.path.as_posix())
+    return loaded
+
+
+def load_yaml_dir(
+    directory: Path, pattern: str = "*.yml", max_workers: int | None = None
+) -> list[LoadedYaml]:
+    paths = [p for p in Path(directory).glob(pattern) if p.is_file()]
+    return load_yaml_files(paths, max_workers=max_workers)
+
+
+def is_cmo_document_map(data: Any) -> bool:
+    if not isinstance(data, dict) or not data:
+        return False
+    return all(isinstance(key, str) and key.lower().endswith(".pdf") for key in data)
+
+
+def iter_cmo_records(loaded: LoadedYaml) -> Iterator[CmoRecord]:
+    if not is_cmo_document_map(loaded.data):
+        return
+    for file_id, doc in loaded.data.items():
+        for cmo_id, cmo in ((doc or {}).get("cmos") or {}).items():
+            yield CmoRecord(
+                cmo_id=cmo_id,
+                file_id=file_id,
+                source_path=loaded.path,
+                fields=cmo or {},
+            )
+
+
+def iter_demi_regularity_themes(loaded: LoadedYaml) -> Iterator[DemiRegularityTheme]:
+    if not isinstance(loaded.data, dict):
+        return
+    for theme in loaded.data.get("demi_regularities_by_theme") or []:
+        yield DemiRegularityTheme(
+            theme_id=str(theme.get("theme_id", "")).strip(),
+            theme_label=str(theme.get("theme_label", "")).strip(),
+            mechanism_explanation=str(theme.get("mechanism_explanation", "")).strip(),
+            cmo_ids_in_theme=tuple(theme.get("cmo_ids_in_theme") or []),
+            missing_cmo_ids=tuple(theme.get("missing_cmo_ids") or []),
+            demi_regularities=tuple(theme.get("demi_regularities") or []),
+            source_path=loaded.path,
+        )
+
+
+def load_cmo_files(
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    file_ids: Iterable[str] | None = None,
+    max_workers: int | None = None,
+) -> list[LoadedYaml]:
+    # Reads only the shards for file_ids when data/cmo/shards/ exists (see cmo_store.py).
+    return load_yaml_files(cmo_yaml_paths(cmo_dir, file_ids), max_workers=max_workers)
+
+
+def load_evidence_base(
+    cmo_dir: Path = DEFAULT_CMO_DIR,
+    themes_dir: Path = DEFAULT_THEMES_DIR,
+    max_workers: int | None = None,
+    file_ids: Iterable[str] | None = None,
+) -> EvidenceBase:
+    start = time.perf_counter()
+    cmo_paths = cmo_yaml_paths(cmo_dir, file_ids)
+    demi_paths = [p for p in Path(themes_dir).glob("demi_regularities_PM*.yml") if p.is_file()]
+    files = load_yaml_files(cmo_paths + demi_paths, max_workers=max_workers)
+
+    base = EvidenceBase(files=files)
+    for loaded in files:
+        base.cmos.extend(iter_cmo_records(loaded))
+        base.demi_regularity_themes.extend(iter_demi_regularity_themes(loaded))
+    base.wall_seconds = time.perf_counter() - start
+    return base
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Load the CMO and demi-regularity YAML files in parallel and report timings."
+    )
+    parser.add_argument("--cmo-dir", type=Path, default=DEFAULT_CMO_DIR)
+    parser.add_argument("--themes-dir", type=Path, default=DEFAULT_THEMES_DIR)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Process pool size (default: number of CPUs; 1 loads serially).",
+    )
+    args = parser.parse_args()
+
+    base = load_evidence_base(args.cmo_dir, args.themes_dir, max_workers=args.workers)
+    if not base.files:
+        print("No YAML files found.", file=sys.stderr)
+        return 2
+
+    print("seconds\tbytes\tpath")
+    for loaded in sorted(base.files, key=lambda item: -item.seconds):
+        print(f"{loaded.seconds:.3f}\t{loaded.size_bytes}\t{loaded.path.as_posix()}")
+    largest = max(item.seconds for item in base.files)
+    total = sum(item.seconds for item in base.files)
+    print(
+        f"Loaded {len(base.files)} file(s): {len(base.cmos)} CMOs, "
+        f"{len(base.demi_regularity_themes)} demi-regularity theme(s). "
+        f"wall={base.wall_seconds:.3f}s sum={total:.3f}s largest={largest:.3f}s "
+        f"libyaml={_SafeLoader is not yaml.SafeLoader}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())